@@ -0,0 +1,209 @@
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import contextlib
+from datetime import datetime
+from main import CSVProcessor, extract_target_csv, find_csv_files_in_folder
+from filing_index import FilingIndex
+from sample_filings import generate_filings, DEFAULT_SIZES
+
+BASELINE_PATH = 'bench_baselines.json'
+STAGES = ('extract_target_csv', 'load_csv', 'process_data', 'save_to_json')
+# 基準値からこの割合以上遅くなった段階を性能の低下として報告する
+DEFAULT_TOLERANCE = 0.2
+# main.pyの処理が作るファイルとディレクトリ. 繰り返しの前に削除する.
+OUTPUTS = ('ZIPs', 'CSVs', 'json_file', 'filing_records', 'filing_index.sqlite3', 'filing_index.sqlite3-wal',
+           'filing_index.sqlite3-shm', 'file_path_by_secCode.json')
+
+
+def _reset(source_dir: str) -> None:
+    for path in OUTPUTS:
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
+    shutil.copytree(source_dir, 'ZIPs')
+
+
+def _run_once(source_dir: str) -> dict:
+    # 1回分の処理を段階ごとに計測する. main.pyの処理が表示するメッセージは計測に含めないように捨てる.
+    _reset(source_dir)
+    seconds = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        extract_target_csv('ZIPs', 'CSVs')
+        seconds['extract_target_csv'] = time.perf_counter() - start
+
+        processors = [CSVProcessor(path) for path in sorted(find_csv_files_in_folder('CSVs'))]
+        start = time.perf_counter()
+        for processor in processors:
+            processor.load_csv()
+        seconds['load_csv'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for processor in processors:
+            processor.process_data()
+        seconds['process_data'] = time.perf_counter() - start
+
+        index = FilingIndex()
+        start = time.perf_counter()
+        for processor in processors:
+            processor.save_to_json(index)
+        seconds['save_to_json'] = time.perf_counter() - start
+    missing = [processor.file_path for processor in processors if processor.data['EndDate'].value == -1]
+    if missing:
+        raise RuntimeError(f'当会計期間終了日を取り出せなかったCSVファイルがあります: {missing}')
+    return seconds
+
+
+def run_benchmark(count: int = 10, sizes: tuple = DEFAULT_SIZES, ifrs_share: float = 0.5, repeat: int = 3,
+                  seed: int = 0) -> dict:
+    """
+    合成の有価証券報告書でZIPファイルの展開からJSONファイルの保存までを段階ごとに計測する関数
+
+    一時ディレクトリでsample_filings.generate_filingsのZIPファイルを生成し、extract_target_csv、load_csv、
+    process_data、save_to_jsonをrepeat回繰り返す。繰り返しごとに出力を削除してZIPファイルを置き直す。
+
+    Parameters
+    ----------
+    count : int
+        書類の数。
+    sizes : tuple of int
+        CSVファイルの行数の候補。書類ごとに順番に割り当てる。
+    ifrs_share : float
+        IFRSの書類の割合。
+    repeat : int
+        繰り返しの回数。段階ごとの時間は中央値を使う。
+    seed : int
+        乱数のシード。
+
+    Returns
+    -------
+    dict
+        workload(書類の数、行数の合計など), machine, stages(段階ごとのseconds, rows_per_second, files_per_second)。
+    """
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as work_dir:
+        source_dir = os.path.join(work_dir, 'source')
+        filings = generate_filings(source_dir, count, tuple(sizes), ifrs_share, seed=seed)
+        rows = sum(filing['rows'] for filing in filings)
+        os.chdir(work_dir)
+        try:
+            runs = [_run_once(source_dir) for _ in range(repeat)]
+        finally:
+            os.chdir(cwd)
+    stages = {}
+    for stage in STAGES:
+        seconds = statistics.median(run[stage] for run in runs)
+        stages[stage] = {
+            'seconds': seconds,
+            'rows_per_second': rows / seconds,
+            'files_per_second': len(filings) / seconds,
+        }
+    return {
+        'workload': {'files': len(filings), 'rows': rows, 'sizes': list(sizes), 'ifrs_share': ifrs_share,
+                     'seed': seed, 'megabytes': sum(filing['bytes'] for filing in filings) / 1e6},
+        'machine': {'platform': platform.platform(), 'python': platform.python_version(),
+                    'processor': platform.processor(), 'cpu_count': os.cpu_count()},
+        'repeat': repeat,
+        'stages': stages,
+    }
+
+
+def compare(result: dict, baseline: dict, tolerance: float = DEFAULT_TOLERANCE) -> list[dict]:
+    """
+    段階ごとの行数/秒を基準値と比べる関数
+
+    Returns
+    -------
+    list of dict
+        段階ごとのstage, baseline, current(行数/秒), ratio(current / baseline), regressed(tolerance以上遅いか)。
+        基準値のない段階は含まない。
+    """
+    comparisons = []
+    for stage, current in result['stages'].items():
+        if stage not in baseline.get('stages', {}):
+            continue
+        base = baseline['stages'][stage]['rows_per_second']
+        ratio = current['rows_per_second'] / base
+        comparisons.append({'stage': stage, 'baseline': base, 'current': current['rows_per_second'],
+                            'ratio': ratio, 'regressed': ratio < 1 - tolerance})
+    return comparisons
+
+
+def load_baseline(path: str) -> dict | None:
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_baseline(path: str, result: dict) -> None:
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({**result, 'recorded_at': datetime.now().isoformat(timespec='seconds')}, f,
+                  ensure_ascii=False, indent=4)
+    os.replace(tmp_path, path)
+
+
+def print_result(result: dict, comparisons: list[dict]) -> None:
+    workload = result['workload']
+    print(f"{workload['files']}件のCSVファイル、{workload['rows']}行({workload['megabytes']:.1f}MBのZIPファイル)、"
+          f"{result['repeat']}回の中央値")
+    by_stage = {comparison['stage']: comparison for comparison in comparisons}
+    print(f"{'段階':<20}{'秒':>10}{'行/秒':>14}{'ファイル/秒':>12}{'基準値比':>10}")
+    for stage, values in result['stages'].items():
+        comparison = by_stage.get(stage)
+        ratio = f"{comparison['ratio']:.2f}x" if comparison else '-'
+        mark = ' **低下**' if comparison and comparison['regressed'] else ''
+        print(f"{stage:<20}{values['seconds']:>10.3f}{values['rows_per_second']:>14,.0f}"
+              f"{values['files_per_second']:>12.2f}{ratio:>10}{mark}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='合成の有価証券報告書でCSVファイルの抽出からJSONファイルの保存までを計測する')
+    parser.add_argument('--count', type=int, default=10, help='書類の数')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES), help='CSVファイルの行数の候補')
+    parser.add_argument('--ifrs-share', type=float, default=0.5, help='IFRSの書類の割合')
+    parser.add_argument('--repeat', type=int, default=3, help='繰り返しの回数')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='基準値のJSONファイル')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='基準値からこの割合以上遅くなった場合に性能の低下とする')
+    parser.add_argument('--update-baseline', action='store_true', help='今回の結果を基準値として保存する')
+    parser.add_argument('--output', help='結果をJSONで保存するパス')
+    args = parser.parse_args()
+    baseline_path = os.path.abspath(args.baseline)
+
+    result = run_benchmark(args.count, tuple(args.sizes), args.ifrs_share, args.repeat, args.seed)
+    baseline = load_baseline(baseline_path)
+    comparisons = []
+    if baseline is not None:
+        # 書類の構成が異なる場合、行数/秒は比べられない
+        fields = ('files', 'rows', 'sizes', 'ifrs_share', 'seed')
+        if any(baseline['workload'].get(field) != result['workload'][field] for field in fields):
+            print(f'基準値と書類の構成が異なるため比較しません: {baseline_path}')
+        else:
+            if baseline.get('machine') != result['machine']:
+                print(f"基準値は別の環境({baseline.get('machine', {}).get('platform')})で計測されています。")
+            comparisons = compare(result, baseline, args.tolerance)
+    print_result(result, comparisons)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=4)
+    if args.update_baseline:
+        save_baseline(baseline_path, result)
+        print(f'基準値を保存しました: {baseline_path}')
+        return 0
+    return 1 if any(comparison['regressed'] for comparison in comparisons) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
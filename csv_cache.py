@@ -0,0 +1,235 @@
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import threading
+import numpy as np
+import pandas as pd
+
+CSV_CACHE_DIR = os.path.join('cache', 'csv')
+# 辞書の値の区切り. XMLの文字列にNULは含まれないため、値の中に現れることはない.
+SEPARATOR = '\x00'
+HASH_CHUNK_SIZE = 1024 * 1024
+# 保存形式を変えたら増やす. 形式の異なるキャッシュは無いものとして作り直す.
+CACHE_FORMAT = 1
+
+
+def file_digest(file_path: str) -> str:
+    """
+    ファイルの内容のSHA-256ハッシュを返す関数
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_raw_csv(file_path: str) -> pd.DataFrame:
+    """
+    XBRL_TO_CSVのCSVファイル(UTF-16LEのタブ区切り)を読み込む関数. CSVProcessor.load_csvと同じ読み込み方.
+    """
+    return pd.read_csv(file_path, encoding='utf-16le', delimiter='\t')
+
+
+class CSVCache:
+    """
+    XBRL_TO_CSVのCSVファイルを1度だけ解析し、列ごとのバイナリ形式で保存するキャッシュ。
+
+    キャッシュはCSVファイルの内容のSHA-256ハッシュごとのディレクトリで、ファイル名が変わっても
+    (rename_csv_fileなど)同じ内容であれば再利用される。
+
+    - 数値の列はそのまま.npyファイルに保存する。
+    - 文字列の列は重複を除いた値の辞書(UTF-8, NUL区切り)と、各行の辞書の番号で保存する。欠損値の番号は-1。
+      全ての文字列の列の番号は1つの配列(codes.npy)に、辞書は1つのファイル(dictionaries.txt)にまとめる。
+
+    読み込み時は.npyファイルをメモリマップで開き、辞書を引いてpd.read_csvと同じデータフレームを組み立てる。
+
+    Attributes
+    ----------
+    cache_dir : str
+        キャッシュの保存先のディレクトリのパス。
+    """
+
+    def __init__(self, cache_dir: str = CSV_CACHE_DIR):
+        self.cache_dir = cache_dir
+
+    def path_for(self, digest: str) -> str:
+        """
+        ハッシュに対応するキャッシュのディレクトリのパスを返す関数
+        """
+        return os.path.join(self.cache_dir, digest[:2], digest)
+
+    def write(self, digest: str, df: pd.DataFrame) -> str:
+        """
+        データフレームを列ごとに保存する関数
+
+        Parameters
+        ----------
+        digest : str
+            元のCSVファイルの内容のSHA-256ハッシュ。
+        df : pd.DataFrame
+            read_raw_csvで読み込んだデータフレーム。
+
+        Returns
+        -------
+        str
+            キャッシュのディレクトリのパス。
+        """
+        path = self.path_for(digest)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        os.makedirs(tmp_path, exist_ok=True)
+        try:
+            columns = []
+            codes = []
+            dictionaries = []
+            for i, name in enumerate(df.columns):
+                column = df[name]
+                if column.dtype.kind in 'biuf':
+                    np.save(os.path.join(tmp_path, f'{i}.npy'), column.to_numpy())
+                    columns.append({'name': name, 'kind': 'numeric'})
+                    continue
+                column_codes, uniques = pd.factorize(column)
+                codes.append(column_codes.astype(np.int32))
+                dictionaries.extend(str(value) for value in uniques)
+                columns.append({'name': name, 'kind': 'dictionary', 'size': len(uniques)})
+            # ファイルを開く回数を減らすため、文字列の列の番号は1つの配列(列, 行)に、辞書は1つのファイルにまとめる
+            np.save(os.path.join(tmp_path, 'codes.npy'), np.array(codes, dtype=np.int32).reshape(len(codes), len(df)))
+            with open(os.path.join(tmp_path, 'dictionaries.txt'), 'w', encoding='utf-8', newline='') as f:
+                f.write(SEPARATOR.join(dictionaries))
+            with open(os.path.join(tmp_path, 'meta.json'), 'w', encoding='utf-8') as f:
+                json.dump({'format': CACHE_FORMAT, 'rows': len(df), 'columns': columns}, f, ensure_ascii=False)
+            try:
+                os.rename(tmp_path, path)
+            except OSError:
+                if not os.path.isdir(path):
+                    raise
+                if self._meta(path) is not None:
+                    # 同じ内容のキャッシュを別のプロセスが先に作った場合はそれを使う
+                    shutil.rmtree(tmp_path, ignore_errors=True)
+                else:
+                    # 形式の古いキャッシュは退避してから置き換える
+                    old_path = f'{tmp_path}.old'
+                    os.replace(path, old_path)
+                    os.replace(tmp_path, path)
+                    shutil.rmtree(old_path, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+        return path
+
+    @staticmethod
+    def _meta(path: str) -> dict | None:
+        # キャッシュがない場合と形式が異なる場合はNone
+        try:
+            with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return None
+        return meta if meta.get('format') == CACHE_FORMAT else None
+
+    def read(self, digest: str, columns: list[str] | None = None) -> pd.DataFrame | None:
+        """
+        キャッシュからデータフレームを組み立てる関数. キャッシュがない場合はNone.
+
+        Parameters
+        ----------
+        digest : str
+            元のCSVファイルの内容のSHA-256ハッシュ。
+        columns : list of str, optional
+            組み立てる列名。省略した場合は全ての列。必要な列だけを指定すると、他の列の辞書は引かない。
+
+        Returns
+        -------
+        pd.DataFrame or None
+            pd.read_csvで読み込んだ場合と同じデータフレーム。
+        """
+        path = self.path_for(digest)
+        meta = self._meta(path)
+        if meta is None:
+            return None
+        codes = np.load(os.path.join(path, 'codes.npy'), mmap_mode='r' if meta['rows'] else None)
+        with open(os.path.join(path, 'dictionaries.txt'), 'r', encoding='utf-8', newline='') as f:
+            text = f.read()
+        values = text.split(SEPARATOR) if text or any(column.get('size') for column in meta['columns']) else []
+        names = [column['name'] for column in meta['columns']] if columns is None else list(columns)
+        frame = {}
+        start = 0
+        j = 0
+        for i, column in enumerate(meta['columns']):
+            if column['name'] not in names:
+                if column['kind'] == 'dictionary':
+                    start += column['size']
+                    j += 1
+                continue
+            if column['kind'] == 'numeric':
+                frame[column['name']] = np.load(os.path.join(path, f'{i}.npy'), mmap_mode='r' if meta['rows'] else None)
+                continue
+            # 最後に欠損値(番号-1)を置き、辞書を引くだけで列を組み立てる
+            dictionary = np.array([*values[start:start + column['size']], np.nan], dtype=object)
+            frame[column['name']] = dictionary[codes[j]]
+            start += column['size']
+            j += 1
+        return pd.DataFrame(frame, columns=names)
+
+    def read_csv(self, file_path: str, columns: list[str] | None = None) -> pd.DataFrame:
+        """
+        CSVファイルを読み込む関数. キャッシュがあればキャッシュから、なければCSVファイルを解析してキャッシュに保存する.
+
+        キャッシュには常に全ての列を保存するため、後から別の列が必要になってもCSVファイルを解析し直す必要はない。
+        """
+        digest = file_digest(file_path)
+        df = self.read(digest, columns)
+        if df is None:
+            df = read_raw_csv(file_path)
+            self.write(digest, df)
+            if columns is not None:
+                df = df[list(columns)]
+        return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description='CSVファイルを列ごとのバイナリ形式に変換してキャッシュする')
+    parser.add_argument('paths', nargs='*', default=['CSVs'], help='CSVファイルまたはCSVファイルを含むディレクトリ')
+    parser.add_argument('--cache-dir', default=CSV_CACHE_DIR, help='キャッシュの保存先')
+    parser.add_argument('--compare', action='store_true',
+                        help='キャッシュからの読み込みとpd.read_csvの時間を比べ、内容が同じか確かめる')
+    args = parser.parse_args()
+
+    file_paths = []
+    for path in args.paths:
+        if os.path.isdir(path):
+            file_paths.extend(entry.path for entry in os.scandir(path) if entry.name.endswith('.csv'))
+        else:
+            file_paths.append(path)
+    cache = CSVCache(args.cache_dir)
+    start = time.perf_counter()
+    for file_path in file_paths:
+        cache.read_csv(file_path)
+    print(f'{len(file_paths)}件のCSVファイルをキャッシュしました({time.perf_counter() - start:.2f}秒)。')
+    if not args.compare:
+        return 0
+
+    start = time.perf_counter()
+    originals = [read_raw_csv(file_path) for file_path in file_paths]
+    parse_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    cached = [cache.read_csv(file_path) for file_path in file_paths]
+    cache_seconds = time.perf_counter() - start
+    mismatches = 0
+    for file_path, original, df in zip(file_paths, originals, cached):
+        try:
+            pd.testing.assert_frame_equal(original, df)
+        except AssertionError as e:
+            mismatches += 1
+            print(f'内容が一致しません: {file_path} - {e}')
+    print(f'pd.read_csv: {parse_seconds:.2f}秒, キャッシュ: {cache_seconds:.2f}秒 '
+          f'({parse_seconds / max(cache_seconds, 1e-9):.1f}倍), 不一致: {mismatches}件')
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
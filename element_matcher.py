@@ -0,0 +1,226 @@
+import re
+import fnmatch
+import functools
+import numpy as np
+import pandas as pd
+
+# 優先度を省略した場合の既定値. 会社ごとの要素IDを拾うパターンより、標準の要素IDの完全一致を優先する.
+EXACT_PRIORITY = 100
+PATTERN_PRIORITY = 0
+_GLOB_CHARS = ('*', '?', '[')
+
+
+def glob_to_regex(pattern: str, anchored: bool = True) -> str:
+    """
+    glob形式のパターンを正規表現に変換する関数
+
+    fnmatch.translateはPythonのバージョンによって名前付きグループを含む正規表現を返し、
+    複数のパターンを1つの選択にまとめると名前が衝突するため、グループを使わずに変換する。
+    anchored=Falseの場合は末尾の\\Zを付けず、*や?は改行に当てはまらない(1行ずつの照合に使う)。
+    """
+    parts = []
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '*':
+            parts.append('.*')
+        elif char == '?':
+            parts.append('.')
+        elif char == '[' and ']' in pattern[i + 2:]:
+            end = pattern.index(']', i + 2)
+            body = pattern[i + 1:end]
+            body = '^' + body[1:] if body.startswith('!') else body
+            parts.append(f'[{body.replace(chr(92), chr(92) * 2)}]')
+            i = end
+        else:
+            parts.append(re.escape(char))
+        i += 1
+    if not anchored:
+        return "".join(parts)
+    return f'(?s:{"".join(parts)})\\Z'
+
+
+def is_pattern(text: str) -> bool:
+    """
+    文字列がglob形式のパターン(*, ?, [...]を含む)かどうかを返す関数
+    """
+    return any(char in text for char in _GLOB_CHARS)
+
+
+class ElementMatcher:
+    """
+    要素IDとコンテキストIDの組をデータ項目に対応付ける規則を、1つの照合器にまとめたクラス。
+
+    規則は(データ項目名, 要素ID, コンテキストID, 優先度)で表す。要素IDとコンテキストIDには
+    glob形式のパターン(例: jpcrp030000-asr_E*-000:*SalesIFRS*SummaryOfBusinessResults)も使える。
+
+    - 完全一致の規則はコンテキストIDごとの辞書にまとめる。
+    - パターンの規則は同じコンテキストIDのパターンごとに、優先度の高い順に並べた1つの正規表現
+      (名前付きグループの選択)にまとめる。照合はファイル内で重複を除いた要素IDを改行でつないだ
+      1つの文字列に対して1度だけ行うため、要素IDごとにPythonで正規表現を呼び出すことはない。
+    - 完全一致の規則も、重複を除いた要素IDに対して辞書を引き、結果を番号で行に広げる。
+
+    1つの行が複数の規則に当てはまる場合は優先度の高い規則を使う。
+    同じデータ項目に複数の行が当てはまる場合は優先度の高い行を選び、同じ優先度ではファイルの後ろの行を選ぶ。
+
+    Attributes
+    ----------
+    rules : list of tuple
+        (データ項目名, 要素ID, コンテキストID, 優先度)のリスト。
+    """
+
+    def __init__(self, rules):
+        self.rules = [tuple(rule) for rule in rules]
+        # コンテキストID -> {要素ID: 規則の番号}
+        self._exact = {}
+        # コンテキストIDのパターン -> 規則の番号のリスト
+        pattern_groups = {}
+        for index, (_, element, context, _) in enumerate(self.rules):
+            if is_pattern(element) or is_pattern(context):
+                pattern_groups.setdefault(context, []).append(index)
+            else:
+                # 同じ組が重複した場合は先に定義した規則を使う
+                self._exact.setdefault(context, {}).setdefault(element, index)
+        # 完全一致の辞書は、重複を除いた要素IDをまとめて引けるようにpd.Indexにする
+        self._exact = {context: (pd.Index(list(lookup)), np.array(list(lookup.values()), dtype=np.int64))
+                       for context, lookup in self._exact.items()}
+        self._groups = []
+        for context, indices in pattern_groups.items():
+            # 選択は左から順に試されるため、優先度の高い規則を先に置く(同じ優先度では定義順)
+            indices = sorted(indices, key=lambda index: -self.rules[index][3])
+            regex = re.compile('^(?:' + '|'.join(f'(?P<r{index}>{glob_to_regex(self.rules[index][1], False)})'
+                                                 for index in indices) + ')$', re.MULTILINE)
+            self._groups.append((context, regex))
+        self._priorities = np.array([rule[3] for rule in self.rules] + [np.iinfo(np.int64).min], dtype=np.int64)
+
+    @staticmethod
+    def _lookup(codes: np.ndarray, uniques: np.ndarray, find) -> np.ndarray:
+        # 行の番号のうち重複を除いたものだけを調べ、結果を行に広げる
+        present = np.flatnonzero(np.bincount(codes, minlength=len(uniques)))
+        per_unique = np.full(len(uniques), -1, dtype=np.int64)
+        per_unique[present] = find(uniques[present])
+        return per_unique[codes]
+
+    @staticmethod
+    def _find_exact(index: pd.Index, rules: np.ndarray, elements: np.ndarray) -> np.ndarray:
+        positions = index.get_indexer(elements)
+        return np.where(positions >= 0, rules[positions], -1)
+
+    @staticmethod
+    def _find_pattern(regex: re.Pattern, elements: np.ndarray) -> np.ndarray:
+        found = np.full(len(elements), -1, dtype=np.int64)
+        # 要素IDを改行でつなぎ、各行の先頭の位置から当てはまった要素IDを求める
+        starts = np.zeros(len(elements), dtype=np.int64)
+        np.cumsum(np.fromiter(map(len, elements[:-1]), dtype=np.int64, count=len(elements) - 1) + 1, out=starts[1:])
+        for match in regex.finditer('\n'.join(elements)):
+            found[np.searchsorted(starts, match.start())] = int(match.lastgroup[1:])
+        return found
+
+    def match_rows(self, elements: pd.Series, contexts: pd.Series) -> np.ndarray:
+        """
+        各行に当てはまる規則の番号を返す関数
+
+        要素IDとコンテキストIDの列をそれぞれ1度だけ番号に置き換え(pd.factorize)、
+        規則の照合は重複を除いた値に対してのみ行う。
+
+        Parameters
+        ----------
+        elements : pd.Series
+            要素IDの列。
+        contexts : pd.Series
+            コンテキストIDの列。
+
+        Returns
+        -------
+        np.ndarray
+            各行に当てはまる最も優先度の高い規則の番号。当てはまらない行は-1。
+        """
+        element_codes, unique_elements = pd.factorize(elements)
+        context_codes, unique_contexts = pd.factorize(contexts)
+        unique_elements = np.asarray(unique_elements, dtype=object)
+        unique_contexts = [str(context) for context in unique_contexts]
+        # 要素IDが欠けている行はどの規則にも当てはまらない
+        has_element = element_codes >= 0
+        matched = np.full(len(element_codes), -1, dtype=np.int64)
+
+        def update(context_hits: list[int], find):
+            positions = np.flatnonzero(np.isin(context_codes, context_hits) & has_element)
+            if not len(positions):
+                return
+            candidates = self._lookup(element_codes[positions], unique_elements, find)
+            # 既に当てはまった規則より優先度が高い場合のみ置き換える(同じ優先度では完全一致を残す)
+            current = matched[positions]
+            better = (candidates >= 0) & (self._priorities[candidates] > self._priorities[current])
+            matched[positions[better]] = candidates[better]
+
+        context_index = {context: code for code, context in enumerate(unique_contexts)}
+        for context, (index, rules) in self._exact.items():
+            if context in context_index:
+                update([context_index[context]], lambda elements: self._find_exact(index, rules, elements))
+        # コンテキストIDは種類が少ないため、パターンとの照合は重複を除いた値に対して行う
+        for context, regex in self._groups:
+            hits = [code for code, value in enumerate(unique_contexts) if fnmatch.fnmatchcase(value, context)]
+            if hits:
+                update(hits, lambda elements: self._find_pattern(regex, elements))
+        return matched
+
+    def select(self, elements: pd.Series, contexts: pd.Series) -> dict:
+        """
+        データ項目ごとに値を取り出す行を選ぶ関数
+
+        Parameters
+        ----------
+        elements : pd.Series
+            要素IDの列。
+        contexts : pd.Series
+            コンテキストIDの列。
+
+        Returns
+        -------
+        dict
+            データ項目名をキー、選んだ行の位置(0始まり)を値とする辞書。当てはまる行がないデータ項目は含まない。
+        """
+        matched = self.match_rows(elements, contexts)
+        positions = np.flatnonzero(matched >= 0)
+        if not len(positions):
+            return {}
+        rules = matched[positions]
+        # 優先度、行の位置の順に並べ、データ項目ごとに最後の行を選ぶ
+        order = np.lexsort((positions, self._priorities[rules]))
+        selected = {}
+        for position, rule in zip(positions[order].tolist(), rules[order].tolist()):
+            selected[self.rules[rule][0]] = position
+        return selected
+
+
+@functools.lru_cache(maxsize=32)
+def compile_rules(id_rules: tuple) -> ElementMatcher:
+    """
+    CSVProcessor.ID_expression_dictと同じ形式の規則を照合器にまとめる関数
+
+    同じ規則からは同じ照合器を返すため、ファイルごとに呼び出してもコンパイルは1度だけ行われる。
+
+    Parameters
+    ----------
+    id_rules : tuple
+        (要素IDの組のタプル, データ項目名)のタプル。要素IDの組は(要素ID, コンテキストID)または
+        (要素ID, コンテキストID, 優先度)。優先度を省略した場合、完全一致はEXACT_PRIORITY、
+        パターンはPATTERN_PRIORITYになる。
+
+    Returns
+    -------
+    ElementMatcher
+        コンパイルした照合器。
+    """
+    rules = []
+    for IDs, key in id_rules:
+        for ID in IDs:
+            element, context = ID[0], ID[1]
+            if len(ID) > 2:
+                priority = ID[2]
+            elif is_pattern(element) or is_pattern(context):
+                priority = PATTERN_PRIORITY
+            else:
+                priority = EXACT_PRIORITY
+            rules.append((key, element, context, priority))
+    return ElementMatcher(rules)
@@ -0,0 +1,409 @@
+import os
+import sys
+import json
+import time
+import argparse
+import itertools
+import threading
+import numpy as np
+import pandas as pd
+from snapshot import JSON_DIR, SNAPSHOT_PATH, TEXT_KEYS, map_snapshot
+from ratios import UNIFIED_ITEMS, RATIOS, compute_ratios
+from screening import ScreeningError, parse_expression, referenced_names, evaluate
+
+FORMATS = ('csv', 'ndjson', 'parquet')
+SOURCES = ('auto', 'snapshot', 'json')
+# 1度にメモリに置く会社・期間の数. 出力の大きさによらず、使うメモリはこの件数分で一定になる.
+CHUNK_SIZE = 5000
+# JSONファイルのデータ項目以外に出力できる列
+EXTRA_COLUMNS = ('json_file', 'isIFRS')
+
+
+class ExportError(ValueError):
+    """
+    出力形式や列名が不正な場合、必要なパッケージがない場合に送出される例外
+    """
+
+
+def snapshot_is_current(json_dir: str = JSON_DIR, snapshot_path: str = SNAPSHOT_PATH) -> bool:
+    """
+    スナップショットがjson_dir内の全てのJSONファイルより新しいかどうかを返す関数
+
+    JSONファイルの追加・削除はディレクトリの更新日時で、上書きはファイルの更新日時で判定する。
+    """
+    try:
+        snapshot_mtime = os.stat(snapshot_path).st_mtime_ns
+        if os.stat(json_dir).st_mtime_ns > snapshot_mtime:
+            return False
+        with os.scandir(json_dir) as entries:
+            return all(entry.stat().st_mtime_ns <= snapshot_mtime for entry in entries if entry.name.endswith('.json'))
+    except FileNotFoundError:
+        return False
+
+
+def iter_json_chunks(json_dir: str = JSON_DIR, chunk_size: int = CHUNK_SIZE):
+    """
+    json_dir内のJSONファイルをchunk_size件ずつ読み込んでChunkColumnsとして返すジェネレーター
+
+    ファイル名だけを先に集めて並べ替え(出力の順番を決めるため)、内容は1チャンクずつ読み込む。
+    snapshot.build_snapshotと同じく、数値であるべきデータ項目に文字列が入っているファイルは読み飛ばす。
+
+    Yields
+    ------
+    ChunkColumns
+        chunk_size件以下の会社・期間の列。列はJSONファイルのデータ項目の順番(最初のファイル)に合わせる。
+    """
+    keys = None
+    with os.scandir(json_dir) as entries:
+        file_names = sorted(entry.name for entry in entries if entry.name.endswith('.json') and entry.is_file())
+    for start in range(0, len(file_names), chunk_size):
+        chunk = []
+        for file_name in file_names[start:start + chunk_size]:
+            with open(os.path.join(json_dir, file_name), 'rb') as f:
+                json_data = json.loads(f.read())
+            if any(key not in TEXT_KEYS and not isinstance(item['value'], int) for key, item in json_data.items()):
+                # 出力を標準出力に書く場合があるため、メッセージは標準エラー出力に書く
+                print(f'数値でない値を含むため出力しません: {file_name}', file=sys.stderr)
+                continue
+            chunk.append((file_name, json_data))
+        if chunk:
+            keys = keys or list(chunk[0][1])
+            yield ChunkColumns.from_records(chunk, keys)
+
+
+def iter_snapshot_chunks(snapshot_path: str = SNAPSHOT_PATH, chunk_size: int = CHUNK_SIZE):
+    """
+    スナップショットをメモリマップで開き、chunk_size行ずつChunkColumnsとして返すジェネレーター
+
+    JSONファイルを1つずつ解析する必要がないため、iter_json_chunksより大幅に速い。
+
+    Yields
+    ------
+    ChunkColumns
+        chunk_size件以下の会社・期間の列。
+    """
+    arrays = map_snapshot(snapshot_path)
+    if arrays is None:
+        raise ExportError(f'スナップショットをメモリマップで開けません: {snapshot_path}')
+    keys = arrays['keys'].tolist()
+    numeric_keys = arrays['numeric_keys'].tolist()
+    text_keys = arrays['text_keys'].tolist()
+    n_rows = len(arrays['json_files'])
+    for start in range(0, n_rows, chunk_size):
+        stop = min(start + chunk_size, n_rows)
+        # 範囲の行だけをメモリマップから読み出す
+        values = np.array(arrays['values'][start:stop])
+        texts = np.array(arrays['texts'][start:stop])
+        yield ChunkColumns(keys, arrays['json_files'][start:stop].astype(object),
+                           {key: texts[:, j].astype(object) for j, key in enumerate(text_keys)},
+                           {key: values[:, j] for j, key in enumerate(numeric_keys)})
+
+
+class ChunkColumns:
+    """
+    1チャンク分のJSONファイルの内容を列ごとの配列にしたもの。
+
+    数値のデータ項目は値が見つからない(-1)場合をNaNにしたfloat64の列として、条件式の評価に使う。
+    比率(ratios.RATIOS)は参照された場合にのみ、チャンクの中で会計基準によらない指標から計算する。
+
+    Attributes
+    ----------
+    keys : list of str
+        JSONファイルのデータ項目名。
+    """
+
+    def __init__(self, keys: list[str], json_files: np.ndarray, texts: dict, values: dict):
+        self.keys = keys
+        self.n_rows = len(json_files)
+        self.json_files = json_files
+        self.texts = texts
+        self.values = values
+        # main.isIFRSと同じく、IFRSのデータ項目が1つでも見つかった行をIFRSの行とする
+        ifrs_values = [values for key, values in self.values.items() if key.startswith('IFRS')]
+        self.is_ifrs = (np.any([values != -1 for values in ifrs_values], axis=0) if ifrs_values
+                        else np.zeros(self.n_rows, dtype=bool))
+        self._floats = {}
+        self._ratios = None
+
+    @classmethod
+    def from_records(cls, records: list, keys: list[str]) -> 'ChunkColumns':
+        """
+        (JSONファイル名, JSONファイルの内容の辞書)のリストから列を作る関数
+        """
+        json_files = np.array([file_name for file_name, _ in records], dtype=object)
+        texts = {key: np.array([str(data[key]['value']) if key in data else '' for _, data in records], dtype=object)
+                 for key in keys if key in TEXT_KEYS}
+        values = {key: np.fromiter((data[key]['value'] if key in data else -1 for _, data in records),
+                                   dtype=np.int64, count=len(records))
+                  for key in keys if key not in TEXT_KEYS}
+        return cls(keys, json_files, texts, values)
+
+    def _float(self, key: str) -> np.ndarray:
+        if key not in self._floats:
+            values = self.values[key].astype(np.float64) if key in self.values else np.full(self.n_rows, np.nan)
+            values[values == -1] = np.nan
+            self._floats[key] = values
+        return self._floats[key]
+
+    def ratios(self) -> dict:
+        """
+        比率の列を計算する関数. 同じチャンクでは1度だけ計算する.
+        """
+        if self._ratios is None:
+            unified = {name: np.where(self.is_ifrs, self._float(ifrs_key), self._float(gaap_key))
+                       for name, (ifrs_key, gaap_key) in UNIFIED_ITEMS.items()}
+            self._ratios = compute_ratios(unified, RATIOS)
+        return self._ratios
+
+    def column(self, name: str) -> np.ndarray:
+        """
+        条件式の評価に使う列を返す関数
+        """
+        if name == 'json_file':
+            return self.json_files
+        if name == 'isIFRS':
+            return self.is_ifrs
+        if name in self.texts:
+            return self.texts[name]
+        if name in RATIOS:
+            return self.ratios()[name]
+        return self._float(name)
+
+    def frame(self, columns: list[str], rows: np.ndarray) -> pd.DataFrame:
+        """
+        出力する列と行のDataFrameを返す関数. 値が見つからない(-1)数値は欠損値にする.
+        """
+        frame = {}
+        for name in columns:
+            if name in self.values:
+                values = self.values[name][rows]
+                frame[name] = pd.arrays.IntegerArray(values, values == -1)
+            elif name in RATIOS:
+                frame[name] = self.ratios()[name][rows]
+            else:
+                frame[name] = self.column(name)[rows]
+        return pd.DataFrame(frame, columns=columns)
+
+
+class CSVWriter:
+    """
+    チャンクごとのDataFrameをCSVファイルに追記するクラス. ヘッダーは最初のチャンクにのみ書く.
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.header = True
+
+    def write(self, df: pd.DataFrame) -> None:
+        df.to_csv(self.f, header=self.header, index=False)
+        self.header = False
+
+    def close(self) -> None:
+        pass
+
+
+class NDJSONWriter:
+    """
+    チャンクごとのDataFrameを1行1件のJSON(NDJSON)として追記するクラス. 欠損値はnullになる.
+    """
+
+    def __init__(self, f):
+        self.f = f
+
+    def write(self, df: pd.DataFrame) -> None:
+        if len(df):
+            self.f.write(df.to_json(orient='records', lines=True, force_ascii=False))
+            self.f.write('\n')
+
+    def close(self) -> None:
+        pass
+
+
+class ParquetWriter:
+    """
+    チャンクごとのDataFrameをParquetファイルの行グループとして追記するクラス. pyarrowが必要.
+    """
+
+    def __init__(self, path: str, columns: list[str], text_columns: set):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ExportError('Parquet形式で出力するにはpyarrowが必要です(pip install pyarrow)') from None
+        self.pa = pa
+        # 全てのチャンクで同じスキーマにする(欠損値だけのチャンクで型が変わらないように)
+        self.schema = pa.schema([(name, pa.string() if name in text_columns else pa.bool_() if name == 'isIFRS'
+                                  else pa.float64() if name in RATIOS else pa.int64()) for name in columns])
+        self.writer = pq.ParquetWriter(path, self.schema)
+
+    def write(self, df: pd.DataFrame) -> None:
+        self.writer.write_table(self.pa.Table.from_pandas(df, schema=self.schema, preserve_index=False))
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+def resolve_columns(requested: list[str] | None, keys: list[str]) -> list[str]:
+    """
+    列名を出力できる列名に置き換える関数. 省略した場合はjson_file、isIFRSとJSONファイルの全てのデータ項目.
+
+    ハイフンを含む列名(Interest-bearingCurrentLiabilitiesなど)はハイフンを_に置き換えて指定してもよい。
+    """
+    available = [*EXTRA_COLUMNS, *keys, *RATIOS]
+    if not requested:
+        return [*EXTRA_COLUMNS, *keys]
+    by_alias = {name.replace('-', '_'): name for name in available}
+    columns = []
+    for name in requested:
+        if name not in available and name not in by_alias:
+            raise ExportError(f'存在しない列です: {name}')
+        columns.append(name if name in available else by_alias[name])
+    return columns
+
+
+def filter_rows(chunk: ChunkColumns, conditions: list, rows: np.ndarray) -> np.ndarray:
+    """
+    条件を順に評価し、残った行だけを次の条件の対象にして、全ての条件を満たす行番号を返す関数
+
+    Parameters
+    ----------
+    chunk : ChunkColumns
+        1チャンク分の列。
+    conditions : list of tuple
+        (parse_expressionが返した条件, 条件式の列名 -> 出力できる列名の辞書)のリスト。
+    rows : np.ndarray
+        対象の行番号。
+
+    Returns
+    -------
+    np.ndarray
+        条件を満たす行番号。
+    """
+    for condition, names in conditions:
+        if not len(rows):
+            break
+        available = {name: chunk.column(column)[rows] for name, column in names.items()}
+        try:
+            mask = np.broadcast_to(np.asarray(evaluate(condition, available), dtype=bool), rows.shape)
+        except ScreeningError as e:
+            raise ExportError(str(e)) from None
+        rows = rows[mask]
+    return rows
+
+
+def export(output: str, fmt: str | None = None, json_dir: str = JSON_DIR, where: str | None = None,
+           columns: list[str] | None = None, chunk_size: int = CHUNK_SIZE, source: str = 'auto',
+           snapshot_path: str = SNAPSHOT_PATH) -> int:
+    """
+    JSONファイルの会社・期間をCSV、改行区切りのJSON(NDJSON)、Parquetのいずれかの形式で出力する関数
+
+    会社・期間はchunk_size件ずつ読み込み、条件式で絞り込んでからチャンクごとに書き出すため、
+    全ての会社・期間を一度にメモリに置くことはない。出力は一時ファイルに書き込んでから置き換える。
+    スナップショットが全てのJSONファイルより新しい場合は、JSONファイルの代わりにスナップショットを
+    メモリマップで開いて範囲ごとに読み出す。
+
+    Parameters
+    ----------
+    output : str
+        出力先のパス。'-'の場合は標準出力(CSVとNDJSONのみ)。
+    fmt : str, optional
+        出力形式('csv', 'ndjson', 'parquet')。省略した場合は出力先の拡張子から決める。
+    json_dir : str
+        JSONファイルが格納されているディレクトリのパス。
+    where : str, optional
+        絞り込みの条件式(screening.pyと同じ書式。例: "isIFRS and Sales > 1兆円 and EquityRatio > 50%")。
+        使える列はJSONファイルのデータ項目、json_file、isIFRS、比率(ratios.RATIOS)。
+    columns : list of str, optional
+        出力する列名。比率の列も指定できる。
+    chunk_size : int
+        1度に読み込む会社・期間の数。
+    source : str
+        読み込み元。'auto'はスナップショットが新しければスナップショット、そうでなければJSONファイル。
+    snapshot_path : str
+        スナップショットのパス。
+
+    Returns
+    -------
+    int
+        出力した会社・期間の数。
+    """
+    if fmt is None:
+        extension = os.path.splitext(output)[1].lstrip('.').lower()
+        fmt = {'jsonl': 'ndjson', 'json': 'ndjson', 'pq': 'parquet'}.get(extension, extension or 'csv')
+    if fmt not in FORMATS:
+        raise ExportError(f'対応していない出力形式です: {fmt} ({", ".join(FORMATS)})')
+    if output == '-' and fmt == 'parquet':
+        raise ExportError('Parquet形式は標準出力に出力できません')
+    try:
+        conditions = parse_expression(where) if where else []
+    except ScreeningError as e:
+        raise ExportError(str(e)) from None
+
+    if source not in SOURCES:
+        raise ExportError(f'対応していない読み込み元です: {source} ({", ".join(SOURCES)})')
+    if source == 'snapshot' or source == 'auto' and snapshot_is_current(json_dir, snapshot_path):
+        chunks = iter_snapshot_chunks(snapshot_path, chunk_size)
+    else:
+        chunks = iter_json_chunks(json_dir, chunk_size)
+    first = next(chunks, None)
+    if first is None:
+        raise ExportError(f'JSONファイルが見つかりませんでした: {json_dir}')
+    keys = first.keys
+    output_columns = resolve_columns(columns, keys)
+    conditions = [(condition, {name: resolve_columns([name], keys)[0] for name in referenced_names(condition)})
+                  for condition in conditions]
+
+    tmp_path = f'{output}.{os.getpid()}.{threading.get_ident()}.tmp'
+    f = None
+    count = 0
+    try:
+        if fmt == 'parquet':
+            writer = ParquetWriter(tmp_path, output_columns, {*TEXT_KEYS, 'json_file'})
+        else:
+            f = sys.stdout if output == '-' else open(tmp_path, 'w', encoding='utf-8', newline='')
+            writer = CSVWriter(f) if fmt == 'csv' else NDJSONWriter(f)
+        for chunk in itertools.chain([first], chunks):
+            rows = filter_rows(chunk, conditions, np.arange(chunk.n_rows))
+            writer.write(chunk.frame(output_columns, rows))
+            count += len(rows)
+        writer.close()
+        if f is not None and f is not sys.stdout:
+            f.close()
+        if output != '-':
+            os.replace(tmp_path, output)
+    except BaseException:
+        if f is not None and f is not sys.stdout:
+            f.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='JSONファイルの会社・期間をCSV、NDJSON、Parquetに出力する')
+    parser.add_argument('output', help="出力先のパス('-'で標準出力)")
+    parser.add_argument('--format', choices=FORMATS, default=None, help='出力形式(省略時は拡張子から決める)')
+    parser.add_argument('--where', default=None,
+                        help='絞り込みの条件式 (例: "isIFRS and Sales > 1兆円 and EquityRatio > 50%%")')
+    parser.add_argument('--columns', nargs='*', default=None, help='出力する列名')
+    parser.add_argument('--json-dir', default=JSON_DIR, help='JSONファイルが格納されているディレクトリ')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='1度に読み込む会社・期間の数')
+    parser.add_argument('--source', choices=SOURCES, default='auto',
+                        help='読み込み元(auto: スナップショットが新しければスナップショット、そうでなければJSONファイル)')
+    parser.add_argument('--snapshot', default=SNAPSHOT_PATH, help='スナップショットのパス')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    try:
+        count = export(args.output, args.format, args.json_dir, args.where, args.columns, args.chunk_size,
+                       args.source, args.snapshot)
+    except ExportError as e:
+        parser.error(str(e))
+    if args.output != '-':
+        print(f'{count}件を{args.output}に出力しました({time.perf_counter() - start:.2f}秒)。')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
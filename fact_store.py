@@ -0,0 +1,400 @@
+import os
+import re
+import json
+import time
+import shutil
+import argparse
+import threading
+import numpy as np
+import pandas as pd
+from element_matcher import compile_rules, glob_to_regex, is_pattern
+from filing_index import FilingIndex, FILING_INDEX_PATH
+
+FACT_STORE_DIR = 'fact_store'
+# 値の種類
+KIND_MISSING = 0
+KIND_INTEGER = 1
+KIND_DECIMAL = 2
+KIND_TEXT = 3
+# 以前の形式のディレクトリ名({証券コード}_{当会計期間終了日})
+LEGACY_KEY_PATTERN = re.compile(r'^(?P<secCode>.+)_(?P<period>\d{4}-\d{2}-\d{2})$')
+# 値がないことを表す文字列
+MISSING_VALUES = ('－', '-', '')
+# 辞書は1行に1つの値を書いたテキストファイル, 値の列は.npyファイルとして保存する
+DICTIONARIES = ('elements', 'contexts', 'units')
+CODE_COLUMNS = ('element_codes', 'context_codes', 'unit_codes')
+
+
+def _write_dictionary(path: str, values) -> None:
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(values))
+
+
+def _read_dictionary(path: str) -> np.ndarray:
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    return np.array(text.split('\n') if text else [], dtype=object)
+
+
+def encode_values(values: pd.Series) -> dict:
+    """
+    CSVファイルの値の列を型ごとの列に分ける関数
+
+    整数はint64、小数はfloat64、それ以外の文字列はUTF-8のバイト列と各行の開始位置で保存する。
+    数値の行もdecimalsに値を入れるため、型を問わず数値として扱う場合はdecimalsだけを読めばよい。
+
+    Parameters
+    ----------
+    values : pd.Series
+        CSVファイルの「値」の列。
+
+    Returns
+    -------
+    dict
+        kinds(int8), integers(int64), decimals(float64, 数値でない行はNaN),
+        text_offsets(int64, 行数+1), text_data(uint8)の配列の辞書。
+    """
+    n_rows = len(values)
+    text = values.astype(object).where(values.notna(), '').astype(str).str.strip()
+    missing = text.isin(MISSING_VALUES).to_numpy()
+    is_integer = text.str.fullmatch(r'-?[0-9]+').to_numpy() & ~missing
+    decimals = pd.to_numeric(text.where(~missing), errors='coerce').to_numpy(dtype=np.float64)
+    is_decimal = ~np.isnan(decimals) & ~is_integer
+    kinds = np.full(n_rows, KIND_TEXT, dtype=np.int8)
+    kinds[missing] = KIND_MISSING
+    kinds[is_integer] = KIND_INTEGER
+    kinds[is_decimal] = KIND_DECIMAL
+
+    integers = np.zeros(n_rows, dtype=np.int64)
+    # 19桁を超える整数はint64に収まらないため小数として扱う
+    fits = is_integer & (text.str.len().to_numpy() <= 19)
+    integers[fits] = text[fits].astype(np.int64).to_numpy()
+    kinds[is_integer & ~fits] = KIND_DECIMAL
+
+    encoded = [value.encode('utf-8') if kind == KIND_TEXT else b''
+               for value, kind in zip(text.tolist(), kinds.tolist())]
+    text_offsets = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=text_offsets[1:])
+    return {
+        'kinds': kinds,
+        'integers': integers,
+        'decimals': decimals,
+        'text_offsets': text_offsets,
+        'text_data': np.frombuffer(b''.join(encoded), dtype=np.uint8),
+    }
+
+
+def decode_values(columns: dict, rows: np.ndarray) -> list:
+    """
+    型ごとの列から指定した行の値を取り出す関数. 整数はint, 小数はfloat, 文字列はstr, 値がない行は'－'を返す.
+    """
+    kinds = columns['kinds'][rows]
+    integers = columns['integers'][rows]
+    decimals = columns['decimals'][rows]
+    offsets = columns['text_offsets']
+    data = columns['text_data']
+    values = []
+    for row, kind, integer, decimal in zip(rows.tolist(), kinds.tolist(), integers.tolist(), decimals.tolist()):
+        if kind == KIND_INTEGER:
+            values.append(integer)
+        elif kind == KIND_DECIMAL:
+            values.append(decimal)
+        elif kind == KIND_TEXT:
+            values.append(bytes(data[offsets[row]:offsets[row + 1]]).decode('utf-8'))
+        else:
+            values.append('－')
+    return values
+
+
+class FactStore:
+    """
+    有価証券報告書のCSVファイルの全ての行(要素ID, コンテキストID, 単位, 値)を列ごとに保存するクラス。
+
+    1つの書類を1つのディレクトリ(パーティション)に保存する。ディレクトリ名は書類のfiling_id(docID)で、
+    訂正報告書は訂正前の書類とは別のディレクトリに保存する。読み込み時はfiling_index.FilingIndexで
+    会社・期間ごとに最新と決まった書類のみを対象にするため、書類を処理する順番によらず結果は同じになる。
+
+    - 要素ID、コンテキストID、単位は書類ごとの辞書(elements.txtなど)と、各行の辞書の番号(element_codes.npyなど)で保存する。
+    - 値はencode_valuesで型ごとの列に分けて保存する。
+    - meta.jsonには証券コード、会社名、当会計期間終了日、filing_id、元のCSVファイル名、行数を保存する。
+
+    書き込みは一時ディレクトリに行ってから置き換えるため、読み込み側が書き込み途中の書類を読むことはない。
+    異なる書類は異なるディレクトリに書き込むため、複数のプロセスから同時に書き込める。
+
+    Attributes
+    ----------
+    root : str
+        保存先のディレクトリのパス。
+    index_path : str
+        最新の書類を決めるfiling_index.FilingIndexのSQLiteファイルのパス。
+    """
+
+    def __init__(self, root: str = FACT_STORE_DIR, index_path: str = FILING_INDEX_PATH):
+        self.root = root
+        self.index_path = index_path
+
+    @staticmethod
+    def filing_key(secCode: str, end_date: str, filing_id: str | None = None) -> str:
+        """
+        書類を保存するディレクトリ名を返す関数. filing_idが分からない場合は以前の形式(会社と期間の組)とする.
+        """
+        return filing_id if filing_id else f'{secCode}_{end_date}'
+
+    def write(self, df: pd.DataFrame, secCode: str, company_name: str, end_date: str, source: str = '',
+              filing_id: str | None = None) -> str:
+        """
+        CSVファイルのデータフレームを保存する関数. 同じ書類が保存されていれば置き換える.
+
+        Parameters
+        ----------
+        df : pd.DataFrame
+            CSVProcessor.load_csvで読み込んだデータフレーム。
+        secCode : str
+            証券コード。
+        company_name : str
+            会社名。
+        end_date : str
+            当会計期間終了日。
+        source : str
+            元のCSVファイル名。
+        filing_id : str, optional
+            書類のfiling_id(CSVProcessor.filing['filing_id'])。
+
+        Returns
+        -------
+        str
+            保存したディレクトリのパス。
+        """
+        key = self.filing_key(secCode, end_date, filing_id)
+        path = os.path.join(self.root, key)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        os.makedirs(tmp_path, exist_ok=True)
+        try:
+            for name, column, dictionary in zip(CODE_COLUMNS, ('要素ID', 'コンテキストID', '単位'), DICTIONARIES):
+                codes, uniques = pd.factorize(df[column].astype(object).where(df[column].notna(), '').astype(str))
+                np.save(os.path.join(tmp_path, f'{name}.npy'), codes.astype(np.int32))
+                _write_dictionary(os.path.join(tmp_path, f'{dictionary}.txt'), uniques.tolist())
+            for name, array in encode_values(df['値']).items():
+                np.save(os.path.join(tmp_path, f'{name}.npy'), array)
+            meta = {'secCode': str(secCode), 'CompanyName': str(company_name), 'EndDate': str(end_date),
+                    'filing_id': filing_id, 'source': os.path.basename(source), 'rows': len(df), 'archived_at': time.time()}
+            with open(os.path.join(tmp_path, 'meta.json'), 'w', encoding='utf-8') as f:
+                json.dump(meta, f, ensure_ascii=False)
+            # ディレクトリは中身があると置き換えられないため、古い方を退避してから入れ替える
+            old_path = f'{tmp_path}.old'
+            if os.path.exists(path):
+                os.replace(path, old_path)
+            os.replace(tmp_path, path)
+            shutil.rmtree(old_path, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+        return path
+
+    def filings(self, latest_only: bool = True) -> list[str]:
+        """
+        保存されている書類のディレクトリ名のリストを返す関数
+
+        latest_only=Trueの場合、索引で最新でないと決まった書類(訂正された書類など)と、最新の書類が索引に
+        記録されている会社・期間の以前の形式のディレクトリは除く。索引にない書類はそのまま含める。
+        """
+        if not os.path.isdir(self.root):
+            return []
+        keys = sorted(entry.name for entry in os.scandir(self.root)
+                      if entry.is_dir() and not entry.name.endswith(('.tmp', '.old')))
+        if not latest_only or not os.path.exists(self.index_path):
+            return keys
+        index = FilingIndex(self.index_path)
+        superseded = index.superseded_filing_ids()
+        periods = index.latest_periods()
+        latest = []
+        for key in keys:
+            if key in superseded:
+                continue
+            match = LEGACY_KEY_PATTERN.match(key)
+            if match and (match['secCode'], match['period']) in periods:
+                continue
+            latest.append(key)
+        return latest
+
+    def meta(self, key: str) -> dict:
+        """
+        書類のmeta.jsonを読み込む関数
+        """
+        with open(os.path.join(self.root, key, 'meta.json'), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _load(self, key: str, names) -> dict:
+        # 必要な列だけをメモリマップで開く
+        return {name: np.load(os.path.join(self.root, key, f'{name}.npy'), mmap_mode='r') for name in names}
+
+    def _dictionary(self, key: str, name: str) -> np.ndarray:
+        return _read_dictionary(os.path.join(self.root, key, f'{name}.txt'))
+
+    def read(self, key: str) -> pd.DataFrame:
+        """
+        1つの書類の全ての行を要素ID, コンテキストID, 単位, 値の列を持つデータフレームで返す関数
+        """
+        columns = self._load(key, (*CODE_COLUMNS, 'kinds', 'integers', 'decimals', 'text_offsets', 'text_data'))
+        rows = np.arange(len(columns['kinds']))
+        return pd.DataFrame({
+            '要素ID': self._dictionary(key, 'elements')[columns['element_codes']],
+            'コンテキストID': self._dictionary(key, 'contexts')[columns['context_codes']],
+            '単位': self._dictionary(key, 'units')[columns['unit_codes']],
+            '値': decode_values(columns, rows),
+        })
+
+    def _candidate_rows(self, elements: np.ndarray, element_regex: re.Pattern, columns: dict) -> np.ndarray:
+        # 辞書の要素IDだけを照合し、当てはまる番号の行を配列演算で選ぶ
+        codes = [code for code, element in enumerate(elements) if element_regex.match(element)]
+        if not codes:
+            return np.array([], dtype=np.intp)
+        return np.flatnonzero(np.isin(columns['element_codes'], codes))
+
+    def _filing_rows(self, key: str, element_regex: re.Pattern):
+        columns = self._load(key, (*CODE_COLUMNS, 'kinds', 'integers', 'decimals', 'text_offsets', 'text_data'))
+        elements = self._dictionary(key, 'elements')
+        rows = self._candidate_rows(elements, element_regex, columns)
+        if not len(rows):
+            return None
+        frame = pd.DataFrame({
+            '要素ID': elements[columns['element_codes'][rows]],
+            'コンテキストID': self._dictionary(key, 'contexts')[columns['context_codes'][rows]],
+            '単位': self._dictionary(key, 'units')[columns['unit_codes'][rows]],
+        })
+        return frame, columns, rows
+
+    def query(self, elements: list[str], contexts: list[str] | None = None,
+              filings: list[str] | None = None) -> pd.DataFrame:
+        """
+        指定した要素IDの行を全ての書類から取り出す関数
+
+        Parameters
+        ----------
+        elements : list of str
+            要素ID。glob形式のパターン(例: jpcrp030000-asr_E*-000:*SalesIFRS*)も使える。
+        contexts : list of str, optional
+            コンテキストID(パターンも使える)。省略した場合は全てのコンテキスト。
+        filings : list of str, optional
+            対象の書類のディレクトリ名。省略した場合は会社・期間ごとに最新の書類(filings()の戻り値)。
+
+        Returns
+        -------
+        pd.DataFrame
+            filing, secCode, CompanyName, EndDate, 要素ID, コンテキストID, 単位, 値の列を持つデータフレーム。
+        """
+        rules = ((tuple((element, context or '*') for element in elements for context in (contexts or [None])),
+                  'match'),)
+        matcher = compile_rules(rules)
+        element_regex = _element_regex(elements)
+        frames = []
+        for key in filings if filings is not None else self.filings():
+            loaded = self._filing_rows(key, element_regex)
+            if loaded is None:
+                continue
+            frame, columns, rows = loaded
+            keep = matcher.match_rows(frame['要素ID'], frame['コンテキストID']) >= 0
+            if not keep.any():
+                continue
+            frame = frame[keep].reset_index(drop=True)
+            frame['値'] = decode_values(columns, rows[keep])
+            meta = self.meta(key)
+            frame.insert(0, 'filing', key)
+            frame.insert(1, 'secCode', meta['secCode'])
+            frame.insert(2, 'CompanyName', meta['CompanyName'])
+            frame.insert(3, 'EndDate', meta['EndDate'])
+            frames.append(frame)
+        if not frames:
+            return pd.DataFrame(columns=['filing', 'secCode', 'CompanyName', 'EndDate', '要素ID', 'コンテキストID',
+                                         '単位', '値'])
+        return pd.concat(frames, ignore_index=True)
+
+    def extract(self, id_rules: dict, filings: list[str] | None = None) -> pd.DataFrame:
+        """
+        CSVProcessor.ID_expression_dictと同じ形式の規則で、保存された全ての書類から新しい指標を取り出す関数
+
+        CSVファイルを読み込み直さずに、process_dataと同じ規則(優先度、同じ優先度では後ろの行)で値を選ぶ。
+
+        Parameters
+        ----------
+        id_rules : dict
+            (要素IDの組のタプル)をキー、データ項目名を値とする辞書。
+        filings : list of str, optional
+            対象の書類のディレクトリ名。省略した場合は会社・期間ごとに最新の書類(filings()の戻り値)。
+
+        Returns
+        -------
+        pd.DataFrame
+            1行が1つの書類。filing, secCode, CompanyName, EndDateと、データ項目ごとの値の列を持つ。
+            値が見つからない場合はprocess_dataと同じく-1。
+        """
+        matcher = compile_rules(tuple(id_rules.items()))
+        item_names = list(dict.fromkeys(id_rules.values()))
+        element_regex = _element_regex([ID[0] for IDs in id_rules for ID in IDs])
+        records = []
+        for key in filings if filings is not None else self.filings():
+            meta = self.meta(key)
+            # 会社名などが規則に含まれる場合はCSVファイルから取り出した値で上書きする
+            record = {**{name: -1 for name in item_names}, 'filing': key, 'secCode': meta['secCode'],
+                      'CompanyName': meta['CompanyName'], 'EndDate': meta['EndDate']}
+            loaded = self._filing_rows(key, element_regex)
+            if loaded is not None:
+                frame, columns, rows = loaded
+                selected = matcher.select(frame['要素ID'], frame['コンテキストID'])
+                if selected:
+                    positions = np.array(list(selected.values()))
+                    record.update(zip(selected, decode_values(columns, rows[positions])))
+            records.append(record)
+        return pd.DataFrame(records, columns=list(dict.fromkeys(['filing', 'secCode', 'CompanyName', 'EndDate',
+                                                                 *item_names])))
+
+
+def _element_regex(elements) -> re.Pattern:
+    # 要素IDの完全一致とパターンを1つの正規表現にまとめる
+    return re.compile('|'.join(glob_to_regex(element) if is_pattern(element) else f'{re.escape(element)}\\Z'
+                               for element in dict.fromkeys(elements)) or '(?!)')
+
+
+def archive_processor(processor, store: FactStore | None = None) -> str:
+    """
+    CSVProcessorが読み込んだCSVファイルの全ての行を保存する関数. process_dataの後に呼び出す.
+    """
+    store = store or FactStore()
+    return store.write(processor.df, processor.data['secCode'].value, processor.data['CompanyName'].value,
+                       processor.data['EndDate'].value, source=processor.file_path,
+                       filing_id=processor.filing['filing_id'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='保存したCSVファイルの全ての行から要素IDの値を取り出す')
+    parser.add_argument('elements', nargs='*', help='要素ID (例: jpcrp_cor:NumberOfEmployees, パターンも可)')
+    parser.add_argument('--context', nargs='*', default=None, help='コンテキストID (例: CurrentYearInstant)')
+    parser.add_argument('--list', action='store_true', help='保存されている書類を表示する')
+    parser.add_argument('--output', help='結果を保存するCSVファイルのパス')
+    parser.add_argument('--root', default=FACT_STORE_DIR, help='保存先のディレクトリ')
+    parser.add_argument('--db', default=FILING_INDEX_PATH, help='最新の書類を決める索引のSQLiteファイル')
+    parser.add_argument('--all', action='store_true', help='最新でない書類(訂正された書類など)も対象にする')
+    args = parser.parse_args()
+
+    store = FactStore(args.root, args.db)
+    filings = store.filings(latest_only=not args.all)
+    if args.list or not args.elements:
+        for key in filings:
+            meta = store.meta(key)
+            print(f"{key}\t{meta['CompanyName']}\t{meta['rows']}行")
+        print(f'{len(filings)}件の書類が保存されています。')
+        return
+    start = time.perf_counter()
+    df = store.query(args.elements, contexts=args.context, filings=filings)
+    elapsed = time.perf_counter() - start
+    if args.output:
+        df.to_csv(args.output, index=False)
+        print(f'{len(df)}件を{args.output}に保存しました。')
+    else:
+        with pd.option_context('display.max_rows', 100, 'display.width', 200):
+            print(df)
+    print(f'{len(df)}件を取り出しました({elapsed * 1000:.1f}ms)。')
+
+
+if __name__ == '__main__':
+    main()
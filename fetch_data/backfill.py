@@ -0,0 +1,145 @@
+import os
+import json
+import time
+import argparse
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dotenv import load_dotenv
+from edinet_client import EdinetClient
+from edinet_data_fetcher import EdinetDataFetcher
+from rate_limiter import TokenBucket
+from document_list_cache import DocumentListCache
+from download_ledger import DownloadLedger
+
+SUMMARY_PATH = 'backfill_summary.jsonl'
+
+
+def date_range(start: str, end: str) -> list[str]:
+    """
+    startからend(endを含む)までの日付のリストを返す関数
+
+    Parameters
+    ----------
+    start : str
+        開始日(YYYY-MM-DD)。
+    end : str
+        終了日(YYYY-MM-DD)。
+
+    Returns
+    -------
+    list of str
+        YYYY-MM-DD形式の日付のリスト。
+    """
+    start_date = datetime.strptime(start, "%Y-%m-%d")
+    end_date = datetime.strptime(end, "%Y-%m-%d")
+    if end_date < start_date:
+        raise ValueError(f"end ({end}) must not be before start ({start})")
+    return [f"{start_date + timedelta(days=i):%Y-%m-%d}" for i in range((end_date - start_date).days + 1)]
+
+
+def format_seconds(seconds: float) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def backfill(dates: list[str], workers: int = 4, concurrency: int = 2, rate: float = 1.0,
+             summary_path: str = SUMMARY_PATH, on_downloaded=None) -> list[dict]:
+    """
+    複数の日付のデータを並行に取得する関数
+
+    日付をworkers個のスレッドに振り分け、各スレッドはその日の書類をconcurrency件ずつ並行にダウンロードする.
+    全てのスレッドで1つのトークンバケット、接続プール、書類一覧のキャッシュ、台帳を共有するため、
+    全体のリクエストの速さはrate回/秒以下に抑えられ、ダウンロード済みの書類は再ダウンロードされない.
+
+    Parameters
+    ----------
+    dates : list of str
+        取得する日付(YYYY-MM-DD)のリスト。
+    workers : int
+        同時に処理する日付の数。
+    concurrency : int
+        1日あたり同時にダウンロードする書類の数。
+    rate : float
+        全体のリクエストの速さの上限(回/秒)。
+    summary_path : str
+        日付ごとの結果をJSON Linesで追記するファイルのパス。
+    on_downloaded : callable, optional
+        書類をZIPsに保存するたびにZIPファイルのパスを引数として呼び出される関数。
+
+    Returns
+    -------
+    list of dict
+        日付ごとの結果(EdinetDataFetcher.fetch_dataの戻り値に処理時間secondsを加えたもの)。
+        取得に失敗した日はerrorを持つ。
+    """
+    load_dotenv()
+    API_TOKEN = os.getenv("API_TOKEN")
+    if not API_TOKEN:
+        raise ValueError("API_TOKEN is not set in the environment variables")
+
+    rate_limiter = TokenBucket(rate=rate)
+    client = EdinetClient(API_TOKEN, pool_size=workers * max(concurrency, 1), rate_limiter=rate_limiter)
+    document_list_cache = DocumentListCache()
+    ledger = DownloadLedger()
+    summary_lock = threading.Lock()
+
+    def fetch_day(date: str) -> dict:
+        fetcher = EdinetDataFetcher(date, concurrency=concurrency, rate_limiter=rate_limiter, client=client,
+                                    document_list_cache=document_list_cache, ledger=ledger,
+                                    on_downloaded=on_downloaded)
+        day_start = time.perf_counter()
+        try:
+            summary = fetcher.fetch_data()
+        except Exception as e:
+            summary = {"date": date, "documents": 0, "downloaded": 0, "skipped": 0, "failed": [], "error": repr(e)}
+        summary["seconds"] = round(time.perf_counter() - day_start, 3)
+        with summary_lock:
+            with open(summary_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(summary, ensure_ascii=False) + "\n")
+        return summary
+
+    summaries = []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(fetch_day, date) for date in dates]
+        for i, future in enumerate(as_completed(futures), 1):
+            summary = future.result()
+            summaries.append(summary)
+            elapsed = time.perf_counter() - start
+            eta = elapsed / i * (len(dates) - i)
+            status = f"error: {summary['error']}" if "error" in summary else (
+                f"{summary['downloaded']} downloaded, {summary['skipped']} skipped, {len(summary['failed'])} failed")
+            print(f"[{i}/{len(dates)}] {summary['date']}: {status} | "
+                  f"elapsed {format_seconds(elapsed)}, ETA {format_seconds(eta)}")
+    client.close()
+
+    summaries.sort(key=lambda summary: summary["date"])
+    failed_dates = [summary["date"] for summary in summaries if "error" in summary]
+    failed_documents = [docID for summary in summaries for docID in summary["failed"]]
+    print("--------------------")
+    print(f"Fetched {len(dates)} days in {format_seconds(time.perf_counter() - start)}: "
+          f"{sum(summary['downloaded'] for summary in summaries)} downloaded, "
+          f"{sum(summary['skipped'] for summary in summaries)} skipped, {len(failed_documents)} failed")
+    if failed_dates or failed_documents:
+        print(f"Failed dates: {failed_dates}")
+        print(f"Failed documents: {failed_documents}")
+    print(f"Summary written to {summary_path}")
+    return summaries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="指定した期間の書類をEDINETから並行に取得する")
+    parser.add_argument("--start", required=True, help="開始日 (YYYY-MM-DD)")
+    parser.add_argument("--end", required=True, help="終了日 (YYYY-MM-DD, この日を含む)")
+    parser.add_argument("--workers", type=int, default=4, help="同時に処理する日付の数")
+    parser.add_argument("--concurrency", type=int, default=2, help="1日あたり同時にダウンロードする書類の数")
+    parser.add_argument("--rate", type=float, default=1.0, help="全体のリクエストの速さの上限(回/秒)")
+    parser.add_argument("--summary", default=SUMMARY_PATH, help="日付ごとの結果を追記するJSON Linesファイル")
+    args = parser.parse_args()
+    backfill(date_range(args.start, args.end), workers=args.workers, concurrency=args.concurrency,
+             rate=args.rate, summary_path=args.summary)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import os
+import sys
+import time
+import argparse
+import tempfile
+from stub_server import StubEdinet, start_stub_server
+
+
+def run_benchmark(days: int, docs_per_day: int, workers: int, concurrency: int, rate: float,
+                  latency: float, jitter: float, error_rate: float, truncate_rate: float,
+                  rate_limit: float | None, start_date: str = '2024-06-17') -> dict:
+    """
+    スタブサーバーに対してbackfillを実行し、スループットとリトライ、レート制限の遵守状況を測る関数
+
+    一時ディレクトリで実行するため、ZIPs、書類一覧のキャッシュ、台帳は毎回空の状態から始まる。
+
+    Returns
+    -------
+    dict
+        seconds: 処理時間, downloaded: ダウンロードした書類の数, documents_per_second, megabytes_per_second,
+        failed: 失敗した書類の数, failed_days: 書類一覧の取得に失敗した日数, server: スタブサーバーの統計.
+    """
+    stub = StubEdinet(list_dir=None, docs_per_day=docs_per_day, latency=latency, jitter=jitter,
+                      error_rate=error_rate, truncate_rate=truncate_rate, rate_limit=rate_limit)
+    server, url = start_stub_server(stub)
+    os.environ['EDINET_API_URL'] = url
+    os.environ.setdefault('API_TOKEN', 'stub')
+    from backfill import backfill, date_range
+    from datetime import datetime, timedelta
+    end_date = f'{datetime.strptime(start_date, "%Y-%m-%d") + timedelta(days=days - 1):%Y-%m-%d}'
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.chdir(work_dir)
+        os.makedirs('ZIPs')
+        try:
+            start = time.perf_counter()
+            summaries = backfill(date_range(start_date, end_date), workers=workers, concurrency=concurrency,
+                                 rate=rate)
+            seconds = time.perf_counter() - start
+            zip_bytes = sum(entry.stat().st_size for entry in os.scandir('ZIPs'))
+        finally:
+            os.chdir(cwd)
+    server.shutdown()
+
+    downloaded = sum(summary['downloaded'] for summary in summaries)
+    server_stats = stub.stats()
+    return {
+        'seconds': seconds,
+        'downloaded': downloaded,
+        'documents_per_second': downloaded / seconds,
+        'megabytes_per_second': zip_bytes / seconds / 1e6,
+        'failed': sum(len(summary['failed']) for summary in summaries),
+        'failed_days': sum('error' in summary for summary in summaries),
+        'server': server_stats,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='スタブサーバーを使ってEdinetDataFetcherをオフラインで計測する')
+    parser.add_argument('--days', type=int, default=5)
+    parser.add_argument('--docs-per-day', type=int, default=20)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--concurrency', type=int, default=2)
+    parser.add_argument('--rate', type=float, default=20.0, help='クライアント側のリクエストの速さの上限(回/秒)')
+    parser.add_argument('--latency', type=float, default=0.2)
+    parser.add_argument('--jitter', type=float, default=0.1)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--truncate-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit', type=float, default=None, help='サーバー側のリクエストの速さの上限(回/秒)')
+    args = parser.parse_args()
+
+    result = run_benchmark(args.days, args.docs_per_day, args.workers, args.concurrency, args.rate,
+                           args.latency, args.jitter, args.error_rate, args.truncate_rate, args.rate_limit)
+    server = result['server']
+    print('====================')
+    print(f"{result['downloaded']} documents in {result['seconds']:.2f}s "
+          f"({result['documents_per_second']:.1f} docs/s, {result['megabytes_per_second']:.2f} MB/s)")
+    print(f"failed documents: {result['failed']}, failed days: {result['failed_days']}")
+    print(f"server: {server['requests']} requests, statuses {server['statuses']}")
+    print(f"peak request rate: {server['max_requests_per_second']} req/s (client limit {args.rate})")
+    if args.rate_limit is not None:
+        print(f"rate limit responses (429): {server['statuses'].get(429, 0)}")
+    return 0 if result['failed'] == 0 and result['failed_days'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,217 @@
+import os
+import json
+import time
+import sqlite3
+import argparse
+from contextlib import closing
+import pandas as pd
+from edinet_client import DOCUMENT_FIELDS
+from document_list_cache import DOCUMENT_LIST_CACHE_DIR
+
+CATALOG_PATH = 'document_catalog.sqlite3'
+# 検索に使う列には索引を作る
+INDEXED_FIELDS = ('edinetCode', 'secCode', 'docTypeCode', 'parentDocID', 'submitDateTime')
+
+
+class DocumentCatalog:
+    """
+    書類一覧APIの全ての書類のメタデータを日付ごとに保存するSQLiteのカタログ。
+
+    書類一覧の28項目に書類一覧の日付(list_date)を加えて1つの表に保存する。
+    書類一覧には提出された書類の他にその日に更新された書類も含まれるため、同じdocIDが複数の日付に現れることがある。
+    日付ごとの書類はrecord()で丸ごと置き換えるため、同じ日を何度記録しても重複しない。
+
+    Attributes
+    ----------
+    db_path : str
+        カタログのSQLiteファイルのパス。
+    """
+
+    def __init__(self, db_path: str = CATALOG_PATH):
+        self.db_path = db_path
+        columns = ', '.join(f'"{name}" TEXT' for name in DOCUMENT_FIELDS)
+        with closing(self._connect()) as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(f'CREATE TABLE IF NOT EXISTS documents (list_date TEXT NOT NULL, {columns}, '
+                         f'PRIMARY KEY (list_date, docID))')
+            conn.execute('CREATE TABLE IF NOT EXISTS partitions '
+                         '(list_date TEXT PRIMARY KEY, document_count INTEGER NOT NULL, updated_at REAL NOT NULL)')
+            for name in INDEXED_FIELDS:
+                conn.execute(f'CREATE INDEX IF NOT EXISTS documents_{name} ON documents ("{name}")')
+
+    def _connect(self) -> sqlite3.Connection:
+        # スレッド間で接続を共有しないように、操作ごとに接続する
+        return sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+
+    def record(self, list_date: str, results: list[dict]) -> int:
+        """
+        1日分の書類一覧をカタログに保存する関数. その日の既存の書類は置き換える.
+
+        Parameters
+        ----------
+        list_date : str
+            書類一覧の日付(YYYY-MM-DD)。
+        results : list of dict
+            書類一覧APIのレスポンスのresults。
+
+        Returns
+        -------
+        int
+            保存した書類の数。
+        """
+        rows = [(list_date, *(document.get(name) for name in DOCUMENT_FIELDS)) for document in results]
+        placeholders = ', '.join('?' * (len(DOCUMENT_FIELDS) + 1))
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('DELETE FROM documents WHERE list_date = ?', (list_date,))
+            conn.executemany(f'INSERT OR REPLACE INTO documents VALUES ({placeholders})', rows)
+            conn.execute('INSERT OR REPLACE INTO partitions VALUES (?, ?, ?)', (list_date, len(rows), time.time()))
+            conn.execute('COMMIT')
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+        return len(rows)
+
+    def has_date(self, list_date: str) -> bool:
+        """
+        その日の書類一覧がカタログに保存されているかどうかを返す関数
+        """
+        with closing(self._connect()) as conn:
+            row = conn.execute('SELECT 1 FROM partitions WHERE list_date = ?', (list_date,)).fetchone()
+        return row is not None
+
+    def dates(self) -> list[str]:
+        """
+        カタログに保存されている日付のリストを返す関数
+        """
+        with closing(self._connect()) as conn:
+            return [row[0] for row in conn.execute('SELECT list_date FROM partitions ORDER BY list_date')]
+
+    def query(self, start: str | None = None, end: str | None = None, doc_type_codes: list[str] | None = None,
+              edinet_codes: list[str] | None = None, sec_codes: list[str] | None = None, csv_only: bool = False,
+              listed_only: bool = False, latest: bool = True) -> pd.DataFrame:
+        """
+        条件に合う書類のメタデータをDataFrameで返す関数
+
+        条件はSQLのWHERE句として索引を使って評価する。
+
+        Parameters
+        ----------
+        start : str, optional
+            書類一覧の日付の下限(YYYY-MM-DD, この日を含む)。
+        end : str, optional
+            書類一覧の日付の上限(YYYY-MM-DD, この日を含む)。
+        doc_type_codes : list of str, optional
+            書類種別コード(例: "120" 有価証券報告書, "130" 訂正有価証券報告書)。
+        edinet_codes : list of str, optional
+            提出者のEDINETコード。
+        sec_codes : list of str, optional
+            提出者の証券コード(5桁)。
+        csv_only : bool
+            CSVファイルがある書類(csvFlag == "1")のみを返すかどうか。
+        listed_only : bool
+            縦覧期間内で(legalStatus == "1")、ファンドでなく、証券コードを持つ書類のみを返すかどうか。
+        latest : bool
+            同じdocIDが複数の日付に現れる場合に、最も新しい日付の行のみを返すかどうか。
+
+        Returns
+        -------
+        pd.DataFrame
+            list_dateと書類一覧の28項目を列に持つDataFrame。list_date, submitDateTime, docIDの順に並べる。
+        """
+        conditions = []
+        params = []
+        if start is not None:
+            conditions.append('list_date >= ?')
+            params.append(start)
+        if end is not None:
+            conditions.append('list_date <= ?')
+            params.append(end)
+        for name, values in (('docTypeCode', doc_type_codes), ('edinetCode', edinet_codes), ('secCode', sec_codes)):
+            if values:
+                conditions.append(f'"{name}" IN ({", ".join("?" * len(values))})')
+                params.extend(values)
+        if csv_only:
+            conditions.append('csvFlag = \'1\'')
+        if listed_only:
+            conditions.append('legalStatus = \'1\' AND fundCode IS NULL AND secCode IS NOT NULL')
+        where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+        with closing(self._connect()) as conn:
+            df = pd.read_sql_query(f'SELECT * FROM documents {where} ORDER BY list_date, submitDateTime, docID',
+                                   conn, params=params)
+        if latest:
+            df = df.drop_duplicates('docID', keep='last').reset_index(drop=True)
+        return df
+
+    def amendments(self, docIDs: list[str]) -> pd.DataFrame:
+        """
+        指定した書類を訂正した書類(parentDocIDが指定した書類のもの)を返す関数
+        """
+        if not docIDs:
+            return pd.DataFrame(columns=['list_date', *DOCUMENT_FIELDS])
+        with closing(self._connect()) as conn:
+            df = pd.read_sql_query(
+                f'SELECT * FROM documents WHERE parentDocID IN ({", ".join("?" * len(docIDs))}) '
+                f'ORDER BY list_date, submitDateTime, docID', conn, params=list(docIDs))
+        return df.drop_duplicates('docID', keep='last').reset_index(drop=True)
+
+    def import_cache(self, list_dir: str = DOCUMENT_LIST_CACHE_DIR) -> int:
+        """
+        DocumentListCacheに保存された書類一覧のうち、カタログにない日付のものを取り込む関数
+
+        Returns
+        -------
+        int
+            取り込んだ日付の数。
+        """
+        if not os.path.isdir(list_dir):
+            return 0
+        known = set(self.dates())
+        imported = 0
+        for file_name in sorted(os.listdir(list_dir)):
+            list_date = file_name[:-len('.json')]
+            if not file_name.endswith('.json') or list_date in known:
+                continue
+            with open(os.path.join(list_dir, file_name), 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            self.record(list_date, cached.get('response', cached).get('results') or [])
+            imported += 1
+        return imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description='書類のメタデータのカタログを検索する')
+    parser.add_argument('--start', help='書類一覧の日付の下限 (YYYY-MM-DD)')
+    parser.add_argument('--end', help='書類一覧の日付の上限 (YYYY-MM-DD)')
+    parser.add_argument('--doc-type', nargs='*', help='書類種別コード (例: 120 130)')
+    parser.add_argument('--edinet-code', nargs='*', help='EDINETコード')
+    parser.add_argument('--sec-code', nargs='*', help='証券コード(5桁)')
+    parser.add_argument('--csv-only', action='store_true', help='CSVファイルがある書類のみ')
+    parser.add_argument('--listed-only', action='store_true', help='縦覧中で上場している会社の書類のみ')
+    parser.add_argument('--columns', nargs='*', default=['list_date', 'docID', 'edinetCode', 'secCode',
+                                                         'filerName', 'docTypeCode', 'periodEnd', 'parentDocID'])
+    parser.add_argument('--import-cache', action='store_true', help='書類一覧のキャッシュをカタログに取り込む')
+    parser.add_argument('--output', help='結果を保存するCSVファイルのパス')
+    args = parser.parse_args()
+
+    catalog = DocumentCatalog()
+    if args.import_cache:
+        print(f'{catalog.import_cache()}日分の書類一覧を取り込みました。')
+    df = catalog.query(start=args.start, end=args.end, doc_type_codes=args.doc_type, edinet_codes=args.edinet_code,
+                       sec_codes=args.sec_code, csv_only=args.csv_only, listed_only=args.listed_only)
+    df = df[args.columns]
+    if args.output:
+        df.to_csv(args.output, index=False)
+        print(f'{len(df)}件を{args.output}に保存しました。')
+    else:
+        with pd.option_context('display.max_rows', 100, 'display.width', 200):
+            print(df)
+        print(f'{len(df)}件')
+
+
+if __name__ == '__main__':
+    main()
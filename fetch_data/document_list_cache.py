@@ -0,0 +1,104 @@
+import os
+import json
+import time
+import threading
+from datetime import datetime, date
+
+DOCUMENT_LIST_CACHE_DIR = os.path.join('cache', 'document_lists')
+
+
+class DocumentListCache:
+    """
+    EDINET APIの書類一覧のレスポンスを日付ごとに保存しておくキャッシュ。
+
+    書類一覧は `{cache_dir}/{YYYY-MM-DD}.json` に保存される。
+    その日が終わった後に取得した過去の日付の一覧は変わらないため期限なしで使い、
+    当日(またはその日の途中で取得した)一覧は`today_ttl`秒だけ使う。
+
+    Attributes
+    ----------
+    cache_dir : str
+        キャッシュを保存するディレクトリのパス。
+    today_ttl : float
+        当日の書類一覧を使い回す時間(秒)。
+    """
+
+    def __init__(self, cache_dir: str = DOCUMENT_LIST_CACHE_DIR, today_ttl: float = 600):
+        self.cache_dir = cache_dir
+        self.today_ttl = today_ttl
+
+    def path_for(self, list_date: date) -> str:
+        """
+        日付に対応するキャッシュファイルのパスを返す関数
+        """
+        return os.path.join(self.cache_dir, f'{list_date:%Y-%m-%d}.json')
+
+    def is_fresh(self, list_date: date, fetched_at: float, now: float | None = None) -> bool:
+        """
+        キャッシュした書類一覧をそのまま使えるかどうかを返す関数
+
+        Parameters
+        ----------
+        list_date : date
+            書類一覧の日付。
+        fetched_at : float
+            書類一覧を取得した時刻(UNIX時間)。
+        now : float, optional
+            現在時刻(UNIX時間)。省略した場合はtime.time()。
+
+        Returns
+        -------
+        bool
+            その日が終わった後に取得した一覧、またはtoday_ttl秒以内に取得した一覧であればTrue。
+        """
+        if now is None:
+            now = time.time()
+        if datetime.fromtimestamp(fetched_at).date() > list_date:
+            return True
+        return now - fetched_at < self.today_ttl
+
+    def get(self, list_date: date) -> dict | None:
+        """
+        キャッシュした書類一覧を返す関数。存在しないか期限切れの場合はNone。
+        """
+        cache_path = self.path_for(list_date)
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"Ignoring broken document list cache {cache_path}: {e}")
+            return None
+        if not self.is_fresh(list_date, cached['fetched_at']):
+            return None
+        return cached['response']
+
+    def put(self, list_date: date, response: dict, fetched_at: float | None = None) -> str:
+        """
+        書類一覧をキャッシュに保存する関数
+
+        Parameters
+        ----------
+        list_date : date
+            書類一覧の日付。
+        response : dict
+            書類一覧APIのレスポンス。
+        fetched_at : float, optional
+            書類一覧を取得した時刻(UNIX時間)。省略した場合は現在時刻。
+
+        Returns
+        -------
+        str
+            キャッシュファイルのパス。
+        """
+        if fetched_at is None:
+            fetched_at = time.time()
+        cache_path = self.path_for(list_date)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # 書き込み途中のファイルが読まれないように一時ファイルを経由して置き換える
+        tmp_path = f'{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'fetched_at': fetched_at, 'response': response}, f, ensure_ascii=False)
+        os.replace(tmp_path, cache_path)
+        return cache_path
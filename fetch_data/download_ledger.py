@@ -0,0 +1,130 @@
+import time
+import sqlite3
+from contextlib import closing
+
+LEDGER_PATH = 'download_ledger.sqlite3'
+
+# 書類の状態
+DOWNLOADING = 'downloading'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class DownloadLedger:
+    """
+    ダウンロード済みの書類を記録するSQLiteの台帳。
+
+    書類をダウンロードする前にclaim()で書類を確保し、終わったらmark_done()かmark_failed()を呼び出す。
+    確保はBEGIN IMMEDIATEのトランザクションで行うため、cronで同時に動く複数のプロセスやスレッドが
+    同じ書類を二重にダウンロードすることはない。
+
+    Attributes
+    ----------
+    db_path : str
+        台帳のSQLiteファイルのパス。
+    stale_after : float
+        ダウンロード中のまま更新されない書類を、異常終了したプロセスのものとみなして再確保できるまでの時間(秒)。
+    """
+
+    def __init__(self, db_path: str = LEDGER_PATH, stale_after: float = 3600):
+        self.db_path = db_path
+        self.stale_after = stale_after
+        with closing(self._connect()) as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS downloads (
+                    docID TEXT PRIMARY KEY,
+                    secCode TEXT,
+                    status TEXT NOT NULL,
+                    size INTEGER,
+                    checksum TEXT,
+                    error TEXT,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        # スレッド間で接続を共有しないように、操作ごとに接続する
+        return sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+
+    def claim(self, docID: str, secCode: str | None = None) -> bool:
+        """
+        書類をダウンロードするために確保する関数
+
+        Parameters
+        ----------
+        docID : str
+            書類管理番号。
+        secCode : str, optional
+            証券コード。
+
+        Returns
+        -------
+        bool
+            確保できた場合はTrue。ダウンロード済み、または他のプロセスがダウンロード中の場合はFalse。
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT status, updated_at FROM downloads WHERE docID = ?', (docID,)).fetchone()
+            if row is not None:
+                status, updated_at = row
+                if status == DONE or (status == DOWNLOADING and now - updated_at < self.stale_after):
+                    conn.execute('COMMIT')
+                    return False
+            conn.execute(
+                """
+                INSERT INTO downloads (docID, secCode, status, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(docID) DO UPDATE SET secCode = excluded.secCode, status = excluded.status,
+                    error = NULL, updated_at = excluded.updated_at
+                """,
+                (docID, secCode, DOWNLOADING, now),
+            )
+            conn.execute('COMMIT')
+            return True
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+    def mark_done(self, docID: str, size: int, checksum: str) -> None:
+        """
+        書類のダウンロードが完了したことを記録する関数
+
+        Parameters
+        ----------
+        docID : str
+            書類管理番号。
+        size : int
+            保存したファイルのバイト数。
+        checksum : str
+            保存したファイルのSHA-256ハッシュの16進文字列。
+        """
+        with closing(self._connect()) as conn:
+            conn.execute(
+                'UPDATE downloads SET status = ?, size = ?, checksum = ?, error = NULL, updated_at = ? WHERE docID = ?',
+                (DONE, size, checksum, time.time(), docID),
+            )
+
+    def mark_failed(self, docID: str, error: str) -> None:
+        """
+        書類のダウンロードに失敗したことを記録する関数. 失敗した書類は次回の実行で再び確保できる.
+        """
+        with closing(self._connect()) as conn:
+            conn.execute(
+                'UPDATE downloads SET status = ?, error = ?, updated_at = ? WHERE docID = ?',
+                (FAILED, error, time.time(), docID),
+            )
+
+    def status(self, docID: str) -> str | None:
+        """
+        書類の状態を返す関数。台帳にない書類の場合はNone。
+        """
+        with closing(self._connect()) as conn:
+            row = conn.execute('SELECT status FROM downloads WHERE docID = ?', (docID,)).fetchone()
+        return row[0] if row else None
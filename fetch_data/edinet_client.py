@@ -0,0 +1,297 @@
+import os
+import time
+import hashlib
+import zipfile
+import threading
+from datetime import datetime
+import requests
+from requests.adapters import HTTPAdapter
+from edinet.enums.exceptions import (
+    ResponseNot200,
+    BadRequest,
+    InvalidAPIKey,
+    ResourceNotFound,
+    InternalServerError
+)
+from retry import RetryPolicy, CircuitBreaker, parse_retry_after
+
+# EDINET API(バージョン2)のURL. 環境変数EDINET_API_URLで変更できる.
+EDINET_API_URL = "https://api.edinet-fsa.go.jp/api/v2/"
+# ZIPファイルの先頭のシグネチャ
+ZIP_MAGIC = b"PK\x03\x04"
+CHUNK_SIZE = 64 * 1024
+# 書類一覧APIの各書類が持つメタデータの項目
+DOCUMENT_FIELDS = (
+    "docID", "edinetCode", "secCode", "JCN", "filerName", "fundCode", "ordinanceCode",
+    "formCode", "docTypeCode", "periodStart", "periodEnd", "submitDateTime", "docDescription",
+    "issuerEdinetCode", "subjectEdinetCode", "subsidiaryEdinetCode", "currentReportReason",
+    "parentDocID", "opeDateTime", "withdrawalStatus", "docInfoEditStatus", "disclosureStatus",
+    "xbrlFlag", "pdfFlag", "attachDocFlag", "englishDocFlag", "csvFlag", "legalStatus",
+)
+
+
+class CorruptDownloadError(Exception):
+    """
+    ダウンロードしたファイルが壊れている、または期待した内容でない場合に送出される例外
+    """
+
+
+class EdinetClient:
+    """
+    接続を使い回すEDINET APIのクライアント。
+
+    edinet_wrapのEdinetと同じget_document_list()とget_document()を持ち、同じ例外を送出する.
+    全てのリクエストを1つのrequests.Sessionから送るため、keep-aliveによりTCP/TLSの接続が再利用される.
+
+    Attributes
+    ----------
+    base_url : str
+        EDINET APIのURL.
+    pool_size : int
+        ホストごとに保持する接続の最大数. 同時にダウンロードする書類の数以上にする.
+    timeout : tuple of (float, float)
+        接続とレスポンス読み込みのタイムアウト(秒).
+    retry_policy : RetryPolicy
+        接続エラーや429・5xxのレスポンスをリトライする方針.
+    circuit_breaker : CircuitBreaker
+        5xxのレスポンスが続いたときにリクエストを止めるサーキットブレーカー.
+    rate_limiter : TokenBucket or None
+        リトライのリクエストの前にトークンを取り出すトークンバケット. 最初のリクエストは呼び出し側が制限する.
+    """
+
+    def __init__(self, token: str, base_url: str | None = None, pool_size: int = 10,
+                 timeout: tuple[float, float] = (10, 120), retry_policy: RetryPolicy | None = None,
+                 circuit_breaker: CircuitBreaker | None = None, rate_limiter=None):
+        if not isinstance(token, str):
+            raise ValueError("token must be a string")
+        self.__token = token
+        self.base_url = (base_url or os.getenv("EDINET_API_URL") or EDINET_API_URL).rstrip("/") + "/"
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self.rate_limiter = rate_limiter
+        self.session = requests.Session()
+        self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+        self._stats_lock = threading.Lock()
+        self._requests = 0
+        self._retries = 0
+
+    def _request(self, endpoint: str, params: dict, stream: bool = False) -> requests.Response:
+        """
+        EDINET APIにGETリクエストを送る関数. ステータスコードが200以外の場合は例外を送出する.
+
+        接続エラー、タイムアウト、retry_policy.retry_statusesのレスポンスは指数バックオフでリトライする.
+        """
+        params = dict(params, **{"Subscription-Key": self.__token})
+        policy = self.retry_policy
+        for attempt in range(policy.max_attempts):
+            last_attempt = attempt == policy.max_attempts - 1
+            self.circuit_breaker.before_request()
+            try:
+                res = self.session.get(self.base_url + endpoint, params=params, timeout=self.timeout, stream=stream)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                # 試しに通したリクエスト(half-open)が失敗した場合も、サーキットブレーカーを再び止める
+                self.circuit_breaker.record_failure()
+                if last_attempt:
+                    raise
+                delay = policy.delay(attempt)
+                print(f"Retrying {endpoint} in {delay:.1f}s ({attempt + 1}/{policy.max_attempts - 1}): {e}")
+                self._wait_before_retry(delay)
+                continue
+            self._count()
+
+            if res.status_code >= 500:
+                self.circuit_breaker.record_failure()
+            else:
+                self.circuit_breaker.record_success()
+            if res.status_code == 200:
+                return res
+            # ストリーミング時も接続をプールに戻すために本文を読み切る
+            text = res.text
+            if res.status_code in policy.retry_statuses and not last_attempt:
+                delay = policy.delay(attempt, parse_retry_after(res.headers.get("Retry-After")))
+                print(f"Retrying {endpoint} in {delay:.1f}s ({attempt + 1}/{policy.max_attempts - 1}): "
+                      f"status {res.status_code}")
+                self._wait_before_retry(delay)
+                continue
+            if res.status_code == 400:
+                raise BadRequest(res.status_code, text)
+            elif res.status_code == 401:
+                raise InvalidAPIKey(res.status_code, text)
+            elif res.status_code == 404:
+                raise ResourceNotFound(res.status_code, text)
+            elif res.status_code == 500:
+                raise InternalServerError(res.status_code, text)
+            else:
+                raise ResponseNot200(res.status_code, text)
+
+    def _wait_before_retry(self, delay: float):
+        # リトライもリクエストの速さの上限に含める
+        self._count(retry=True)
+        time.sleep(delay)
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+
+    def _count(self, retry: bool = False):
+        with self._stats_lock:
+            if retry:
+                self._retries += 1
+            else:
+                self._requests += 1
+
+    def get_document_list(self, date: datetime, withdocs: bool = False) -> dict:
+        """
+        `documents.json`エンドポイントから指定した日の書類一覧を取得する関数
+
+        Parameters
+        ----------
+        date : datetime
+            取得する日付.
+        withdocs : bool
+            提出書類一覧を含めるかどうか.
+        """
+        params = {
+            "date": date.strftime("%Y-%m-%d"),
+            "type": 2 if withdocs else 1,
+        }
+        return self._request("documents.json", params).json()
+
+    def get_document(self, docId: str, type: int) -> bytes:
+        """
+        書類を取得する関数
+
+        Parameters
+        ----------
+        docId : str
+            書類管理番号.
+        type : int
+            1: 提出本文書及び監査報告書、XBRL, 2: PDF, 3: 代替書面・添付文書, 4: 英文ファイル, 5: CSV.
+        """
+        if type not in (1, 2, 3, 4, 5):
+            raise ValueError("type must be one of 1, 2, 3, 4, 5")
+        return self._request(f"documents/{docId}", {"type": type}).content
+
+    def download_document(self, docId: str, type: int, dest_path: str, required_prefix: str | None = None,
+                          chunk_size: int = CHUNK_SIZE) -> tuple[int, str]:
+        """
+        書類をチャンクごとに一時ファイルへ書き込み、検証してからdest_pathに置き換える関数
+
+        書類全体をメモリに持たないため、同時に多くの書類をダウンロードしてもメモリ使用量は増えない.
+        ダウンロード中に最初のチャンクがZIPのシグネチャで始まること、Content-Lengthと長さが一致することを確認し、
+        最後にZIPの中央ディレクトリを読み込んでrequired_prefixで始まるエントリがあることを確認する.
+        壊れたファイルはdest_pathに置かれない. 途中で切れた場合や壊れていた場合はretry_policyに従ってリトライする.
+
+        Parameters
+        ----------
+        docId : str
+            書類管理番号.
+        type : int
+            1: 提出本文書及び監査報告書、XBRL, 2: PDF, 3: 代替書面・添付文書, 4: 英文ファイル, 5: CSV.
+        dest_path : str
+            保存先のパス.
+        required_prefix : str, optional
+            ZIPに含まれていなければならないエントリ名の先頭(例: "XBRL_TO_CSV/").
+        chunk_size : int
+            1回に読み込むバイト数.
+
+        Returns
+        -------
+        tuple of (int, str)
+            ファイルのバイト数とSHA-256ハッシュの16進文字列.
+        """
+        if type not in (1, 2, 3, 4, 5):
+            raise ValueError("type must be one of 1, 2, 3, 4, 5")
+        policy = self.retry_policy
+        tmp_path = f"{dest_path}.{os.getpid()}.{threading.get_ident()}.part"
+        for attempt in range(policy.max_attempts):
+            try:
+                size, checksum = self._stream_to_file(docId, type, tmp_path, chunk_size)
+                names = self._zip_names(tmp_path)
+            # 接続エラーは_requestがリトライし尽くした後なので、ここでは本文の途中で切れた場合のみリトライする
+            except (CorruptDownloadError, requests.exceptions.ChunkedEncodingError) as e:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                if attempt == policy.max_attempts - 1:
+                    raise
+                delay = policy.delay(attempt)
+                print(f"Retrying download of {docId} in {delay:.1f}s ({attempt + 1}/{policy.max_attempts - 1}): {e}")
+                self._wait_before_retry(delay)
+                continue
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            # 中身が足りないZIPはダウンロードし直しても変わらないのでリトライしない
+            if required_prefix is not None and not any(name.startswith(required_prefix) for name in names):
+                os.remove(tmp_path)
+                raise CorruptDownloadError(f"{docId} does not contain {required_prefix}")
+            os.replace(tmp_path, dest_path)
+            return size, checksum
+
+    def _stream_to_file(self, docId: str, type: int, tmp_path: str, chunk_size: int) -> tuple[int, str]:
+        res = self._request(f"documents/{docId}", {"type": type}, stream=True)
+        # 圧縮して送られた場合はContent-Lengthと展開後の長さが一致しない
+        expected_size = None if res.headers.get("Content-Encoding") else res.headers.get("Content-Length")
+        size = 0
+        sha256 = hashlib.sha256()
+        with res, open(tmp_path, "wb") as f:
+            try:
+                for chunk in res.iter_content(chunk_size=chunk_size):
+                    if size == 0 and not chunk.startswith(ZIP_MAGIC):
+                        raise CorruptDownloadError(f"{docId} is not a ZIP file: {chunk[:64]!r}")
+                    f.write(chunk)
+                    sha256.update(chunk)
+                    size += len(chunk)
+            except requests.exceptions.ConnectionError as e:
+                # 本文の読み込み中のタイムアウトは途中で切れたダウンロードとして扱う
+                raise CorruptDownloadError(f"{docId} was interrupted after {size} bytes: {e}")
+        if size == 0:
+            raise CorruptDownloadError(f"{docId} is empty")
+        if expected_size is not None and size != int(expected_size):
+            raise CorruptDownloadError(f"{docId} is truncated: {size} of {expected_size} bytes")
+        return size, sha256.hexdigest()
+
+    @staticmethod
+    def _zip_names(path: str) -> list[str]:
+        # 中央ディレクトリを読み込めれば末尾まで揃っている. 展開はしない.
+        try:
+            with zipfile.ZipFile(path) as zip_ref:
+                return zip_ref.namelist()
+        except zipfile.BadZipFile as e:
+            raise CorruptDownloadError(f"{path} is not a valid ZIP file: {e}")
+
+    def connection_stats(self) -> dict:
+        """
+        接続の再利用状況を返す関数
+
+        Returns
+        -------
+        dict
+            requests: 送ったリクエストの数, connections: 新しく張った接続の数,
+            reused: 既存の接続を再利用したリクエストの数, reuse_rate: 再利用率, retries: リトライの回数.
+        """
+        connections = 0
+        pool_requests = 0
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is not None:
+                connections += pool.num_connections
+                pool_requests += pool.num_requests
+        with self._stats_lock:
+            total = self._requests
+            retries = self._retries
+        reused = max(pool_requests - connections, 0)
+        return {
+            "requests": total,
+            "connections": connections,
+            "reused": reused,
+            "reuse_rate": reused / pool_requests if pool_requests else 0.0,
+            "retries": retries,
+        }
+
+    def close(self):
+        self.session.close()
@@ -1,11 +1,16 @@
-from edinet import Edinet
+from edinet_client import EdinetClient, DOCUMENT_FIELDS
 from datetime import datetime
-import json
-import requests                                  
 import os
 from dotenv import load_dotenv
-import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from rate_limiter import TokenBucket
+from document_list_cache import DocumentListCache
+from download_ledger import DownloadLedger
+from document_catalog import DocumentCatalog
 
+# 取得する書類種別コード. 訂正報告書も取得し、filing_index.pyで同じ会社・期間の最新の書類を選ぶ.
+TARGET_DOC_TYPE_CODES = ("120", "130")  # 有価証券報告書, 訂正有価証券報告書
 
 
 class Document:
@@ -86,70 +91,184 @@ class Document:
         return f"{self.secCode}: {self.filerName} ({self.docID})"
 
 class EdinetDataFetcher():
-    def __init__(self, dates_string: str, sleep_time=1, fetch_today=False):   
+    def __init__(self, dates_string: str, sleep_time=1, fetch_today=False, concurrency=1, rate_limiter=None,
+                 client=None, document_list_cache=None, ledger=None,
+                 on_downloaded=None, catalog=None):   
         self.date_string = dates_string
         self.sleep_time = sleep_time
         self.fetch_today = fetch_today
+        self.concurrency = concurrency
+        self.client = client
+        if document_list_cache is None:
+            document_list_cache = DocumentListCache()
+        self.document_list_cache = document_list_cache
+        if ledger is None:
+            ledger = DownloadLedger()
+        self.ledger = ledger
+        self.on_downloaded = on_downloaded
+        if catalog is None:
+            catalog = DocumentCatalog()
+        self.catalog = catalog
+        if rate_limiter is None and sleep_time > 0:
+            rate_limiter = TokenBucket(rate=1 / sleep_time)
+        self.rate_limiter = rate_limiter
         """
         Args:
         dates_string (str): 取得する日付の文字列（YYYY-MM-DD）.
-        sleep_time (int): スリープ時間（秒）デフォルトは1秒.
+        sleep_time (int): リクエストの間隔（秒）デフォルトは1秒. rate_limiterを省略した場合に1/sleep_time回/秒に制限する.
+        concurrency (int): 同時にダウンロードする書類の数. 2以上の場合はasyncioで並行にダウンロードする.
+        rate_limiter (TokenBucket): リクエストの速さを制限するトークンバケット. 複数のfetcherで共有できる.
+        client (EdinetClient): 接続を使い回すAPIクライアント. 省略した場合はfetch_data()で作成する. 複数のfetcherで共有できる.
+        document_list_cache (DocumentListCache): 書類一覧のキャッシュ. 過去の日付の一覧は再取得しない.
+        ledger (DownloadLedger): ダウンロード済みの書類の台帳. 台帳に記録された書類は再ダウンロードしない.
+        on_downloaded (callable): 書類をZIPsに保存するたびにZIPファイルのパスを引数として呼び出される関数. ダウンロードしたスレッドから呼び出される.
+        catalog (DocumentCatalog): 書類一覧の全ての書類のメタデータを保存するカタログ.
+        """
+
+    def _wait_for_rate_limit(self):
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+
+    async def _wait_for_rate_limit_async(self):
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire_async()
+
+    def _specified_date(self) -> datetime:
+        if self.fetch_today:
+            return datetime.today()
+        return datetime.strptime(self.date_string, "%Y-%m-%d")
+
+    def list_target_documents(self, edn: EdinetClient) -> list[Document]:
+        """
+        指定した日の書類一覧から取得対象の書類を返す関数
+
+        書類がCSVファイルで、縦覧可能で、有価証券報告書で、ファンドでなく上場している書類を対象とする.
+        書類一覧の全ての書類のメタデータはカタログに保存する.
+        """
+        specified_date = self._specified_date()
+        list_date = f"{specified_date:%Y-%m-%d}"
+        doc_list = self.document_list_cache.get(specified_date.date())
+        if doc_list is None:
+            self._wait_for_rate_limit()
+            doc_list = edn.get_document_list(specified_date, withdocs=True)
+            self.document_list_cache.put(specified_date.date(), doc_list)
+            self.catalog.record(list_date, doc_list["results"])
+        else:
+            print(f"Using cached document list for {list_date}")
+            if not self.catalog.has_date(list_date):
+                self.catalog.record(list_date, doc_list["results"])
+
+        documents = []
+        for document in doc_list["results"]:
+            # 対象の書類のみDocumentにする
+            if document['csvFlag'] == '1' and document['legalStatus'] == '1' and document['docTypeCode'] in TARGET_DOC_TYPE_CODES and document['fundCode'] is None and document['secCode'] is not None:
+                documents.append(Document(**{name: document[name] for name in DOCUMENT_FIELDS}))
+        return documents
+
+    def _zip_path(self, doc: Document) -> str:
+        return f"ZIPs/{doc.docID}_{doc.secCode}.zip"
+
+    def _download(self, edn: EdinetClient, doc: Document) -> str:
+        """
+        台帳で確保済みの書類をダウンロードして保存し、結果を台帳に記録する関数
+
+        書類は一時ファイルにストリーミングし、XBRL_TO_CSV/を含む正しいZIPであることを確認してからZIPsに置く.
+        リトライしても失敗した書類は台帳に記録して読み飛ばす. 次回の実行で再びダウンロードされる.
+
+        Returns
+        -------
+        str
+            "downloaded"または"failed".
+        """
+        try:
+            size, checksum = edn.download_document(doc.docID, 5, self._zip_path(doc), required_prefix="XBRL_TO_CSV/")
+        except Exception as e:
+            print(f"Failed to fetch {doc}: {e}")
+            self.ledger.mark_failed(doc.docID, repr(e))
+            return "failed"
+        self.ledger.mark_done(doc.docID, size, checksum)
+        if self.on_downloaded is not None:
+            self.on_downloaded(self._zip_path(doc))
+        return "downloaded"
+
+    def fetch_data(self) -> dict:
+        """
+        指定した日の対象書類をZIPsディレクトリにダウンロードする関数
+
+        Returns
+        -------
+        dict
+            date: 日付, documents: 対象書類の数, downloaded: ダウンロードした数,
+            skipped: ダウンロード済みで読み飛ばした数, failed: 失敗した書類のdocIDのリスト.
         """
-    
-    def fetch_data(self):
         # .envファイルから環境変数を読み込む
         load_dotenv()
 
         # APIのトークンを環境変数から取得
         API_TOKEN = os.getenv("API_TOKEN")
 
-        if not API_TOKEN:
-            raise ValueError("API_TOKEN is not set in the environment variables")
-
-        edn = Edinet(API_TOKEN)
+        if self.client is None:
+            if not API_TOKEN:
+                raise ValueError("API_TOKEN is not set in the environment variables")
+            # 同時にダウンロードする書類の数だけ接続を保持する
+            self.client = EdinetClient(API_TOKEN, pool_size=max(self.concurrency, 1), rate_limiter=self.rate_limiter)
+        edn = self.client
 
         # ドキュメントのリストを取得
-        if self.fetch_today:
-            specified_date = datetime.today()
+        documents = self.list_target_documents(edn)
+
+        if self.concurrency > 1:
+            results = asyncio.run(self._fetch_documents_async(edn, documents))
         else:
-            specified_date = datetime.strptime(self.date_string, "%Y-%m-%d")
-        doc_list = edn.get_document_list(specified_date, withdocs=True)
+            results = []
+            for doc in documents:
+                if not self.ledger.claim(doc.docID, doc.secCode):
+                    print(f"Skipping {doc} (already downloaded)")
+                    results.append("skipped")
+                    continue
+                self._wait_for_rate_limit()
+                print(doc)
+                results.append(self._download(edn, doc))
 
-        for document in doc_list["results"]:
-            doc = Document(
-                docID=document["docID"],
-                edinetCode=document["edinetCode"],
-                secCode=document["secCode"],
-                JCN=document["JCN"],
-                filerName=document["filerName"],
-                fundCode=document["fundCode"],
-                ordinanceCode=document["ordinanceCode"],
-                formCode=document["formCode"],
-                docTypeCode=document["docTypeCode"],
-                periodStart=document["periodStart"],
-                periodEnd=document["periodEnd"],
-                submitDateTime=document["submitDateTime"],
-                docDescription=document["docDescription"],
-                issuerEdinetCode=document["issuerEdinetCode"],
-                subjectEdinetCode=document["subjectEdinetCode"],
-                subsidiaryEdinetCode=document["subsidiaryEdinetCode"],
-                currentReportReason=document["currentReportReason"],
-                parentDocID=document["parentDocID"],
-                opeDateTime=document["opeDateTime"],
-                withdrawalStatus=document["withdrawalStatus"],
-                docInfoEditStatus=document["docInfoEditStatus"],
-                disclosureStatus=document["disclosureStatus"],
-                xbrlFlag=document["xbrlFlag"],
-                pdfFlag=document["pdfFlag"],
-                attachDocFlag=document["attachDocFlag"],
-                englishDocFlag=document["englishDocFlag"],
-                csvFlag=document["csvFlag"],
-                legalStatus=document["legalStatus"]
-            )
-            #書類がCSVファイルで、縦覧可能で、有価証券報告書で、ファンドでなく上場している場合にcsvファイルを取得.
-            if doc.csvFlag == '1' and doc.legalStatus == '1' and doc.docTypeCode == "120"and doc.fundCode is None and doc.secCode is not None:
+        stats = edn.connection_stats()
+        print(f"Connections: {stats['connections']} opened for {stats['requests']} requests "
+              f"(reuse rate {stats['reuse_rate']:.0%}, {stats['retries']} retries)")
+        failed = [doc.docID for doc, result in zip(documents, results) if result == "failed"]
+        if failed:
+            print(f"Failed to fetch {len(failed)} documents: {', '.join(failed)}")
+        return {
+            "date": f"{self._specified_date():%Y-%m-%d}",
+            "documents": len(documents),
+            "downloaded": results.count("downloaded"),
+            "skipped": results.count("skipped"),
+            "failed": failed,
+        }
+
+    async def _fetch_documents_async(self, edn: EdinetClient, documents: list[Document]) -> list[str]:
+        """
+        最大concurrency件の書類を並行にダウンロードするコルーチン
+
+        リクエストの開始はrate_limiterで制限するため、同時接続数を増やしてもリクエストの速さは上限を超えない.
+        書類ごとの結果("downloaded", "skipped", "failed")を返す.
+        台帳の操作などダウンロード以外で例外が起きた場合は、全ての書類の処理が終わった後に最初の例外を送出する.
+        """
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def fetch(doc: Document):
+            async with semaphore:
+                if not await loop.run_in_executor(executor, self.ledger.claim, doc.docID, doc.secCode):
+                    print(f"Skipping {doc} (already downloaded)")
+                    return "skipped"
+                await self._wait_for_rate_limit_async()
                 print(doc)
-                doc_data = edn.get_document(doc.docID, 5)
-                with open(f"ZIPs/{doc.docID}_{doc.secCode}.zip", "wb") as f:
-                    f.write(doc_data)
-                time.sleep(self.sleep_time)
+                return await loop.run_in_executor(executor, self._download, edn, doc)
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            results = await asyncio.gather(*(fetch(doc) for doc in documents), return_exceptions=True)
+        errors = [(doc, result) for doc, result in zip(documents, results) if isinstance(result, Exception)]
+        for doc, error in errors:
+            print(f"Failed to fetch {doc}: {error}")
+        if errors:
+            raise errors[0][1]
+        return results
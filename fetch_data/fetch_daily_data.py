@@ -2,6 +2,6 @@
 
 from edinet_data_fetcher import EdinetDataFetcher
 
-fetcher = EdinetDataFetcher("2021-01-01", fetch_today=True)
+fetcher = EdinetDataFetcher("2021-01-01", fetch_today=True, concurrency=4)
 fetcher.fetch_data()
 # main()
\ No newline at end of file
@@ -0,0 +1,59 @@
+import time
+import asyncio
+import threading
+
+
+class TokenBucket:
+    """
+    トークンバケット方式のレート制限。
+
+    `rate`個/秒の速さでトークンが補充され、最大`capacity`個まで貯まる。
+    リクエストの前にトークンを1つ取り出すことで、平均のリクエスト数を`rate`回/秒以下に抑える。
+    スレッド間で共有でき、同期処理からはacquire()、asyncioからはacquire_async()を呼び出す。
+
+    Attributes
+    ----------
+    rate : float
+        1秒あたりに補充されるトークンの数。
+    capacity : float
+        貯められるトークンの最大数(連続して送れるリクエストの数)。
+    """
+
+    def __init__(self, rate: float, capacity: float = 1):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """
+        トークンを1つ予約し、使えるようになるまでの待ち時間(秒)を返す。
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            # 不足分が補充されるまで待つ(予約済みなので他の呼び出しはさらに後ろに並ぶ)
+            return -self._tokens / self.rate
+
+    def acquire(self) -> None:
+        """
+        トークンが使えるようになるまで待つ関数
+        """
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self) -> None:
+        """
+        トークンが使えるようになるまで待つコルーチン
+        """
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
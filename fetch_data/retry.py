@@ -0,0 +1,138 @@
+import time
+import random
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+
+class CircuitOpenError(Exception):
+    """
+    サーバーエラーが続いたためにリクエストを止めている間に送出される例外
+    """
+
+
+class RetryPolicy:
+    """
+    指数バックオフとジッターによるリトライの方針。
+
+    n回目(0始まり)のリトライの前に0から`min(max_delay, base_delay * 2**n)`秒の間でランダムに待つ(フルジッター)。
+    サーバーがRetry-Afterヘッダーを返した場合は、その時間以上待つ。
+
+    Attributes
+    ----------
+    max_attempts : int
+        最初のリクエストを含めた最大の試行回数。
+    base_delay : float
+        待ち時間の基準(秒)。
+    max_delay : float
+        待ち時間の上限(秒)。
+    retry_statuses : tuple of int
+        リトライするHTTPステータスコード。
+    """
+
+    def __init__(self, max_attempts: int = 5, base_delay: float = 1, max_delay: float = 60,
+                 retry_statuses: tuple[int, ...] = (429, 500, 502, 503, 504)):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_statuses = retry_statuses
+
+    def delay(self, attempt: int, retry_after: float | None = None) -> float:
+        """
+        リトライの前に待つ時間(秒)を返す関数
+
+        Parameters
+        ----------
+        attempt : int
+            失敗した試行の番号(0始まり)。
+        retry_after : float, optional
+            サーバーが指定した待ち時間(秒)。
+
+        Returns
+        -------
+        float
+            待ち時間(秒)。
+        """
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """
+    Retry-Afterヘッダーの値を待ち時間(秒)に変換する関数
+
+    Parameters
+    ----------
+    value : str or None
+        秒数またはHTTP日付。
+
+    Returns
+    -------
+    float or None
+        待ち時間(秒)。ヘッダーがないか解釈できない場合はNone。
+    """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+class CircuitBreaker:
+    """
+    サーバーエラー(5xx)、接続エラー、タイムアウトが続いたときにリクエストを一時的に止めるサーキットブレーカー。
+
+    `failure_threshold`回連続で失敗すると`reset_timeout`秒の間は全てのリクエストをCircuitOpenErrorで失敗させる。
+    その後は1回だけ試しにリクエストを通し、成功すれば元に戻り、失敗すれば再び止める。
+    スレッド間で共有できる。
+
+    Attributes
+    ----------
+    failure_threshold : int
+        リクエストを止めるまでの連続失敗回数。
+    reset_timeout : float
+        リクエストを止める時間(秒)。
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 60):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def before_request(self) -> None:
+        """
+        リクエストを送ってよいか確認する関数. 止めている間はCircuitOpenErrorを送出する.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return
+            remaining = self.reset_timeout - (time.monotonic() - self._opened_at)
+            if remaining > 0 or self._trial:
+                raise CircuitOpenError(f"too many server errors; requests are paused for {max(remaining, 0):.0f}s")
+            self._trial = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._trial or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._trial = False
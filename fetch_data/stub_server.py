@@ -0,0 +1,347 @@
+import io
+import os
+import json
+import time
+import random
+import zipfile
+import argparse
+import threading
+from collections import Counter, deque
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from edinet_client import DOCUMENT_FIELDS
+from document_list_cache import DOCUMENT_LIST_CACHE_DIR
+
+API_PREFIX = '/api/v2/'
+# 合成する有価証券報告書のCSVファイルの列
+CSV_COLUMNS = ('要素ID', '項目名', 'コンテキストID', '相対年度', '連結・個別', '期間・時点', 'ユニットID', '単位', '値')
+# 合成する有価証券報告書に含める要素ID, コンテキストID, 単位
+SYNTHETIC_FACTS = (
+    ('jppfs_cor:Assets', 'CurrentYearInstant', '円'),
+    ('jppfs_cor:CurrentAssets', 'CurrentYearInstant', '円'),
+    ('jppfs_cor:NoncurrentAssets', 'CurrentYearInstant', '円'),
+    ('jppfs_cor:Liabilities', 'CurrentYearInstant', '円'),
+    ('jppfs_cor:CurrentLiabilities', 'CurrentYearInstant', '円'),
+    ('jppfs_cor:NoncurrentLiabilities', 'CurrentYearInstant', '円'),
+    ('jppfs_cor:NetAssets', 'CurrentYearInstant', '円'),
+    ('jpcrp_cor:NetSalesSummaryOfBusinessResults', 'CurrentYearDuration', '円'),
+    ('jppfs_cor:OperatingIncome', 'CurrentYearDuration', '円'),
+    ('jppfs_cor:ProfitLoss', 'CurrentYearDuration', '円'),
+)
+
+
+def synthetic_document_list(date: str, docs_per_day: int, seed: int = 0) -> dict:
+    """
+    日付から決まる合成の書類一覧を返す関数
+
+    有価証券報告書(docTypeCode 120)と訂正有価証券報告書(130)の他に、取得対象外の書類(140、ファンド、CSVなし)も含める。
+
+    Parameters
+    ----------
+    date : str
+        日付(YYYY-MM-DD)。
+    docs_per_day : int
+        1日あたりの書類の数。
+    seed : int
+        乱数のシード。
+
+    Returns
+    -------
+    dict
+        書類一覧APIと同じ形式のレスポンス。
+    """
+    rng = random.Random(f'{seed}-{date}')
+    day = date.replace('-', '')
+    results = []
+    for i in range(docs_per_day):
+        doc = {name: None for name in DOCUMENT_FIELDS}
+        kind = rng.random()
+        doc.update({
+            'docID': f'S{day[2:]}{i:03d}',
+            'edinetCode': f'E{rng.randrange(1, 40000):05d}',
+            'secCode': f'{rng.randrange(1300, 9999)}0',
+            'filerName': f'合成株式会社{i}',
+            'ordinanceCode': '010',
+            'formCode': '030000',
+            'docTypeCode': '120' if kind < 0.7 else '130' if kind < 0.8 else '140',
+            'periodStart': f'{int(date[:4]) - 1}-04-01',
+            'periodEnd': f'{date[:4]}-03-31',
+            'submitDateTime': f'{date} {9 + i % 8:02d}:{i % 60:02d}',
+            'docDescription': '有価証券報告書',
+            'withdrawalStatus': '0', 'docInfoEditStatus': '0', 'disclosureStatus': '0',
+            'xbrlFlag': '1', 'pdfFlag': '1', 'attachDocFlag': '0', 'englishDocFlag': '0',
+            'csvFlag': '0' if kind > 0.95 else '1',
+            'legalStatus': '1',
+        })
+        if doc['docTypeCode'] == '130':
+            # 訂正報告書は同じ日の1つ前の書類を訂正したことにする
+            doc['parentDocID'] = f'S{day[2:]}{max(i - 1, 0):03d}'
+            doc['docDescription'] = '訂正有価証券報告書'
+        if 0.9 < kind <= 0.95:
+            doc['fundCode'] = f'G{i:05d}'
+            doc['secCode'] = None
+        results.append(doc)
+    return {
+        'metadata': {'title': '提出された書類を把握するためのAPI', 'parameter': {'date': date, 'type': '2'},
+                     'resultset': {'count': len(results)}, 'processDateTime': f'{date} 23:59', 'status': '200',
+                     'message': 'OK'},
+        'results': results,
+    }
+
+
+def synthetic_zip(docID: str, rows: int = 2000, seed: int = 0) -> bytes:
+    """
+    docIDから決まる合成の有価証券報告書のZIPファイルを返す関数
+
+    EDINETのCSVファイルと同じく、XBRL_TO_CSV/内にUTF-16LEのタブ区切りのCSVファイルを含める。
+
+    Parameters
+    ----------
+    docID : str
+        書類管理番号。
+    rows : int
+        主要な指標以外に含める行の数。
+    seed : int
+        乱数のシード。
+
+    Returns
+    -------
+    bytes
+        ZIPファイルの内容。
+    """
+    rng = random.Random(f'{seed}-{docID}')
+    lines = ['\t'.join(CSV_COLUMNS)]
+    lines.append('\t'.join(('jpcrp_cor:CompanyNameCoverPage', '会社名', 'FilingDateInstant', '提出日時点',
+                            'その他', '時点', '－', '－', f'合成株式会社{docID}')))
+    lines.append('\t'.join(('jpdei_cor:CurrentPeriodEndDateDEI', '当会計期間終了日', 'FilingDateInstant',
+                            '提出日時点', 'その他', '時点', '－', '－', '2024-03-31')))
+    for element_id, context_id, unit in SYNTHETIC_FACTS:
+        lines.append('\t'.join((element_id, element_id.split(':')[1], context_id, '当期', '連結', '時点',
+                                'JPY', unit, str(rng.randrange(10 ** 9, 10 ** 13)))))
+    for i in range(rows):
+        lines.append('\t'.join((f'jpcrp_cor:SyntheticElement{i}', f'合成要素{i}', 'CurrentYearDuration', '当期',
+                                '連結', '期間', 'JPY', '円', str(rng.randrange(10 ** 6)))))
+    csv = ('\n'.join(lines) + '\n').encode('utf-16le')
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zip_ref:
+        zip_ref.writestr(f'XBRL_TO_CSV/jpcrp030000-asr-001_{docID}_2024-03-31_01_2024-06-25.csv', csv)
+    return buffer.getvalue()
+
+
+class StubEdinet:
+    """
+    EDINET API(バージョン2)の代わりに書類一覧とZIPファイルを返すサーバーの状態。
+
+    書類一覧は`list_dir`内の`{YYYY-MM-DD}.json`(DocumentListCacheの形式またはAPIのレスポンスそのもの)、
+    ZIPファイルは`zip_dir`内の`{docID}.zip`または`{docID}_*.zip`があればそれを返し、なければ合成する。
+
+    Attributes
+    ----------
+    latency : float
+        レスポンスを返すまでの平均の待ち時間(秒)。
+    jitter : float
+        待ち時間のばらつき(秒)。latency±jitterの一様分布。
+    error_rate : float
+        500または503を返す確率。
+    truncate_rate : float
+        ZIPファイルを途中までしか送らない確率。
+    rate_limit : float or None
+        1秒あたりに受け付けるリクエストの数。超えた場合は429とRetry-Afterを返す。
+    """
+
+    def __init__(self, list_dir: str | None = DOCUMENT_LIST_CACHE_DIR, zip_dir: str | None = None,
+                 docs_per_day: int = 20, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 truncate_rate: float = 0.0, rate_limit: float | None = None, seed: int = 0):
+        self.list_dir = list_dir
+        self.zip_dir = zip_dir
+        self.docs_per_day = docs_per_day
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.truncate_rate = truncate_rate
+        self.rate_limit = rate_limit
+        self.seed = seed
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._tokens = 1.0
+        self._updated = time.monotonic()
+        self._zips = {}
+        self._arrivals = deque()
+        self.statuses = Counter()
+        self.max_requests_per_second = 0
+        self.bytes_sent = 0
+
+    def document_list(self, date: str) -> dict:
+        if self.list_dir is not None:
+            list_path = os.path.join(self.list_dir, f'{date}.json')
+            if os.path.exists(list_path):
+                with open(list_path, 'r', encoding='utf-8') as f:
+                    cached = json.load(f)
+                return cached.get('response', cached)
+        return synthetic_document_list(date, self.docs_per_day, self.seed)
+
+    def document(self, docID: str) -> bytes:
+        if self.zip_dir is not None and os.path.isdir(self.zip_dir):
+            for file_name in os.listdir(self.zip_dir):
+                if file_name == f'{docID}.zip' or (file_name.startswith(f'{docID}_') and file_name.endswith('.zip')):
+                    with open(os.path.join(self.zip_dir, file_name), 'rb') as f:
+                        return f.read()
+        with self._lock:
+            if docID not in self._zips:
+                self._zips[docID] = synthetic_zip(docID, seed=self.seed)
+            return self._zips[docID]
+
+    def admit(self) -> float | None:
+        """
+        リクエストを記録し、レート制限を超えている場合はRetry-Afterの秒数を返す関数
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._arrivals.append(now)
+            while self._arrivals and now - self._arrivals[0] > 1.0:
+                self._arrivals.popleft()
+            self.max_requests_per_second = max(self.max_requests_per_second, len(self._arrivals))
+            if self.rate_limit is None:
+                return None
+            self._tokens = min(1.0, self._tokens + (now - self._updated) * self.rate_limit)
+            self._updated = now
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return None
+            return (1.0 - self._tokens) / self.rate_limit
+
+    def roll(self, probability: float) -> bool:
+        with self._lock:
+            return self._rng.random() < probability
+
+    def delay(self) -> float:
+        with self._lock:
+            return max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'requests': sum(self.statuses.values()),
+                'statuses': dict(self.statuses),
+                'max_requests_per_second': self.max_requests_per_second,
+                'bytes_sent': self.bytes_sent,
+            }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    stub: StubEdinet = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str = 'application/json',
+              headers: dict | None = None, truncate: bool = False):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if truncate:
+            # 途中で接続を切り、受け取り側に切れたレスポンスを見せる
+            body = body[:len(body) // 2]
+            self.close_connection = True
+        self.wfile.write(body)
+        with self.stub._lock:
+            self.stub.statuses[status] += 1
+            self.stub.bytes_sent += len(body)
+
+    def _send_json(self, status: int, data: dict, headers: dict | None = None):
+        self._send(status, json.dumps(data, ensure_ascii=False).encode('utf-8'), headers=headers)
+
+    def do_GET(self):
+        stub = self.stub
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if url.path == '/stats':
+            return self._send_json(200, stub.stats())
+        retry_after = stub.admit()
+        if retry_after is not None:
+            return self._send_json(429, {'message': 'Too Many Requests'},
+                                   headers={'Retry-After': f'{max(1, round(retry_after + 0.5))}'})
+        time.sleep(stub.delay())
+        if not url.path.startswith(API_PREFIX):
+            return self._send_json(404, {'message': 'Not Found'})
+        if not query.get('Subscription-Key'):
+            return self._send_json(401, {'statusCode': 401, 'message': 'Access denied due to invalid subscription key.'})
+        if stub.roll(stub.error_rate):
+            status = 500 if stub.roll(0.5) else 503
+            return self._send_json(status, {'message': 'Injected error'}, headers={'Retry-After': '1'})
+
+        endpoint = url.path[len(API_PREFIX):]
+        if endpoint == 'documents.json':
+            try:
+                date = datetime.strptime(query.get('date', ''), '%Y-%m-%d').strftime('%Y-%m-%d')
+            except ValueError:
+                return self._send_json(400, {'metadata': {'status': '400', 'message': 'Invalid date'}})
+            return self._send_json(200, stub.document_list(date))
+        if endpoint.startswith('documents/'):
+            docID = endpoint[len('documents/'):]
+            return self._send(200, stub.document(docID), content_type='application/octet-stream',
+                              truncate=stub.roll(stub.truncate_rate))
+        return self._send_json(404, {'message': 'Not Found'})
+
+
+def start_stub_server(stub: StubEdinet, host: str = '127.0.0.1', port: int = 0) -> tuple[ThreadingHTTPServer, str]:
+    """
+    スタブサーバーをバックグラウンドのスレッドで起動する関数
+
+    Parameters
+    ----------
+    stub : StubEdinet
+        サーバーの状態。
+    host : str
+        待ち受けるホスト。
+    port : int
+        待ち受けるポート。0の場合は空いているポートを使う。
+
+    Returns
+    -------
+    tuple of (ThreadingHTTPServer, str)
+        サーバーと、環境変数EDINET_API_URLに設定するURL。
+    """
+    handler = type('BoundStubHandler', (StubHandler,), {'stub': stub})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='stub-edinet', daemon=True).start()
+    return server, f'http://{host}:{server.server_port}{API_PREFIX}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='EDINET APIの代わりに書類一覧とZIPファイルを返すローカルサーバー')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--lists', default=DOCUMENT_LIST_CACHE_DIR, help='記録した書類一覧のディレクトリ')
+    parser.add_argument('--zips', default=None, help='記録したZIPファイルのディレクトリ')
+    parser.add_argument('--docs-per-day', type=int, default=20, help='合成する1日あたりの書類の数')
+    parser.add_argument('--latency', type=float, default=0.0, help='平均の待ち時間(秒)')
+    parser.add_argument('--jitter', type=float, default=0.0, help='待ち時間のばらつき(秒)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='500/503を返す確率')
+    parser.add_argument('--truncate-rate', type=float, default=0.0, help='ZIPファイルを途中で切る確率')
+    parser.add_argument('--rate-limit', type=float, default=None, help='1秒あたりに受け付けるリクエストの数')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    stub = StubEdinet(list_dir=args.lists, zip_dir=args.zips, docs_per_day=args.docs_per_day,
+                      latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                      truncate_rate=args.truncate_rate, rate_limit=args.rate_limit, seed=args.seed)
+    server, url = start_stub_server(stub, args.host, args.port)
+    print(f'Stub EDINET API listening on {url}')
+    print(f'Run the fetcher with EDINET_API_URL={url} API_TOKEN=dummy, statistics at http://{args.host}:{server.server_port}/stats')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print(json.dumps(stub.stats(), indent=4))
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+import sys
+import time
+import sqlite3
+import argparse
+from contextlib import closing
+
+FILING_INDEX_PATH = 'filing_index.sqlite3'
+# 処理した全ての書類のデータ(最新でないものを含む)を書類ごとに保存するディレクトリ
+FILING_RECORDS_DIR = 'filing_records'
+FILING_FIELDS = ('filing_id', 'docID', 'parentDocID', 'edinetCode', 'secCode', 'period_end', 'submitted',
+                 'submission_number', 'amendment', 'company_name', 'json_file', 'record_file')
+# 同じ会社・期間の書類の並び順. 最後の書類を最新とする.
+LATEST_ORDER = 'submitted DESC, submission_number DESC, filing_id DESC'
+
+
+class FilingIndex:
+    """
+    処理した書類をdocID(書類管理番号)ごとに記録し、会社・期間ごとに最新の書類を1つに決めるSQLiteの索引。
+
+    会社はEDINETコード、期間は当会計期間終了日で表す。会社名や証券コードが変わっても同じ会社として扱い、
+    訂正有価証券報告書は訂正対象の書類(parentDocID)と同じ会社・期間の書類として記録する。
+
+    同じ会社・期間の書類のうち、提出日、提出回数、docIDの順に並べて最後の書類を最新とする。
+    処理する順番によらず結果は同じになり、古い書類を後から処理しても新しい書類の記録は上書きされない。
+
+    - filings: 処理した全ての書類。(EDINETコード, 期間, 提出日, 提出回数, docID)の索引を持ち、
+      会社・期間ごとの最新の書類は索引を1度たどるだけで求まる。
+    - latest: 会社・期間ごとの最新の書類。読み込み側は履歴を調べずにこの表だけを引けばよい。
+
+    Attributes
+    ----------
+    db_path : str
+        索引のSQLiteファイルのパス。
+    """
+
+    def __init__(self, db_path: str = FILING_INDEX_PATH):
+        self.db_path = db_path
+        with closing(self._connect()) as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS filings (filing_id TEXT PRIMARY KEY, docID TEXT, '
+                         'parentDocID TEXT, edinetCode TEXT NOT NULL, secCode TEXT, period_end TEXT NOT NULL, '
+                         'submitted TEXT NOT NULL, submission_number INTEGER NOT NULL, amendment INTEGER NOT NULL, '
+                         'company_name TEXT, json_file TEXT, record_file TEXT, recorded_at REAL NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS filings_period ON filings '
+                         '(edinetCode, period_end, submitted, submission_number, filing_id)')
+            conn.execute('CREATE INDEX IF NOT EXISTS filings_json_file ON filings (json_file)')
+            conn.execute('CREATE TABLE IF NOT EXISTS latest (edinetCode TEXT NOT NULL, period_end TEXT NOT NULL, '
+                         'filing_id TEXT NOT NULL, secCode TEXT, json_file TEXT, '
+                         'PRIMARY KEY (edinetCode, period_end))')
+            conn.execute('CREATE INDEX IF NOT EXISTS latest_secCode ON latest (secCode, period_end)')
+
+    def _connect(self) -> sqlite3.Connection:
+        # スレッド間で接続を共有しないように、操作ごとに接続する
+        return sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+
+    def record(self, filing: dict) -> dict:
+        """
+        書類を記録し、その会社・期間の最新の書類を決め直す関数
+
+        Parameters
+        ----------
+        filing : dict
+            FILING_FIELDSの項目を持つ辞書。CSVProcessor.filing_metadata()の戻り値。
+
+        Returns
+        -------
+        dict
+            authoritative: 記録した書類がその会社・期間の最新の書類かどうか。
+            json_file: 最新の書類のJSONファイルのパス。
+            superseded: 最新の書類が変わり、不要になった以前の最新の書類のJSONファイルのパス。なければNone。
+        """
+        group = (filing['edinetCode'], filing['period_end'])
+        placeholders = ', '.join('?' * (len(FILING_FIELDS) + 1))
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            previous = conn.execute('SELECT json_file FROM latest WHERE edinetCode = ? AND period_end = ?',
+                                    group).fetchone()
+            conn.execute(f'INSERT OR REPLACE INTO filings ({", ".join(FILING_FIELDS)}, recorded_at) '
+                         f'VALUES ({placeholders})', (*(filing[name] for name in FILING_FIELDS), time.time()))
+            winner = conn.execute(f'SELECT filing_id, secCode, json_file FROM filings '
+                                  f'WHERE edinetCode = ? AND period_end = ? ORDER BY {LATEST_ORDER} LIMIT 1',
+                                  group).fetchone()
+            conn.execute('INSERT OR REPLACE INTO latest VALUES (?, ?, ?, ?, ?)', (*group, *winner))
+            conn.execute('COMMIT')
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+        superseded = previous[0] if previous is not None and previous[0] != winner[2] else None
+        return {'authoritative': winner[0] == filing['filing_id'], 'json_file': winner[2], 'superseded': superseded}
+
+    def rebuild_latest(self) -> int:
+        """
+        全ての会社・期間の最新の書類をfilingsから求め直す関数
+
+        ウィンドウ関数で(EDINETコード, 期間)ごとに並べた索引を1度だけたどって求める。
+
+        Returns
+        -------
+        int
+            会社・期間の数。
+        """
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('DELETE FROM latest')
+            conn.execute(f'INSERT INTO latest SELECT edinetCode, period_end, filing_id, secCode, json_file FROM '
+                         f'(SELECT *, ROW_NUMBER() OVER (PARTITION BY edinetCode, period_end ORDER BY {LATEST_ORDER}) '
+                         f'AS position FROM filings) WHERE position = 1')
+            count = conn.execute('SELECT COUNT(*) FROM latest').fetchone()[0]
+            conn.execute('COMMIT')
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+        return count
+
+    def latest(self, secCode: str | None = None, edinetCode: str | None = None) -> list[dict]:
+        """
+        会社・期間ごとの最新の書類を期間の順に返す関数
+
+        Parameters
+        ----------
+        secCode : str, optional
+            証券コード。指定した場合はその会社の書類のみ。
+        edinetCode : str, optional
+            EDINETコード。指定した場合はその会社の書類のみ。
+
+        Returns
+        -------
+        list of dict
+            FILING_FIELDSの項目を持つ辞書のリスト。
+        """
+        conditions = []
+        params = []
+        for name, value in (('secCode', secCode), ('edinetCode', edinetCode)):
+            if value is not None:
+                conditions.append(f'latest.{name} = ?')
+                params.append(value)
+        where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+        columns = ', '.join(f'filings.{name}' for name in FILING_FIELDS)
+        with closing(self._connect()) as conn:
+            rows = conn.execute(f'SELECT {columns} FROM latest JOIN filings USING (filing_id) {where} '
+                                f'ORDER BY latest.edinetCode, latest.period_end', params).fetchall()
+        return [dict(zip(FILING_FIELDS, row)) for row in rows]
+
+    def history(self, edinetCode: str, period_end: str) -> list[dict]:
+        """
+        会社・期間の全ての書類を新しい順に返す関数
+        """
+        with closing(self._connect()) as conn:
+            rows = conn.execute(f'SELECT {", ".join(FILING_FIELDS)} FROM filings '
+                                f'WHERE edinetCode = ? AND period_end = ? ORDER BY {LATEST_ORDER}',
+                                (edinetCode, period_end)).fetchall()
+        return [dict(zip(FILING_FIELDS, row)) for row in rows]
+
+    def json_files(self, secCode: str) -> list[str]:
+        """
+        証券コードの会社の最新の書類のJSONファイルのパスを期間の順に返す関数
+        """
+        with closing(self._connect()) as conn:
+            rows = conn.execute('SELECT json_file FROM latest WHERE secCode = ? ORDER BY period_end',
+                                (secCode,)).fetchall()
+        return [row[0] for row in rows]
+
+    def known_json_files(self, json_files: list[str]) -> set[str]:
+        """
+        与えられたJSONファイルのパスのうち、索引に記録されているものの集合を返す関数
+        """
+        with closing(self._connect()) as conn:
+            return {json_file for json_file in json_files
+                    if conn.execute('SELECT 1 FROM filings WHERE json_file = ? LIMIT 1', (json_file,)).fetchone()}
+
+    def superseded_json_files(self) -> set[str]:
+        """
+        記録されているが、どの会社・期間でも最新の書類ではないJSONファイルのパスの集合を返す関数
+        """
+        with closing(self._connect()) as conn:
+            rows = conn.execute('SELECT DISTINCT json_file FROM filings WHERE json_file NOT IN '
+                                '(SELECT json_file FROM latest WHERE json_file IS NOT NULL)').fetchall()
+        return {row[0] for row in rows if row[0] is not None}
+
+    def superseded_filing_ids(self) -> set[str]:
+        """
+        記録されているが、その会社・期間の最新の書類ではない書類のfiling_idの集合を返す関数
+        """
+        with closing(self._connect()) as conn:
+            rows = conn.execute('SELECT filing_id FROM filings WHERE filing_id NOT IN '
+                                '(SELECT filing_id FROM latest)').fetchall()
+        return {row[0] for row in rows}
+
+    def latest_periods(self) -> set[tuple[str, str]]:
+        """
+        最新の書類が決まっている(証券コード, 期間)の組の集合を返す関数
+        """
+        with closing(self._connect()) as conn:
+            rows = conn.execute('SELECT secCode, period_end FROM latest').fetchall()
+        return {(secCode, period_end) for secCode, period_end in rows}
+
+    def doc_ids(self) -> dict:
+        """
+        最新の書類のJSONファイルのパスをキー、docIDを値とする辞書を返す関数
+        """
+        with closing(self._connect()) as conn:
+            rows = conn.execute('SELECT latest.json_file, filings.docID FROM latest '
+                                'JOIN filings USING (filing_id)').fetchall()
+        return {json_file: docID or '' for json_file, docID in rows if json_file}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='会社・期間ごとの最新の書類を表示する')
+    parser.add_argument('--db', default=FILING_INDEX_PATH, help='索引のSQLiteファイル')
+    parser.add_argument('--sec-code', help='証券コード')
+    parser.add_argument('--edinet-code', help='EDINETコード')
+    parser.add_argument('--history', action='store_true', help='最新でない書類も表示する')
+    parser.add_argument('--rebuild', action='store_true', help='最新の書類を全て求め直す')
+    args = parser.parse_args()
+
+    index = FilingIndex(args.db)
+    if args.rebuild:
+        print(f'{index.rebuild_latest()}件の会社・期間の最新の書類を求め直しました。')
+    for filing in index.latest(secCode=args.sec_code, edinetCode=args.edinet_code):
+        print(f'{filing["edinetCode"]} {filing["period_end"]} {filing["docID"] or filing["filing_id"]} '
+              f'{filing["company_name"]} {filing["json_file"]}')
+        if not args.history:
+            continue
+        for old in index.history(filing['edinetCode'], filing['period_end'])[1:]:
+            print(f'    (旧) {old["submitted"]} {old["docID"] or old["filing_id"]} {old["company_name"]}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,10 +1,27 @@
 import os
+import re
+import sys
+import queue
+import threading
+import subprocess
 import zipfile
 import shutil
 import json
 import pandas as pd
-from typing import Dict
+from typing import Dict, Iterator
 from plot import Barchart
+from snapshot import build_snapshot
+from element_matcher import compile_rules
+from fact_store import archive_processor
+from csv_cache import CSVCache
+from filing_index import FilingIndex, FILING_RECORDS_DIR
+from profiling import StageProfiler, NULL_PROFILER
+
+# 抽出したCSVファイル名: {XBRL_TO_CSVのファイル名}_{docID}_{証券コード}.csv
+# XBRL_TO_CSVのファイル名は{様式}_{EDINETコード}-000_{当会計期間終了日}_{提出回数}_{提出日}.
+# 以前の形式({XBRL_TO_CSVのファイル名}_{証券コード}.csv)にはdocIDが含まれない.
+CSV_NAME_PATTERN = re.compile(r'^(?P<base>jpcrp[^_]*_(?P<edinetCode>E\d{5})?[^_]*_(?P<period>\d{4}-\d{2}-\d{2})_'
+                              r'(?P<number>\d+)_(?P<submitted>\d{4}-\d{2}-\d{2}))(?:_(?P<docID>S[0-9A-Z]+))?_[^_]*\.csv$')
 
 
 class DataItem:
@@ -47,8 +64,13 @@ class CSVProcessor:
         主要な指標が欠落しているかどうかを示すフラグ。
     data : dict
         データ項目の辞書。各キーはデータ項目名であり、値はDataItemオブジェクト.
+    csv_cache : CSVCache or None
+        CSVファイルの解析結果のキャッシュ。Noneの場合は毎回CSVファイルを解析する。
+    filing : dict
+        書類を識別する項目(docID, EDINETコード, 提出回数, 訂正の有無など)の辞書。
+        CSVファイル名とDEI(jpdei_cor)の行から取り出し、filing_index.FilingIndexに記録する。
     """
-    def __init__(self, file_path: str):
+    def __init__(self, file_path: str, csv_cache: CSVCache | None = None):
         self.secCode = file_path.split('_')[-1][:-4]
         self.data = {
             'CompanyName': DataItem('会社名', -1, '単位', 0),
@@ -87,11 +109,12 @@ class CSVProcessor:
             ('jpdei_cor:CurrentPeriodEndDateDEI', 'FilingDateInstant'),
         )
         ### 損益計算書の要素IDとコンテキストID
+        # 要素IDにはglob形式のパターンも使え、3番目の要素で優先度を指定できる(element_matcher.compile_rulesを参照)。
+        # 会社ごとの独自の要素ID(jpcrp030000-asr_{EDINETコード}-000:...)はパターンで拾い、標準の要素IDを優先する。
         self.IFRSSales_IDs = (
-            ('jpcrp030000-asr_E02144-000:OperatingRevenuesIFRSKeyFinancialData', 'CurrentYearDuration'),
             ('jpcrp_cor:RevenueIFRSSummaryOfBusinessResults', 'CurrentYearDuration'),
-            ('jpcrp030000-asr_E01807-000:NetSalesIFRSSummaryOfBusinessResults', 'CurrentYearDuration'),
-            ('jpcrp030000-asr_E01097-000:NetSalesIFRSSummaryOfBusinessResults', 'CurrentYearDuration'),
+            ('jpcrp030000-asr_E*-000:*SalesIFRS*SummaryOfBusinessResults', 'CurrentYearDuration', 50),
+            ('jpcrp030000-asr_E*-000:*RevenuesIFRSKeyFinancialData', 'CurrentYearDuration', 40),
         )
         self.Sales_IDs = (
             ('jpcrp_cor:OperatingRevenue1SummaryOfBusinessResults', 'CurrentYearDuration'),
@@ -199,16 +222,40 @@ class CSVProcessor:
             self.IFRSInterestBearingNonCurrentLiabilities_IDs: 'IFRSInterest-bearingNonCurrentLiabilities',
             self.InterestBearingNonCurrentLiabilities_IDs: 'Interest-bearingNonCurrentLiabilities',
         }
+        ### 書類を識別する項目(DEI)の要素IDとコンテキストID. JSONファイルには含めない.
+        self.filing_expression_dict = {
+            (('jpdei_cor:EDINETCodeDEI', 'FilingDateInstant'),): 'edinetCode',
+            (('jpdei_cor:NumberOfSubmissionDEI', 'FilingDateInstant'),): 'submission_number',
+            (('jpdei_cor:AmendmentFlagDEI', 'FilingDateInstant'),): 'amendment',
+            (('jpdei_cor:IdentificationOfDocumentSubjectToAmendmentDEI', 'FilingDateInstant'),): 'parentDocID',
+        }
+        match = CSV_NAME_PATTERN.match(os.path.basename(file_path))
+        self.filing = {
+            # docIDが分からない場合(EDINETから手動でダウンロードしたCSVファイル)はXBRL_TO_CSVのファイル名で書類を表す
+            'filing_id': (match['docID'] or match['base']) if match
+                         else os.path.splitext(os.path.basename(file_path))[0],
+            'docID': match['docID'] if match else None,
+            'parentDocID': None,
+            'edinetCode': match['edinetCode'] if match else None,
+            'period_end': match['period'] if match else None,
+            'submitted': match['submitted'] if match else '',
+            'submission_number': int(match['number']) if match else 1,
+            'amendment': 0,
+        }
         self.df = None
         self.json_file_path = ''
         self.file_path = file_path
+        self.csv_cache = csv_cache
         self.data_to_json = {}
         self.missing_GAAP = False
         self.missing_main_measure = False
 
     def load_csv(self):
         try:
-            self.df = pd.read_csv(self.file_path, encoding='utf-16le', delimiter='\t')
+            if self.csv_cache is not None:
+                self.df = self.csv_cache.read_csv(self.file_path)
+            else:
+                self.df = pd.read_csv(self.file_path, encoding='utf-16le', delimiter='\t')
             self.secCode = self.file_path
         except Exception as e:
             print(f"読み込みエラー: {e}")
@@ -216,12 +263,14 @@ class CSVProcessor:
 
     def process_data(self):
         """
-        データフレームの各行を処理し、条件に基づいてデータを更新します。
+        データフレームから各データ項目の値を取り出し、データを更新します。
 
-        各行の要素IDとコンテキストIDの組み合わせをキーとして使用し、
-        `self.ID_expression_dict`内のIDタプルと一致する場合にデータを更新します。
+        `self.ID_expression_dict`の要素IDとコンテキストIDの組(パターンを含む)を1つの照合器にまとめ、
+        要素IDとコンテキストIDの列全体に対してまとめて照合します。
+        同じデータ項目に当てはまる行が複数ある場合は優先度の高い規則の行を、同じ優先度では後ろの行を使います。
         値が整数に変換可能な場合は整数として、そうでない場合はそのままの値を使用します。
         単位が'－'でない場合はその値を使用し、'－'の場合は空文字列を設定します。
+        `self.filing_expression_dict`のDEIの行は同じ照合器で照合し、`self.filing`を更新します。
 
         Parameters
         ----------
@@ -231,16 +280,63 @@ class CSVProcessor:
         -------
         None
         """
-        for i in range(len(self.df)):
-            row = self.df.iloc[i]
-            key = (row['要素ID'], row['コンテキストID'])
-            for IDs in self.ID_expression_dict.keys():
-                if key in IDs:
-                    try:
-                        self.data[self.ID_expression_dict[IDs]].value = int(row['値'])
-                    except ValueError:
-                        self.data[self.ID_expression_dict[IDs]].value = row['値']
-                    self.data[self.ID_expression_dict[IDs]].unit = row['単位'] if row['単位'] != '－' else ''
+        matcher = compile_rules(tuple((IDs, key) for IDs, key in self.ID_expression_dict.items())
+                                + tuple((IDs, key) for IDs, key in self.filing_expression_dict.items()))
+        values = self.df['値']
+        units = self.df['単位']
+        for key, position in matcher.select(self.df['要素ID'], self.df['コンテキストID']).items():
+            value = values.iat[position]
+            if key not in self.data:
+                self.update_filing(key, value)
+                continue
+            try:
+                self.data[key].value = int(value)
+            except ValueError:
+                self.data[key].value = value
+            self.data[key].unit = units.iat[position] if units.iat[position] != '－' else ''
+
+    def update_filing(self, key: str, value: str) -> None:
+        """
+        DEIの値で書類を識別する項目を更新する関数. 値が空('－')の場合はCSVファイル名から取り出した値を残す.
+        """
+        if pd.isna(value) or value == '－':
+            return
+        if key == 'submission_number':
+            try:
+                self.filing[key] = int(value)
+            except ValueError:
+                pass
+        elif key == 'amendment':
+            self.filing[key] = int(str(value).lower() == 'true')
+        else:
+            self.filing[key] = str(value)
+
+    def filing_metadata(self, json_file_path: str) -> dict:
+        """
+        filing_index.FilingIndexに記録する書類の項目を返す関数
+
+        EDINETコードが分からない場合は証券コードで会社を表し、期間は当会計期間終了日(EndDate)で表す。
+
+        Parameters
+        ----------
+        json_file_path : str
+            最新の書類である場合に保存するJSONファイルのパス。
+
+        Returns
+        -------
+        dict
+            filing_index.FILING_FIELDSの項目を持つ辞書。
+        """
+        return {
+            **self.filing,
+            'edinetCode': self.filing['edinetCode'] or str(self.data['secCode'].value),
+            'secCode': str(self.data['secCode'].value),
+            'period_end': str(self.data['EndDate'].value) if self.data['EndDate'].value != -1
+                          else self.filing['period_end'] or '',
+            'company_name': str(self.data['CompanyName'].value),
+            'json_file': json_file_path,
+            'record_file': os.path.join(FILING_RECORDS_DIR, f'{self.filing["filing_id"]}.json'),
+        }
 
     def convert_dataitem_to_dict(self) -> dict:
         """
@@ -261,46 +357,110 @@ class CSVProcessor:
             }
         return data_dict
 
-    def save_to_json(self) -> None:
+    def save_to_json(self, index: FilingIndex | None = None, profiler: StageProfiler = NULL_PROFILER) -> None:
         """
         dataをjsonファイルにして保存する関数
+
+        処理した全ての書類のデータはfiling_records/{docID}.jsonに保存し、filing_index.sqlite3に記録する。
+        json_file/{会社名}{決算締日}.jsonには、その会社・期間(EDINETコード, 当会計期間終了日)の
+        最新の書類(訂正報告書を含む)のデータのみを保存する。古い書類を後から処理しても新しい書類のデータは上書きされず、
+        会社名が変わった場合は以前の会社名のJSONファイルを削除する。
+
+        書類のデータの保存(write_record)、索引の更新(filing_index)、JSONファイルの書き込み(write_json)、
+        file_path_by_secCode.jsonの書き換え(secCode_index)は、それぞれprofilerの段階として記録する。
+
+        Parameters
+        ----------
+        index : FilingIndex, optional
+            書類を記録する索引。省略した場合はfiling_index.sqlite3を使う。
+        profiler : StageProfiler
+            段階ごとの時間を記録するプロファイラ。
+        """
+        index = index if index is not None else FilingIndex()
+        with profiler.stage('write_record', self.file_path):
+            self.data_to_json = self.convert_dataitem_to_dict()
+            json_file_path = f'json_file/{self.data["CompanyName"].value}{self.data["EndDate"].value}.json'
+            filing = self.filing_metadata(json_file_path)
+            if not self.write_record(filing):
+                return
+        with profiler.stage('filing_index', self.file_path):
+            resolution = index.record(filing)
+        with profiler.stage('write_json', self.file_path):
+            self.publish_json(resolution)
+        with profiler.stage('secCode_index', self.file_path):
+            self.update_file_path_by_secCode(index)
+
+    def write_record(self, filing: dict) -> bool:
+        """
+        最新の書類かどうかによらず、書類のデータをfiling_records/{docID}.jsonに保存する関数
+
+        Returns
+        -------
+        bool
+            保存できた場合はTrue。
+        """
+        try:
+            os.makedirs(FILING_RECORDS_DIR, exist_ok=True)
+            with open(filing['record_file'], 'w', encoding='utf-8') as json_file:
+                json.dump(self.data_to_json, json_file, ensure_ascii=False, indent=4)
+        except Exception as e:
+            print(f"JSONファイル保存エラー: {e}")
+            return False
+        return True
+
+    def publish_json(self, resolution: dict) -> None:
         """
-        self.data_to_json = self.convert_dataitem_to_dict()
-        self.json_file_path = f'json_file/{self.data["CompanyName"].value}{self.data["EndDate"].value}.json'
+        索引で最新の書類と決まった場合に、json_file/{会社名}{決算締日}.jsonを書き込む関数
+
+        Parameters
+        ----------
+        resolution : dict
+            FilingIndex.recordの戻り値。
+        """
+        self.json_file_path = resolution['json_file']
+        if not resolution['authoritative']:
+            print(f"同じ会社・期間のより新しい書類が記録済みのため、JSONファイルを更新しません: {self.json_file_path}")
+            return
         # ディレクトリが存在しなければ作成
         json_dir = os.path.dirname(self.json_file_path)
         if not os.path.exists(json_dir):
             os.makedirs(json_dir)
-        if not os.path.exists('file_path_by_secCode.json'):
-            # debug
-            print('file_path_by_secCode.jsonが存在しません。')
-            with open('file_path_by_secCode.json', 'w') as f:
-                json.dump({self.data["secCode"].value: [self.json_file_path]}, f, ensure_ascii=False, indent=4)
-        else:
-            # debug
-            print('file_path_by_secCode.jsonが存在します。')
-            with open('file_path_by_secCode.json', 'r') as f:
-                data = json.load(f)
-            if self.data["secCode"].value in data.keys():
-                data[self.data["secCode"].value].append(self.json_file_path)
-                data[self.data["secCode"].value] = list(set(data[self.data["secCode"].value]))
-            else:
-                data[self.data["secCode"].value] = [self.json_file_path]
-            with open('file_path_by_secCode.json', 'w') as f:
-                json.dump(data, f, ensure_ascii=False, indent=4)
         try:
             with open(self.json_file_path, 'w', encoding='utf-8') as json_file:
                 json.dump(self.data_to_json, json_file, ensure_ascii=False, indent=4)
             print(f"JSONファイルを保存しました: {self.json_file_path}")
         except Exception as e:
             print(f"JSONファイル保存エラー: {e}")
+        if resolution['superseded'] and os.path.exists(resolution['superseded']):
+            os.remove(resolution['superseded'])
+            print(f"古い書類のJSONファイルを削除しました: {resolution['superseded']}")
+
+    def update_file_path_by_secCode(self, index: FilingIndex) -> None:
+        """
+        file_path_by_secCode.jsonのこの会社の証券コードのJSONファイルのパスを、索引の最新の書類で置き換える関数
+
+        索引に記録される前に保存されたJSONファイルは、存在する限り残す。
+        """
+        secCode = self.data["secCode"].value
+        data = {}
+        if os.path.exists('file_path_by_secCode.json'):
+            with open('file_path_by_secCode.json', 'r') as f:
+                data = json.load(f)
+        paths = index.json_files(str(secCode))
+        previous = [path for path in data.get(secCode, []) if path not in paths]
+        known = index.known_json_files(previous)
+        data[secCode] = paths + sorted(path for path in previous if path not in known and os.path.exists(path))
+        with open('file_path_by_secCode.json', 'w') as f:
+            json.dump(data, f, ensure_ascii=False, indent=4)
 
     def rename_csv_file(self) -> None:
         """
         CSVファイルの名前を変更する関数
-        {会社名}{決算締日}.csv として名前を変更する。
+        {会社名}{決算締日}.csv として名前を変更する。docIDが分かる場合は、訂正報告書で上書きしないように
+        {会社名}{決算締日}_{docID}.csv とする。
         """
-        new_csv_file_path = f'CSVs/{self.data["CompanyName"].value}{self.data["EndDate"].value}.csv'
+        suffix = f'_{self.filing["docID"]}' if self.filing["docID"] else ''
+        new_csv_file_path = f'CSVs/{self.data["CompanyName"].value}{self.data["EndDate"].value}{suffix}.csv'
         csv_dir = os.path.dirname(new_csv_file_path)
         if not os.path.exists(csv_dir):
             os.makedirs(csv_dir)
@@ -312,6 +472,34 @@ class CSVProcessor:
             print(f"CSVファイルの名前変更エラー: {e}")
 
 
+def iter_files(folder_path: str, extension: str) -> Iterator[str]:
+    """
+    指定されたフォルダ内の拡張子がextensionのファイルのパスを、見つけた順に1つずつ返すジェネレータ
+
+    os.scandirでディレクトリを読みながら返すため、ファイルの数によらずメモリの使用量は一定で、
+    最初のファイルはディレクトリを全て読む前に返る。ファイルかどうかはディレクトリの読み込み時に得られる
+    種類(DirEntry.is_file)で判定し、ファイルごとにstatを呼ばない。
+    """
+    with os.scandir(folder_path) as entries:
+        for entry in entries:
+            if entry.name.endswith(extension) and entry.is_file():
+                yield entry.path
+
+
+def iter_csv_files(folder_path: str) -> Iterator[str]:
+    """
+    指定されたフォルダ内のCSVファイルのパスを1つずつ返すジェネレータ
+    """
+    return iter_files(folder_path, '.csv')
+
+
+def iter_zip_files(folder_path: str) -> Iterator[str]:
+    """
+    指定されたフォルダ内のZIPファイルのパスを1つずつ返すジェネレータ
+    """
+    return iter_files(folder_path, '.zip')
+
+
 def find_csv_files_in_folder(folder_path: str) -> list[str]:
     """
     指定されたフォルダ内に存在する全てのCSVファイルの絶対パスをリストで返す関数。
@@ -328,21 +516,10 @@ def find_csv_files_in_folder(folder_path: str) -> list[str]:
 
     Notes
     -----
-    この関数は、指定されたフォルダ内の全てのファイルとディレクトリをチェックし、
-    拡張子が`.csv`であるファイルの絶対パスをリストに追加する。
+    この関数は、iter_csv_filesで見つけた拡張子が`.csv`であるファイルのパスを全てリストにまとめる。
+    ファイルが多い場合は、リストを作らずにiter_csv_filesを直接使う。
     """
-    
-    # フォルダ内のCSVファイルのパスを格納するリスト
-    csv_files = []
-    # フォルダ内のすべてのファイルとディレクトリをチェック
-    for file_name in os.listdir(folder_path):
-        # 絶対パスを取得
-        file_path = os.path.join(folder_path, file_name)
-        # ファイルがCSVファイルであるかを確認
-        if os.path.isfile(file_path) and file_name.endswith('.csv'):
-            csv_files.append(file_path)
-    
-    return csv_files
+    return list(iter_csv_files(folder_path))
 
 
 def check_missing_data(converter: CSVProcessor, is_missing_data: dict, isIFRS: bool) -> None:
@@ -396,7 +573,7 @@ def check_missing_data(converter: CSVProcessor, is_missing_data: dict, isIFRS: b
                 elif key in supplementary_measures:
                     print(f'補完的な指標である{converter.data[key].name}が見つかりませんでした。')
 
-def extract_target_csv(zip_folder_path: str, extract_to: str):
+def extract_target_csv(zip_folder_path: str, extract_to: str, profiler: StageProfiler = NULL_PROFILER):
     """
     ZIPファイルから目的のCSVファイルを抽出し、抽出後にZIPファイルを削除します。
     
@@ -406,63 +583,180 @@ def extract_target_csv(zip_folder_path: str, extract_to: str):
         抽出するZIPファイルが格納されているディレクトリのパス
     extract_to: str
         抽出先ディレクトリのパス
+    profiler: StageProfiler
+        ZIPファイルごとの展開の時間を記録するプロファイラ
 
     Returns
     -------
     None
     """
-    zip_files = []
+    # ZIPファイルの一覧を作らずに、見つけた順に抽出する(抽出済みのZIPファイルは削除される)
+    for zip_path in iter_zip_files(zip_folder_path):
+        with profiler.stage('unzip', zip_path):
+            extract_csv_from_zip(zip_path, extract_to)
+
+
+def stream_target_csv(zip_folder_path: str, extract_to: str, window: int,
+                      profiler: StageProfiler = NULL_PROFILER) -> Iterator[str]:
+    """
+    ZIPファイルからCSVファイルを抽出しながら、処理するCSVファイルのパスを1つずつ返すジェネレータ
+
+    まず抽出先ディレクトリに残っている未処理のCSVファイル(名前がjpcrp030000で始まるもの)を返し、
+    次にZIPファイルをバックグラウンドのスレッドで抽出して、抽出したCSVファイルから順に返す。
+    抽出が処理より先に進むのは最大window件までで、処理が追いつくまで抽出は待つ。
+    ZIPファイルもCSVファイルも一覧を作らないため、ファイルの数によらず最初のファイルの処理はすぐに始まり、
+    メモリの使用量は一定になる。
+
+    Parameters
+    ----------
+    zip_folder_path : str
+        抽出するZIPファイルが格納されているディレクトリのパス
+    extract_to : str
+        抽出先ディレクトリのパス
+    window : int
+        抽出済みで処理を待つCSVファイルの最大数
+    profiler : StageProfiler
+        抽出されたCSVファイルを待った時間をunzipの段階として記録するプロファイラ
+
+    Yields
+    ------
+    str
+        処理するCSVファイルのパス
+    """
+    # 抽出を始める前に読み終えるため、この回に抽出したCSVファイルを2回返すことはない.
+    # 処理後に名前を変えたCSVファイルはjpcrp030000で始まらないため返さない.
+    if os.path.isdir(extract_to):
+        for file_path in iter_csv_files(extract_to):
+            if os.path.basename(file_path).startswith('jpcrp030000'):
+                yield file_path
+
+    paths = queue.Queue(maxsize=max(window, 1))
+    stop = threading.Event()
+    errors = []
+
+    def extract():
+        try:
+            for zip_path in iter_zip_files(zip_folder_path):
+                if stop.is_set():
+                    break
+                csv_path = extract_csv_from_zip(zip_path, extract_to)
+                if csv_path is not None:
+                    paths.put(csv_path)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            paths.put(None)
+
+    extractor = threading.Thread(target=extract, daemon=True)
+    extractor.start()
+    try:
+        while True:
+            with profiler.stage('unzip'):
+                csv_path = paths.get()
+            if csv_path is None:
+                break
+            yield csv_path
+        if errors:
+            raise errors[0]
+    finally:
+        # 処理を途中でやめた場合も、キューを空けて抽出のスレッドを終わらせる
+        stop.set()
+        while extractor.is_alive():
+            try:
+                paths.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+
+def extract_csv_from_zip(zip_path: str, extract_to: str) -> str | None:
+    """
+    1つのZIPファイルから目的のCSVファイルを抽出し、抽出後にZIPファイルを削除する関数
+
+    Parameters
+    ----------
+    zip_path: str
+        抽出するZIPファイルのパス
+    extract_to: str
+        抽出先ディレクトリのパス
+
+    Returns
+    -------
+    str or None
+        抽出したCSVファイルのパス。ZIPファイルや目的のCSVファイルが存在しない場合はNone。
+    """
+    # ZIPファイルが存在するか確認
+    if not os.path.exists(zip_path):
+        print(f"指定されたZIPファイルが存在しません: {zip_path}")
+        return None
     
-    # フォルダ内のすべてのファイルとディレクトリをチェック
-    for file_name in os.listdir(zip_folder_path):
-        # 絶対パスを取得
-        file_path = os.path.join(zip_folder_path, file_name)
-        # ファイルがZIPファイルであるかを確認
-        if os.path.isfile(file_path) and file_name.endswith('.zip'):
-            zip_files.append(file_path)
+    # 抽出先ディレクトリが存在しない場合は作成
+    if not os.path.isdir(extract_to):
+        os.makedirs(extract_to, exist_ok=True)
+        print(f"抽出先ディレクトリを作成しました: {extract_to}")
     
-    for zip_path in zip_files:
-        # ZIPファイルが存在するか確認
-        if not os.path.exists(zip_path):
-            print(f"指定されたZIPファイルが存在しません: {zip_path}")
-            continue
+    # ZIPファイルを開く
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        # ZIP内のファイルリストを取得
+        all_files = zip_ref.namelist()
         
-        # 抽出先ディレクトリが存在しない場合は作成
-        if not os.path.isdir(extract_to):
-            os.makedirs(extract_to, exist_ok=True)
-            print(f"抽出先ディレクトリを作成しました: {extract_to}")
+        # 目的のCSVファイルのみをフィルタリング
+        target_csv_file = ''
+        for f in all_files:
+            if f.startswith('XBRL_TO_CSV/jpcrp030000') and f.endswith('.csv'):
+                target_csv_file = f
         
-        # ZIPファイルを開く
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            # ZIP内のファイルリストを取得
-            all_files = zip_ref.namelist()
-            
-            # 目的のCSVファイルのみをフィルタリング
-            target_csv_file = ''
-            for f in all_files:
-                if f.startswith('XBRL_TO_CSV/jpcrp030000') and f.endswith('.csv'):
-                    target_csv_file = f
+        if target_csv_file == '':
+            print(f"ZIPファイル内に目的のCSVファイルが存在しません: {zip_path}")
+            return None
+        else:
+            # 抽出されたCSVファイルを指定のディレクトリに保存
+            with zip_ref.open(target_csv_file) as source_file:
+                # 保存するファイル名はパス部分を削除したものにdocIDと証券コードを付けたもの
+                # ({docID}_{証券コード}.zipでない、手動でダウンロードしたZIPファイルにはdocIDを付けない)
+                docID, secCode = os.path.basename(zip_path).split('.')[0].split('_')[:2]
+                suffix = f'_{docID}_{secCode}' if re.fullmatch(r'S[0-9A-Z]+', docID) else f'_{secCode}'
+                output_file_path = os.path.join(extract_to, f'{os.path.basename(target_csv_file)[:-4]}{suffix}.csv')
+                with open(output_file_path, 'wb') as output_file:
+                    shutil.copyfileobj(source_file, output_file)
             
-            if target_csv_file == '':
-                print(f"ZIPファイル内に目的のCSVファイルが存在しません: {zip_path}")
-                continue
-            else:
-                # 抽出されたCSVファイルを指定のディレクトリに保存
-                with zip_ref.open(target_csv_file) as source_file:
-                    # 保存するファイル名はパス部分を削除したもの
-                    secCode = os.path.basename(zip_path).split('_')[1].split('.')[0]
-                    output_file_path = os.path.join(extract_to, f'{os.path.basename(target_csv_file)[:-4]}_{secCode}.csv')
-                    with open(output_file_path, 'wb') as output_file:
-                        shutil.copyfileobj(source_file, output_file)
-                
-                print(f"{target_csv_file} を {output_file_path} に抽出しました。")
-        
-        # ZIPファイルを削除
-        try:
-            os.remove(zip_path)
-            print(f"ZIPファイルを削除しました: {zip_path}")
-        except Exception as e:
-            print(f"ZIPファイルの削除に失敗しました: {zip_path} - {e}")
+            print(f"{target_csv_file} を {output_file_path} に抽出しました。")
+    
+    # ZIPファイルを削除
+    try:
+        os.remove(zip_path)
+        print(f"ZIPファイルを削除しました: {zip_path}")
+    except Exception as e:
+        print(f"ZIPファイルの削除に失敗しました: {zip_path} - {e}")
+    return output_file_path
+
+
+def process_csv(file_path: str, archive: bool = False, use_csv_cache: bool = False) -> CSVProcessor:
+    """
+    CSVファイルを読み込んでデータを抽出する関数
+
+    JSONファイルの保存やCSVファイルの名前の変更は行わないため、複数のプロセスから同時に呼び出せる。
+
+    Parameters
+    ----------
+    file_path : str
+        処理するCSVファイルのパス。
+    archive : bool
+        CSVファイルの全ての行をfact_store/に保存するかどうか。
+    use_csv_cache : bool
+        CSVファイルの解析結果のキャッシュ(cache/csv/)を使うかどうか。
+
+    Returns
+    -------
+    CSVProcessor
+        データを抽出したCSVProcessor。プロセス間で受け渡せるようにデータフレームは破棄している。
+    """
+    processor = CSVProcessor(file_path, csv_cache=CSVCache() if use_csv_cache else None)
+    processor.load_csv()
+    processor.process_data()
+    if archive:
+        archive_processor(processor)
+    processor.df = None
+    return processor
 
 def isIFRS(data: Dict[str, DataItem]) -> bool:
     """
@@ -488,38 +782,61 @@ def isIFRS(data: Dict[str, DataItem]) -> bool:
 def main():
     with open('config.json', 'r') as config_file:
         config = json.load(config_file)
+    # 段階ごと・ファイルごとの時間とメモリ使用量を記録する(記録しない場合は何もしない)
+    profiler = StageProfiler(enabled=config.get("profile", False), cprofile_top=config.get("profile_cprofile", 0))
     folder_path = 'CSVs'
-    extract_target_csv('ZIPs', folder_path)
-    paths = find_csv_files_in_folder(folder_path)
-    if config["process_unprocessed_csv_only"] and paths:
-        print('未処理のCSVファイルのみを処理します。')    
+    stream_window = config.get("stream_window", 0)
+    if stream_window and not config["select_data"]:
+        # 全てのZIPファイルの抽出を待たずに、抽出したCSVファイルから順に処理する
+        paths = stream_target_csv('ZIPs', folder_path, stream_window, profiler=profiler)
+    else:
+        extract_target_csv('ZIPs', folder_path, profiler=profiler)
+        paths = find_csv_files_in_folder(folder_path)
     if config["select_data"] == True:
         paths = [input("CSV file path: ")]
         
 
-    if paths == []:
-        print('CSVファイルが見つかりませんでした。')
+    found = 0
     missing_GAAP = []
     missing_main_measure = []
+    json_file_paths = []
+    # 同じ内容のCSVファイルを2回目以降に処理する場合は、解析済みの列をキャッシュから読み込む
+    csv_cache = CSVCache() if config.get("csv_cache", False) else None
     for file_path in paths:
+        found += 1
+        # pathsはジェネレータの場合もあるため、最初のファイルが見つかってから表示する
+        if found == 1 and config["process_unprocessed_csv_only"]:
+            print('未処理のCSVファイルのみを処理します。')
         if config["process_unprocessed_csv_only"]:
             if not file_path.startswith('CSVs/jpcrp030000'):
                 continue
-        processor = CSVProcessor(file_path)
-        processor.load_csv()
-        processor.process_data()
-        print(f'-----{processor.data["CompanyName"].value}-----')
-        processor.save_to_json()
-        processor.rename_csv_file()
-        chart = Barchart(processor.json_file_path, config["show_chart"], isIFRS=isIFRS(processor.data))
-        chart.plot()
-        check_missing_data(processor, chart.is_missing_data, isIFRS=isIFRS(processor.data))
+        with profiler.file(file_path):
+            processor = CSVProcessor(file_path, csv_cache=csv_cache)
+            with profiler.stage('read_csv', file_path):
+                processor.load_csv()
+            with profiler.stage('process_data', file_path):
+                processor.process_data()
+            if config.get("archive_facts", False):
+                # 抽出しなかった行も後から取り出せるように、全ての行を列ごとに保存する
+                with profiler.stage('archive_facts', file_path):
+                    archive_processor(processor)
+            print(f'-----{processor.data["CompanyName"].value}-----')
+            processor.save_to_json(profiler=profiler)
+            json_file_paths.append(processor.json_file_path)
+            with profiler.stage('rename_csv', file_path):
+                processor.rename_csv_file()
+            with profiler.stage('chart', file_path):
+                chart = Barchart(processor.json_file_path, config["show_chart"], isIFRS=isIFRS(processor.data))
+                chart.plot()
+            check_missing_data(processor, chart.is_missing_data, isIFRS=isIFRS(processor.data))
         print("---------------" + '-'*int(1.5*len(processor.data["CompanyName"].value)))
         if processor.missing_GAAP:
             missing_GAAP.append(processor.data['CompanyName'].value)
         if processor.missing_main_measure:
             missing_main_measure.append(processor.data['CompanyName'].value)
 
+    if found == 0:
+        print('CSVファイルが見つかりませんでした。')
     if missing_GAAP != []:
         print('以下の会社からGAAP指標を抜き出すことに失敗しました。')
         for name in missing_GAAP:
@@ -529,6 +846,29 @@ def main():
         for name in missing_main_measure:
             print(name)
 
+    if config.get("publish_snapshot", False) and json_file_paths:
+        # ウェブアプリは更新されたスナップショットを自動的に読み込み直す
+        with profiler.stage('snapshot'):
+            build_snapshot()
+    if config.get("warmup_charts", False) and json_file_paths:
+        warmup_charts(json_file_paths)
+    profiler.finish()
+
+
+def warmup_charts(json_file_paths: list[str]) -> None:
+    """
+    ウェブアプリ用のグラフをバックグラウンドで事前に描画する関数
+
+    `web_app/warmup.py`を別プロセスで起動するため、描画の完了を待たずに戻る。
+
+    Parameters
+    ----------
+    json_file_paths : list of str
+        描画するJSONファイルのパスのリスト。
+    """
+    warmup_script = os.path.join('web_app', 'warmup.py')
+    subprocess.Popen([sys.executable, warmup_script, *json_file_paths])
+    print(f'{len(json_file_paths)}件のグラフの事前描画をバックグラウンドで開始しました。')
 
 
 if __name__ == "__main__":
@@ -0,0 +1,211 @@
+import os
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fetch_data'))
+from backfill import backfill, date_range, format_seconds
+from main import CSVProcessor, extract_csv_from_zip, process_csv, check_missing_data, isIFRS, warmup_charts
+from snapshot import build_snapshot
+
+ZIP_DIR = 'ZIPs'
+CSV_DIR = 'CSVs'
+# キューの終わりを表す値
+_DONE = None
+
+
+def extract_and_process(zip_path: str, extract_to: str = CSV_DIR, archive: bool = False,
+                        use_csv_cache: bool = False) -> CSVProcessor | None:
+    """
+    ZIPファイルからCSVファイルを抽出してデータを抽出する関数。ワーカープロセスで実行する。
+
+    Parameters
+    ----------
+    zip_path : str
+        ZIPファイルのパス。
+    extract_to : str
+        CSVファイルの抽出先ディレクトリのパス。
+    archive : bool
+        CSVファイルの全ての行をfact_store/に保存するかどうか。
+    use_csv_cache : bool
+        CSVファイルの解析結果をcache/csv/に保存するかどうか。
+
+    Returns
+    -------
+    CSVProcessor or None
+        データを抽出したCSVProcessor。目的のCSVファイルが存在しない場合はNone。
+    """
+    csv_path = extract_csv_from_zip(zip_path, extract_to)
+    if csv_path is None:
+        return None
+    return process_csv(csv_path, archive=archive, use_csv_cache=use_csv_cache)
+
+
+def run_pipeline(dates: list[str], workers: int = 4, concurrency: int = 2, rate: float = 1.0,
+                 processes: int | None = None, queue_size: int = 32, archive: bool = False,
+                 use_csv_cache: bool = False) -> list[str]:
+    """
+    書類のダウンロードとCSVファイルの処理を重ねて実行する関数
+
+    ダウンロードしたZIPファイルのパスを大きさqueue_sizeのキューに入れ、CPUのワーカープロセスが
+    キューから取り出してCSVファイルの抽出とデータの抽出を行う。その間も次の書類のダウンロードは続くため、
+    全体の処理時間はダウンロードと処理の合計ではなく、遅い方の時間に近くなる。
+    処理が追いつかずにキューが一杯になると、ダウンロードは空きができるまで待つ。
+    JSONファイル、file_path_by_secCode.json、filing_index.sqlite3の書き込み、CSVファイルの名前の変更はメインプロセスで順番に行う。
+    ダウンロードで例外が起きた場合は、キューに入ったZIPファイルを処理し終えてから送出する。
+
+    Parameters
+    ----------
+    dates : list of str
+        取得する日付(YYYY-MM-DD)のリスト。
+    workers : int
+        同時にダウンロードする日付の数。
+    concurrency : int
+        1日あたり同時にダウンロードする書類の数。
+    rate : float
+        全体のリクエストの速さの上限(回/秒)。
+    processes : int, optional
+        CSVファイルを処理するワーカープロセスの数。省略した場合はCPUの数。
+    queue_size : int
+        処理を待つZIPファイルの最大数。
+    archive : bool
+        CSVファイルの全ての行をfact_store/に保存するかどうか。ワーカープロセスで書類ごとに保存する。
+    use_csv_cache : bool
+        CSVファイルの解析結果をcache/csv/に保存するかどうか。
+
+    Returns
+    -------
+    list of str
+        保存したJSONファイルのパスのリスト。
+    """
+    zip_queue = queue.Queue(maxsize=queue_size)
+
+    # 前回の実行で処理されずに残ったZIPファイルも処理する
+    leftover_zips = [os.path.join(ZIP_DIR, file_name) for file_name in sorted(os.listdir(ZIP_DIR))
+                     if file_name.endswith('.zip')] if os.path.isdir(ZIP_DIR) else []
+
+    stop = threading.Event()
+    errors = []
+
+    def enqueue(zip_path: str):
+        # 処理をやめた後にダウンロードされたZIPファイルはキューに入れず、次回の実行で処理する
+        if not stop.is_set():
+            zip_queue.put(zip_path)
+
+    def produce():
+        try:
+            for zip_path in leftover_zips:
+                enqueue(zip_path)
+            backfill(dates, workers=workers, concurrency=concurrency, rate=rate, on_downloaded=enqueue)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            zip_queue.put(_DONE)
+
+    json_file_paths = []
+    missing_GAAP = []
+    missing_main_measure = []
+
+    def finish(future):
+        # 書き込みを伴う処理はメインプロセスで1件ずつ行う
+        try:
+            processor = future.result()
+        except BaseException as e:
+            print(f"CSVファイルの処理に失敗しました: {e!r}")
+            return
+        if processor is None:
+            return
+        print(f'-----{processor.data["CompanyName"].value}-----')
+        processor.save_to_json()
+        json_file_paths.append(processor.json_file_path)
+        processor.rename_csv_file()
+        is_missing_data = {key: item.value == -1 for key, item in processor.data.items()}
+        check_missing_data(processor, is_missing_data, isIFRS=isIFRS(processor.data))
+        if processor.missing_GAAP:
+            missing_GAAP.append(processor.data['CompanyName'].value)
+        if processor.missing_main_measure:
+            missing_main_measure.append(processor.data['CompanyName'].value)
+
+    start = time.perf_counter()
+    processes = processes or os.cpu_count() or 1
+    # ダウンロードのスレッドが動いている間にプロセスを作るため、forkではなくspawnを使う
+    with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn')) as executor:
+        # 最初の書類がダウンロードされる間にワーカーを起動してpandasなどの読み込みを済ませておく
+        for _ in range(processes):
+            executor.submit(os.getpid)
+        producer = threading.Thread(target=produce, name='pipeline-producer')
+        producer.start()
+        max_in_flight = processes * 2
+        pending = set()
+        try:
+            while True:
+                try:
+                    zip_path = zip_queue.get(timeout=0.05)
+                except queue.Empty:
+                    zip_path = ''
+                if zip_path is _DONE:
+                    break
+                if zip_path:
+                    pending.add(executor.submit(extract_and_process, zip_path, CSV_DIR, archive, use_csv_cache))
+                # ワーカーに渡す数を制限し、処理しきれない分はキューに残してダウンロード側を待たせる
+                done, pending = wait(pending, timeout=0 if len(pending) < max_in_flight else None,
+                                     return_when=FIRST_COMPLETED)
+                for future in done:
+                    finish(future)
+            for future in pending:
+                finish(future)
+        finally:
+            # 処理を途中でやめた場合も、キューを空けてダウンロードのスレッドを終わらせる
+            stop.set()
+            while producer.is_alive():
+                try:
+                    zip_queue.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            producer.join()
+    if errors:
+        raise errors[0]
+
+    if missing_GAAP != []:
+        print('以下の会社からGAAP指標を抜き出すことに失敗しました。')
+        for name in missing_GAAP:
+            print(name)
+    if missing_main_measure != []:
+        print('以下の会社から主要な指標を抜き出すことに失敗しました。')
+        for name in missing_main_measure:
+            print(name)
+    print(f'{len(json_file_paths)}件のJSONファイルを保存しました({format_seconds(time.perf_counter() - start)})。')
+    return json_file_paths
+
+
+def main():
+    today = f'{datetime.today():%Y-%m-%d}'
+    parser = argparse.ArgumentParser(description='書類のダウンロードとCSVファイルの処理を重ねて実行する')
+    parser.add_argument('--start', default=today, help='開始日 (YYYY-MM-DD, 省略時は当日)')
+    parser.add_argument('--end', default=None, help='終了日 (YYYY-MM-DD, この日を含む, 省略時は開始日)')
+    parser.add_argument('--workers', type=int, default=4, help='同時にダウンロードする日付の数')
+    parser.add_argument('--concurrency', type=int, default=2, help='1日あたり同時にダウンロードする書類の数')
+    parser.add_argument('--rate', type=float, default=1.0, help='全体のリクエストの速さの上限(回/秒)')
+    parser.add_argument('--processes', type=int, default=None, help='CSVファイルを処理するプロセスの数')
+    parser.add_argument('--queue-size', type=int, default=32, help='処理を待つZIPファイルの最大数')
+    args = parser.parse_args()
+
+    with open('config.json', 'r') as config_file:
+        config = json.load(config_file)
+    json_file_paths = run_pipeline(date_range(args.start, args.end or args.start), workers=args.workers,
+                                   concurrency=args.concurrency, rate=args.rate, processes=args.processes,
+                                   queue_size=args.queue_size, archive=config.get("archive_facts", False),
+                                   use_csv_cache=config.get("csv_cache", False))
+    if config.get("publish_snapshot", False) and json_file_paths:
+        build_snapshot()
+    if config.get("warmup_charts", False) and json_file_paths:
+        warmup_charts(json_file_paths)
+
+
+if __name__ == '__main__':
+    main()
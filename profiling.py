@@ -0,0 +1,298 @@
+import os
+import sys
+import json
+import time
+import heapq
+import cProfile
+import argparse
+import resource
+import tracemalloc
+from datetime import datetime
+from contextlib import contextmanager
+
+PROFILE_DIR = 'profiles'
+# 要約に表示するファイルの数
+SLOWEST_FILES = 10
+
+
+class StageProfiler:
+    """
+    処理の段階(ステージ)ごと・ファイルごとに経過時間、CPU時間、メモリ使用量を記録するクラス。
+
+    main()の各段階(ZIPファイルの展開、CSVファイルの読み込み、データの抽出、索引の更新、JSONファイルの書き込み、
+    CSVファイルの名前の変更、グラフの描画など)をstage()で囲むと、1回ごとに次の値を記録する。
+
+    - wall: 経過時間(time.perf_counter)。
+    - cpu: 段階を実行したスレッドのCPU時間(time.thread_time)。wallより大幅に小さい段階は入出力や他のスレッドを
+      待っている。バックグラウンドのスレッド(stream_windowを指定した場合のZIPファイルの抽出など)のCPU時間は含まない。
+    - peak_memory: 段階の中で増えたPythonのメモリ(NumPyとpandasの配列を含む)の最大値(tracemalloc)。
+    - net_memory: 段階の後に残ったメモリの増減。
+      tracemallocはプロセス全体のメモリを測るため、peak_memoryとnet_memoryには同時に動いている
+      バックグラウンドのスレッドが確保したメモリも含まれる。
+
+    enabled=Falseの場合、stage()とfile()は何も記録しないため、常に呼び出しておいてよい。
+    cprofile_topを指定すると、ファイルごとにcProfileで関数単位の時間を測り、最も遅かったファイルの結果のみを
+    .profファイルとして保存する(snakevizやflameprofでフレームグラフとして表示できる)。
+    cProfileを使うと全体の時間は長くなるため、段階ごとの時間はcProfileを使わない実行で比べる。
+
+    Attributes
+    ----------
+    enabled : bool
+        記録するかどうか。
+    trace_memory : bool
+        tracemallocでメモリ使用量を記録するかどうか。
+    cprofile_top : int
+        cProfileの結果を保存する、最も遅かったファイルの数。0の場合はcProfileを使わない。
+    records : list of dict
+        stage()の1回ごとの記録(stage, file, wall, cpu, peak_memory, net_memory)。
+    """
+
+    def __init__(self, enabled: bool = True, trace_memory: bool = True, cprofile_top: int = 0):
+        self.enabled = enabled
+        self.trace_memory = enabled and trace_memory
+        self.cprofile_top = cprofile_top if enabled else 0
+        self.records = []
+        self.file_walls = {}
+        # (経過時間, 順番, ファイル, cProfile.Profile)の最小ヒープ. 最も遅いcprofile_top件だけを残す.
+        self._profiles = []
+        self._started_wall = time.perf_counter()
+        self._started_cpu = time.process_time()
+        self._started_at = datetime.now()
+        # 保存したレポートから組み立て直した場合の(経過時間, CPU時間, 最大常駐メモリ)
+        self._totals = None
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name: str, file: str | None = None):
+        """
+        段階の経過時間、CPU時間、メモリ使用量を記録するコンテキストマネージャー
+
+        Parameters
+        ----------
+        name : str
+            段階の名前(例: 'read_csv')。
+        file : str, optional
+            処理しているファイルのパス。ファイルによらない段階(スナップショットの作成など)ではNone。
+        """
+        if not self.enabled:
+            yield
+            return
+        if self.trace_memory:
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        try:
+            yield
+        finally:
+            record = {'stage': name, 'file': file, 'wall': time.perf_counter() - wall,
+                      'cpu': time.thread_time() - cpu}
+            if self.trace_memory:
+                current, peak = tracemalloc.get_traced_memory()
+                record['peak_memory'] = max(peak - before, 0)
+                record['net_memory'] = current - before
+            self.records.append(record)
+
+    @contextmanager
+    def file(self, file: str):
+        """
+        1つのファイルの処理全体の経過時間を記録するコンテキストマネージャー. cprofile_topを指定した場合はcProfileも使う.
+        """
+        if not self.enabled:
+            yield
+            return
+        profile = cProfile.Profile() if self.cprofile_top else None
+        wall = time.perf_counter()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+            wall = time.perf_counter() - wall
+            self.file_walls[file] = self.file_walls.get(file, 0.0) + wall
+            if profile is not None:
+                entry = (wall, len(self.records), file, profile)
+                if len(self._profiles) < self.cprofile_top:
+                    heapq.heappush(self._profiles, entry)
+                else:
+                    heapq.heappushpop(self._profiles, entry)
+
+    @classmethod
+    def from_report(cls, report: dict) -> 'StageProfiler':
+        """
+        write_reportで保存したレポートからプロファイラを組み立て直す関数. 要約の表示に使う.
+        """
+        profiler = cls(enabled=True, trace_memory=False)
+        profiler.records = report['records']
+        profiler.file_walls = {entry['file']: entry['wall'] for entry in report['files']}
+        profiler._started_at = datetime.fromisoformat(report['started_at'])
+        profiler._totals = (report['wall'], report['cpu'], report['max_rss'])
+        return profiler
+
+    def totals(self) -> tuple[float, float, int]:
+        """
+        開始からの経過時間、CPU時間、プロセスの最大常駐メモリ(バイト)を返す関数
+        """
+        if self._totals is not None:
+            return self._totals
+        return time.perf_counter() - self._started_wall, time.process_time() - self._started_cpu, max_rss_bytes()
+
+    def stage_summary(self) -> list[dict]:
+        """
+        段階ごとの合計を、経過時間の合計の大きい順に返す関数
+        """
+        total_wall = self.totals()[0]
+        stages = {}
+        for record in self.records:
+            stage = stages.setdefault(record['stage'], {'stage': record['stage'], 'calls': 0, 'wall': 0.0,
+                                                        'max_wall': 0.0, 'cpu': 0.0, 'peak_memory': 0})
+            stage['calls'] += 1
+            stage['wall'] += record['wall']
+            stage['max_wall'] = max(stage['max_wall'], record['wall'])
+            stage['cpu'] += record['cpu']
+            stage['peak_memory'] = max(stage['peak_memory'], record.get('peak_memory', 0))
+        for stage in stages.values():
+            stage['mean_wall'] = stage['wall'] / stage['calls']
+            stage['share'] = stage['wall'] / total_wall if total_wall else 0.0
+        return sorted(stages.values(), key=lambda stage: -stage['wall'])
+
+    def file_summary(self) -> list[dict]:
+        """
+        ファイルごとの段階別の経過時間を、ファイル全体の経過時間の大きい順に返す関数
+        """
+        files = {}
+        for record in self.records:
+            if record['file'] is None:
+                continue
+            entry = files.setdefault(record['file'], {'file': record['file'], 'wall': 0.0, 'cpu': 0.0,
+                                                      'peak_memory': 0, 'stages': {}})
+            entry['stages'][record['stage']] = entry['stages'].get(record['stage'], 0.0) + record['wall']
+            entry['cpu'] += record['cpu']
+            entry['peak_memory'] = max(entry['peak_memory'], record.get('peak_memory', 0))
+        for file, entry in files.items():
+            # file()で囲んだ場合はその時間を、そうでなければ段階の合計をファイルの時間とする
+            entry['wall'] = self.file_walls.get(file, sum(entry['stages'].values()))
+        return sorted(files.values(), key=lambda entry: -entry['wall'])
+
+    def summary(self, slowest: int = SLOWEST_FILES) -> str:
+        """
+        段階ごとの合計と最も遅かったファイルの表を文字列で返す関数
+        """
+        total_wall, total_cpu, max_rss = self.totals()
+        stages = self.stage_summary()
+        lines = [f'全体: 経過時間 {total_wall:.2f}秒, CPU時間 {total_cpu:.2f}秒, 最大常駐メモリ {max_rss / 2 ** 20:.0f}MB',
+                 f'{"stage":<16}{"calls":>7}{"wall[s]":>10}{"mean[ms]":>10}{"max[ms]":>10}{"cpu[s]":>9}'
+                 f'{"cpu/wall":>9}{"peak[MB]":>10}{"share":>8}']
+        for stage in stages:
+            lines.append(f'{stage["stage"]:<16}{stage["calls"]:>7}{stage["wall"]:>10.3f}'
+                         f'{stage["mean_wall"] * 1000:>10.1f}{stage["max_wall"] * 1000:>10.1f}{stage["cpu"]:>9.3f}'
+                         f'{stage["cpu"] / stage["wall"] if stage["wall"] else 0:>9.2f}'
+                         f'{stage["peak_memory"] / 2 ** 20:>10.1f}{stage["share"]:>8.1%}')
+        unaccounted = total_wall - sum(stage['wall'] for stage in stages)
+        lines.append(f'{"(other)":<16}{"":>7}{unaccounted:>10.3f}{"":>48}'
+                     f'{unaccounted / total_wall if total_wall else 0:>8.1%}')
+        files = self.file_summary()[:slowest]
+        if files:
+            lines.append(f'最も遅かった{len(files)}件のファイル:')
+            for entry in files:
+                breakdown = ', '.join(f'{name} {seconds * 1000:.0f}ms'
+                                      for name, seconds in sorted(entry['stages'].items(), key=lambda item: -item[1]))
+                lines.append(f'  {entry["wall"] * 1000:>8.0f}ms  {entry["file"]}  ({breakdown})')
+        return '\n'.join(lines)
+
+    def write_report(self, profile_dir: str = PROFILE_DIR) -> str:
+        """
+        記録をJSONファイルに保存し、cProfileの結果を.profファイルに保存する関数
+
+        Parameters
+        ----------
+        profile_dir : str
+            保存先のディレクトリのパス。
+
+        Returns
+        -------
+        str
+            保存したJSONファイルのパス。
+        """
+        os.makedirs(profile_dir, exist_ok=True)
+        name = f'profile_{self._started_at:%Y%m%d_%H%M%S}'
+        cprofile_files = []
+        for rank, (wall, _, file, profile) in enumerate(sorted(self._profiles, key=lambda entry: -entry[0]), 1):
+            path = os.path.join(profile_dir, f'{name}_{rank}_{os.path.splitext(os.path.basename(file))[0]}.prof')
+            profile.dump_stats(path)
+            cprofile_files.append({'file': file, 'wall': wall, 'profile': path})
+        total_wall, total_cpu, max_rss = self.totals()
+        report = {
+            'started_at': self._started_at.isoformat(timespec='seconds'),
+            'wall': total_wall,
+            'cpu': total_cpu,
+            'max_rss': max_rss,
+            'trace_memory': self.trace_memory,
+            'stages': self.stage_summary(),
+            'files': self.file_summary(),
+            'cprofile': cprofile_files,
+            'records': self.records,
+        }
+        report_path = os.path.join(profile_dir, f'{name}.json')
+        tmp_path = f'{report_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=4)
+        os.replace(tmp_path, report_path)
+        return report_path
+
+    def finish(self, profile_dir: str = PROFILE_DIR) -> str | None:
+        """
+        要約を表示してレポートを保存する関数. 記録していない場合は何もしない.
+        """
+        if not self.enabled:
+            return None
+        print(self.summary())
+        report_path = self.write_report(profile_dir)
+        print(f'プロファイルを保存しました: {report_path}')
+        if self.trace_memory:
+            tracemalloc.stop()
+        return report_path
+
+
+def max_rss_bytes() -> int:
+    """
+    プロセスの最大常駐メモリ(バイト)を返す関数
+    """
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOSはバイト、Linuxはキロバイトで返す
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+# 記録しないプロファイラ. プロファイラを渡されなかった場合に使う.
+NULL_PROFILER = StageProfiler(enabled=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='保存したプロファイルの要約を表示する')
+    parser.add_argument('report', nargs='?', default=None, help='レポートのJSONファイル(省略時は最新のレポート)')
+    parser.add_argument('--profile-dir', default=PROFILE_DIR, help='レポートの保存先')
+    parser.add_argument('--slowest', type=int, default=SLOWEST_FILES, help='表示するファイルの数')
+    args = parser.parse_args()
+
+    report_path = args.report
+    if report_path is None:
+        reports = sorted(file_name for file_name in os.listdir(args.profile_dir)
+                         if file_name.startswith('profile_') and file_name.endswith('.json')) \
+            if os.path.isdir(args.profile_dir) else []
+        if not reports:
+            parser.error(f'レポートが見つかりませんでした: {args.profile_dir}')
+        report_path = os.path.join(args.profile_dir, reports[-1])
+    with open(report_path, 'r', encoding='utf-8') as f:
+        report = json.load(f)
+    print(f'{report_path} ({report["started_at"]})')
+    print(StageProfiler.from_report(report).summary(args.slowest))
+    for entry in report['cprofile']:
+        print(f'cProfile: {entry["profile"]} ({entry["wall"] * 1000:.0f}ms, {entry["file"]})')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,225 @@
+import os
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from snapshot import SNAPSHOT_PATH, MetricsSnapshot, build_snapshot
+
+# 会計基準によらない指標名と、それに対応する(IFRSのデータ項目, J-GAAPのデータ項目)
+UNIFIED_ITEMS = {
+    'Sales': ('IFRSSales', 'Sales'),
+    'OperatingProfits': ('IFRSOperatingProfits', 'OperatingProfits'),
+    'NetIncome': ('IFRSNetIncome', 'NetIncome'),
+    'Assets': ('IFRSAssets', 'Assets'),
+    'CurrentAssets': ('IFRSCurrentAssets', 'CurrentAssets'),
+    'NonCurrentAssets': ('IFRSNonCurrentAssets', 'NonCurrentAssets'),
+    'Liabilities': ('IFRSLiabilities', 'Liabilities'),
+    'CurrentLiabilities': ('IFRSCurrentLiabilities', 'CurrentLiabilities'),
+    'NonCurrentLiabilities': ('IFRSNonCurrentLiabilities', 'NonCurrentLiabilities'),
+    'Interest-bearingCurrentLiabilities': ('IFRSInterest-bearingCurrentLiabilities',
+                                           'Interest-bearingCurrentLiabilities'),
+    'Interest-bearingNonCurrentLiabilities': ('IFRSInterest-bearingNonCurrentLiabilities',
+                                              'Interest-bearingNonCurrentLiabilities'),
+    'NetAssets': ('IFRSNetAssets', 'NetAssets'),
+}
+
+# 指標名と、(分子の指標の組, 分母の指標の組)。分子・分母はそれぞれ組の指標の合計。
+RATIOS = {
+    'EquityRatio': (('NetAssets',), ('Assets',)),
+    'CurrentRatio': (('CurrentAssets',), ('CurrentLiabilities',)),
+    'DebtEquityRatio': (('Interest-bearingCurrentLiabilities', 'Interest-bearingNonCurrentLiabilities'),
+                        ('NetAssets',)),
+    'OperatingMargin': (('OperatingProfits',), ('Sales',)),
+    'ROE': (('NetIncome',), ('NetAssets',)),
+}
+
+# 前期比の伸び率を計算する指標
+GROWTH_ITEMS = ('Sales', 'OperatingProfits', 'NetIncome', 'Assets', 'NetAssets')
+# 前期とみなす当会計期間終了日の間隔(日). 1年(365日または366日)に月末の違いなどの余裕を持たせる.
+ANNUAL_GAP_DAYS = (350, 380)
+
+
+def unified_columns(snapshot: MetricsSnapshot) -> tuple[dict, np.ndarray]:
+    """
+    IFRSとJ-GAAPのデータ項目を会計基準によらない列にまとめる関数
+
+    main.isIFRSと同じく、IFRSのデータ項目が1つでも見つかった行をIFRSの行とし、
+    IFRSの行ではIFRSのデータ項目を、それ以外の行ではJ-GAAPのデータ項目を使う。
+    値が見つからない(-1)場合はNaNにする。
+
+    Parameters
+    ----------
+    snapshot : MetricsSnapshot
+        全社の指標のスナップショット。
+
+    Returns
+    -------
+    tuple of (dict, np.ndarray)
+        指標名をキー、float64の列を値とする辞書と、各行がIFRSかどうかを表すbool配列。
+    """
+    n_rows = len(snapshot)
+
+    def column(key: str) -> np.ndarray:
+        if key not in snapshot.column:
+            return np.full(n_rows, np.nan)
+        values = snapshot.values[:, snapshot.column[key]].astype(np.float64)
+        values[values == -1] = np.nan
+        return values
+
+    ifrs_columns = [snapshot.column[key] for key in snapshot.numeric_keys.tolist()
+                    if key.startswith('IFRS') and key in snapshot.column]
+    is_ifrs = (snapshot.values[:, ifrs_columns] != -1).any(axis=1) if ifrs_columns else np.zeros(n_rows, bool)
+    columns = {}
+    for name, (ifrs_key, gaap_key) in UNIFIED_ITEMS.items():
+        columns[name] = np.where(is_ifrs, column(ifrs_key), column(gaap_key))
+    return columns, is_ifrs
+
+
+def compute_ratios(columns: dict, ratios: dict = RATIOS) -> dict:
+    """
+    指標の列から比率を計算する関数
+
+    分子・分母の指標が1つでも欠けている行と、分母が0の行はNaNにする。
+
+    Parameters
+    ----------
+    columns : dict
+        指標名をキー、float64の列を値とする辞書。
+    ratios : dict
+        比率名をキー、(分子の指標の組, 分母の指標の組)を値とする辞書。
+
+    Returns
+    -------
+    dict
+        比率名をキー、float64の列を値とする辞書。
+    """
+    results = {}
+    for name, (numerator_items, denominator_items) in ratios.items():
+        numerator = np.sum([columns[item] for item in numerator_items], axis=0)
+        denominator = np.sum([columns[item] for item in denominator_items], axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            results[name] = np.where(denominator != 0, numerator / denominator, np.nan)
+    return results
+
+
+def compute_growth(columns: dict, secCodes: np.ndarray, periods: np.ndarray,
+                   items: tuple[str, ...] = GROWTH_ITEMS) -> dict:
+    """
+    同じ会社の1つ前の期からの伸び率を計算する関数
+
+    会社ごとに当会計期間終了日の順に並べ、直前の期の値に対する伸び率(当期 / 前期 - 1)を計算する。
+    直前の期の終了日との間隔がおよそ1年(ANNUAL_GAP_DAYS)の場合のみ前期とみなし、
+    途中の年度が欠けている場合や決算期を変更した場合(2023-12-31の次が2024-03-31など)はNaNにする。
+    前期がない行、どちらかの値が欠けている行、前期の値が0以下の行もNaNにする。
+
+    Parameters
+    ----------
+    columns : dict
+        指標名をキー、float64の列を値とする辞書。
+    secCodes : np.ndarray
+        各行の証券コード。
+    periods : np.ndarray
+        各行の当会計期間終了日(YYYY-MM-DD)。
+    items : tuple of str
+        伸び率を計算する指標名。
+
+    Returns
+    -------
+    dict
+        `{指標名}Growth`をキー、元の行の順のfloat64の列を値とする辞書。
+    """
+    order = np.lexsort((periods, secCodes))
+    # 並べ替えた後に直前の行が同じ会社で、終了日がおよそ1年前であれば前期とみなす
+    has_previous = np.zeros(len(order), dtype=bool)
+    has_previous[1:] = secCodes[order][1:] == secCodes[order][:-1]
+    # 日付でない終了日はNaTになり、間隔の比較は常に偽になる
+    dates = pd.to_datetime(pd.Series(periods[order]), format='%Y-%m-%d', errors='coerce').to_numpy()
+    gaps = (dates[1:] - dates[:-1]) / np.timedelta64(1, 'D')
+    has_previous[1:] &= (gaps >= ANNUAL_GAP_DAYS[0]) & (gaps <= ANNUAL_GAP_DAYS[1])
+    results = {}
+    for item in items:
+        values = columns[item][order]
+        previous = np.full(len(order), np.nan)
+        previous[1:] = values[:-1]
+        previous[~has_previous | (previous <= 0)] = np.nan
+        growth = np.empty(len(order))
+        growth[order] = values / previous - 1
+        results[f'{item}Growth'] = growth
+    return results
+
+
+def build_metrics_frame(snapshot: MetricsSnapshot, ratios: dict = RATIOS,
+                        growth_items: tuple[str, ...] = GROWTH_ITEMS) -> pd.DataFrame:
+    """
+    全社・全期間の指標、比率、伸び率を1つのDataFrameにまとめる関数
+
+    Parameters
+    ----------
+    snapshot : MetricsSnapshot
+        全社の指標のスナップショット。
+    ratios : dict
+        計算する比率の定義(RATIOSと同じ形式)。
+    growth_items : tuple of str
+        前期比の伸び率を計算する指標名。
+
+    Returns
+    -------
+    pd.DataFrame
+        1行が1社の1期間。secCode, CompanyName, EndDate, isIFRS, json_file, 指標, 比率, 伸び率の列を持つ。
+    """
+    columns, is_ifrs = unified_columns(snapshot)
+    frame = {
+        'secCode': snapshot.secCodes,
+        'CompanyName': snapshot.text('CompanyName'),
+        'EndDate': snapshot.periods,
+        'isIFRS': is_ifrs,
+        'json_file': snapshot.json_files,
+    }
+    frame.update(columns)
+    frame.update(compute_ratios(columns, ratios))
+    frame.update(compute_growth(columns, snapshot.secCodes, snapshot.periods, growth_items))
+    return pd.DataFrame(frame)
+
+
+def latest_periods(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    会社ごとに最新の期間の行だけを返す関数
+    """
+    return df.sort_values(['secCode', 'EndDate']).drop_duplicates('secCode', keep='last').reset_index(drop=True)
+
+
+def load_snapshot(snapshot_path: str = SNAPSHOT_PATH) -> MetricsSnapshot:
+    """
+    スナップショットを読み込む関数。存在しない場合はjson_file/から作成する。
+    """
+    if not os.path.exists(snapshot_path):
+        build_snapshot(snapshot_path=snapshot_path)
+    return MetricsSnapshot.load(snapshot_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='全社の財務比率と前期比の伸び率を計算する')
+    parser.add_argument('--ratios', nargs='*', default=list(RATIOS), choices=list(RATIOS), help='計算する比率')
+    parser.add_argument('--latest', action='store_true', help='会社ごとに最新の期間のみを出力する')
+    parser.add_argument('--output', help='結果を保存するCSVファイルのパス')
+    parser.add_argument('--snapshot', default=SNAPSHOT_PATH, help='スナップショットのパス')
+    args = parser.parse_args()
+
+    snapshot = load_snapshot(args.snapshot)
+    start = time.perf_counter()
+    df = build_metrics_frame(snapshot, {name: RATIOS[name] for name in args.ratios})
+    if args.latest:
+        df = latest_periods(df)
+    elapsed = time.perf_counter() - start
+    if args.output:
+        df.to_csv(args.output, index=False)
+        print(f'{len(df)}件を{args.output}に保存しました。')
+    else:
+        with pd.option_context('display.max_rows', 50, 'display.width', 200):
+            print(df[['secCode', 'CompanyName', 'EndDate', 'isIFRS', *args.ratios,
+                      *[f'{item}Growth' for item in GROWTH_ITEMS]]])
+    print(f'{len(snapshot)}件の期間から計算しました({elapsed * 1000:.1f}ms)。')
+
+
+if __name__ == '__main__':
+    main()
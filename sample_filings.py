@@ -0,0 +1,429 @@
+import io
+import os
+import sys
+import random
+import zipfile
+import argparse
+import datetime
+
+# XBRL_TO_CSVのCSVファイルの列. EDINETのCSVファイルと同じ順番.
+CSV_COLUMNS = ('要素ID', '項目名', 'コンテキストID', '相対年度', '連結・個別', '期間・時点', 'ユニットID', '単位', '値')
+# 既定の行数の分布. 小さな会社の1千行程度から、セグメントや注記の多い大企業の20万行程度まで.
+DEFAULT_SIZES = (1000, 5000, 20000, 50000, 200000)
+# 連結の5年間の経営指標等のコンテキスト(コンテキストID, 相対年度)
+SUMMARY_YEARS = (('CurrentYear', '当期'), ('Prior1Year', '前期'), ('Prior2Year', '前々期'),
+                 ('Prior3Year', '三期前'), ('Prior4Year', '四期前'))
+NON_CONSOLIDATED = '_NonConsolidatedMember'
+
+# 主要な経営指標等(jpcrp_cor). (要素ID, 項目名, 期間・時点, 主要な指標の名前)
+JGAAP_SUMMARY = (
+    ('jpcrp_cor:NetSalesSummaryOfBusinessResults', '売上高、経営指標等', '期間', 'sales'),
+    ('jpcrp_cor:OrdinaryIncomeLossSummaryOfBusinessResults', '経常利益又は経常損失（△）、経営指標等', '期間', 'ordinary'),
+    ('jpcrp_cor:ProfitLossAttributableToOwnersOfParentSummaryOfBusinessResults',
+     '親会社株主に帰属する当期純利益又は親会社株主に帰属する当期純損失（△）、経営指標等', '期間', 'net_income'),
+    ('jpcrp_cor:NetAssetsSummaryOfBusinessResults', '純資産額、経営指標等', '時点', 'net_assets'),
+    ('jpcrp_cor:TotalAssetsSummaryOfBusinessResults', '総資産額、経営指標等', '時点', 'assets'),
+)
+IFRS_SUMMARY = (
+    ('jpcrp_cor:RevenueIFRSSummaryOfBusinessResults', '売上収益（IFRS）、経営指標等', '期間', 'sales'),
+    ('jpcrp_cor:ProfitLossBeforeTaxIFRSSummaryOfBusinessResults', '税引前利益（IFRS）、経営指標等', '期間', 'ordinary'),
+    ('jpcrp_cor:ProfitLossAttributableToOwnersOfParentIFRSSummaryOfBusinessResults',
+     '親会社の所有者に帰属する当期利益（IFRS）、経営指標等', '期間', 'net_income'),
+    ('jpcrp_cor:EquityAttributableToOwnersOfParentIFRSSummaryOfBusinessResults',
+     '親会社の所有者に帰属する持分（IFRS）、経営指標等', '時点', 'net_assets'),
+    ('jpcrp_cor:TotalAssetsIFRSSummaryOfBusinessResults', '資産合計（IFRS）、経営指標等', '時点', 'assets'),
+)
+# 財務諸表本表. J-GAAPは日本基準の財務諸表(jppfs_cor)、IFRSは指定国際会計基準の財務諸表(jpigp_cor).
+JGAAP_STATEMENTS = (
+    ('jppfs_cor:CurrentAssets', '流動資産', '時点', 'current_assets'),
+    ('jppfs_cor:NoncurrentAssets', '固定資産', '時点', 'noncurrent_assets'),
+    ('jppfs_cor:Assets', '資産', '時点', 'assets'),
+    ('jppfs_cor:CurrentLiabilities', '流動負債', '時点', 'current_liabilities'),
+    ('jppfs_cor:NoncurrentLiabilities', '固定負債', '時点', 'noncurrent_liabilities'),
+    ('jppfs_cor:Liabilities', '負債', '時点', 'liabilities'),
+    ('jppfs_cor:NetAssets', '純資産', '時点', 'net_assets'),
+    ('jppfs_cor:LiabilitiesAndNetAssets', '負債純資産', '時点', 'assets'),
+    ('jppfs_cor:NetSales', '売上高', '期間', 'sales'),
+    ('jppfs_cor:OperatingIncome', '営業利益又は営業損失（△）', '期間', 'operating'),
+    ('jppfs_cor:OrdinaryIncome', '経常利益又は経常損失（△）', '期間', 'ordinary'),
+    ('jppfs_cor:ProfitLoss', '当期純利益又は当期純損失（△）', '期間', 'net_income'),
+)
+IFRS_STATEMENTS = (
+    ('jpigp_cor:CurrentAssetsIFRS', '流動資産（IFRS）', '時点', 'current_assets'),
+    ('jpigp_cor:NonCurrentAssetsIFRS', '非流動資産（IFRS）', '時点', 'noncurrent_assets'),
+    ('jpigp_cor:AssetsIFRS', '資産（IFRS）', '時点', 'assets'),
+    ('jpigp_cor:InterestBearingLiabilitiesCLIFRS', '有利子負債、流動負債（IFRS）', '時点', 'interest_current'),
+    ('jpigp_cor:TotalCurrentLiabilitiesIFRS', '流動負債（IFRS）', '時点', 'current_liabilities'),
+    ('jpigp_cor:InterestBearingLiabilitiesNCLIFRS', '有利子負債、非流動負債（IFRS）', '時点', 'interest_noncurrent'),
+    ('jpigp_cor:NonCurrentLabilitiesIFRS', '非流動負債（IFRS）', '時点', 'noncurrent_liabilities'),
+    ('jpigp_cor:LiabilitiesIFRS', '負債（IFRS）', '時点', 'liabilities'),
+    ('jpigp_cor:EquityIFRS', '資本（IFRS）', '時点', 'net_assets'),
+    ('jpigp_cor:LiabilitiesAndEquityIFRS', '負債及び資本（IFRS）', '時点', 'assets'),
+    ('jpigp_cor:RevenueIFRS', '売上収益（IFRS）', '期間', 'sales'),
+    ('jpigp_cor:OperatingProfitLossIFRS', '営業利益（△は損失）（IFRS）', '期間', 'operating'),
+    ('jpigp_cor:ProfitLossBeforeTaxIFRS', '税引前利益（△は損失）（IFRS）', '期間', 'ordinary'),
+    ('jpigp_cor:ProfitLossIFRS', '当期利益（△は損失）（IFRS）', '期間', 'net_income'),
+)
+# 明細・注記の行に使う要素(要素ID, 項目名)
+DETAIL_ELEMENTS = (
+    ('jppfs_cor:CashAndDeposits', '現金及び預金'), ('jppfs_cor:NotesAndAccountsReceivableTrade', '受取手形及び売掛金'),
+    ('jppfs_cor:Merchandise', '商品'), ('jppfs_cor:WorkInProcess', '仕掛品'),
+    ('jppfs_cor:RawMaterialsAndSupplies', '原材料及び貯蔵品'), ('jppfs_cor:BuildingsAndStructuresNet', '建物及び構築物（純額）'),
+    ('jppfs_cor:MachineryEquipmentAndVehiclesNet', '機械装置及び運搬具（純額）'), ('jppfs_cor:Land', '土地'),
+    ('jppfs_cor:ConstructionInProgress', '建設仮勘定'), ('jppfs_cor:Goodwill', 'のれん'),
+    ('jppfs_cor:Software', 'ソフトウエア'), ('jppfs_cor:InvestmentSecurities', '投資有価証券'),
+    ('jppfs_cor:DeferredTaxAssets', '繰延税金資産'), ('jppfs_cor:NotesAndAccountsPayableTrade', '支払手形及び買掛金'),
+    ('jppfs_cor:ShortTermLoansPayable', '短期借入金'), ('jppfs_cor:LongTermLoansPayable', '長期借入金'),
+    ('jppfs_cor:BondsPayable', '社債'), ('jppfs_cor:IncomeTaxesPayable', '未払法人税等'),
+    ('jppfs_cor:ProvisionForBonuses', '賞与引当金'), ('jppfs_cor:CapitalStock', '資本金'),
+    ('jppfs_cor:CapitalSurplus', '資本剰余金'), ('jppfs_cor:RetainedEarnings', '利益剰余金'),
+    ('jppfs_cor:TreasuryStock', '自己株式'), ('jppfs_cor:CostOfSales', '売上原価'),
+    ('jppfs_cor:GrossProfit', '売上総利益'), ('jppfs_cor:SellingGeneralAndAdministrativeExpenses', '販売費及び一般管理費'),
+    ('jppfs_cor:InterestIncomeNOI', '受取利息、営業外収益'), ('jppfs_cor:InterestExpensesNOE', '支払利息、営業外費用'),
+    ('jppfs_cor:IncomeTaxesCurrent', '法人税、住民税及び事業税'), ('jppfs_cor:DepreciationAndAmortizationOpeCF', '減価償却費、営業活動によるキャッシュ・フロー'),
+    ('jppfs_cor:NetCashProvidedByUsedInOperatingActivities', '営業活動によるキャッシュ・フロー'),
+    ('jppfs_cor:NetCashProvidedByUsedInInvestmentActivities', '投資活動によるキャッシュ・フロー'),
+    ('jppfs_cor:NetCashProvidedByUsedInFinancingActivities', '財務活動によるキャッシュ・フロー'),
+    ('jpcrp_cor:NumberOfEmployees', '従業員数'), ('jpcrp_cor:ResearchAndDevelopmentExpensesResearchAndDevelopmentActivities', '研究開発費'),
+    ('jpcrp_cor:CapitalExpendituresOverviewOfCapitalExpendituresEtc', '設備投資額'),
+)
+# 株主資本等変動計算書の行に使う要素(要素ID, 項目名)
+EQUITY_ELEMENTS = (
+    ('jppfs_cor:CapitalStock', '資本金'), ('jppfs_cor:CapitalSurplus', '資本剰余金'),
+    ('jppfs_cor:RetainedEarnings', '利益剰余金'), ('jppfs_cor:TreasuryStock', '自己株式'),
+)
+# 注記などの文字列の行に使う要素. 本文の記載事項は提出日時点、財務諸表の注記は当期の連結.
+# (要素ID, 項目名, コンテキストID, 相対年度, 連結・個別, 期間・時点)
+TEXT_BLOCKS = (
+    ('jpcrp_cor:BusinessPolicyBusinessEnvironmentIssuesToAddressEtcTextBlock',
+     '経営方針、経営環境及び対処すべき課題等 [テキストブロック]', 'FilingDateInstant', '提出日時点', 'その他', '時点'),
+    ('jpcrp_cor:BusinessRisksTextBlock', '事業等のリスク [テキストブロック]',
+     'FilingDateInstant', '提出日時点', 'その他', '時点'),
+    ('jpcrp_cor:ResearchAndDevelopmentActivitiesTextBlock', '研究開発活動 [テキストブロック]',
+     'FilingDateInstant', '提出日時点', 'その他', '時点'),
+    ('jpcrp_cor:OverviewOfCorporateGovernanceTextBlock', 'コーポレート・ガバナンスの概要 [テキストブロック]',
+     'FilingDateInstant', '提出日時点', 'その他', '時点'),
+    ('jppfs_cor:NotesRegardingSignificantAccountingPoliciesTextBlock', '重要な会計方針 [テキストブロック]',
+     'CurrentYearDuration', '当期', '連結', '期間'),
+    ('jppfs_cor:NotesSegmentInformationEtcConsolidatedFinancialStatementsTextBlock', 'セグメント情報等 [テキストブロック]',
+     'CurrentYearDuration', '当期', '連結', '期間'),
+)
+TEXT_SENTENCES = (
+    '当社グループは、持続的な成長と中長期的な企業価値の向上を目指しております。',
+    '当連結会計年度における我が国経済は、緩やかな回復基調で推移いたしました。',
+    '原材料価格の高騰や為替の変動が当社グループの業績に影響を及ぼす可能性があります。',
+    '研究開発費の総額は前連結会計年度に比べて増加いたしました。',
+    '取締役会は、経営の基本方針その他の重要事項を決定しております。',
+    '有形固定資産の減価償却の方法は、主として定額法を採用しております。',
+)
+# セグメントと株主資本の構成要素のメンバー
+SEGMENTS = ('Automotive', 'Electronics', 'Chemicals', 'Machinery', 'Retail', 'Logistics', 'RealEstate', 'Finance')
+EQUITY_COMPONENTS = ('jppfs_cor:CapitalStockMember', 'jppfs_cor:CapitalSurplusMember',
+                     'jppfs_cor:RetainedEarningsMember', 'jppfs_cor:TreasuryStockMember',
+                     'jppfs_cor:ShareholdersEquityMember', 'jppfs_cor:NonControllingInterestsMember')
+COMPANY_NAMES = ('東洋', '日本', '大和', '中央', '北海', '九州', '関東', '昭和', '富士', '新光')
+COMPANY_SUFFIXES = ('工業', '製作所', '化学', '電機', '商事', '建設', '食品', '精機', '物産', 'ホールディングス')
+
+
+def edinet_code(i: int) -> str:
+    return f'E{1000 + i % 90000:05d}'
+
+
+def sample_company(i: int, seed: int = 0) -> dict:
+    """
+    番号から決まる合成の会社を返す関数
+
+    Returns
+    -------
+    dict
+        edinetCode, secCode(5桁), name, period_end, submitted, docIDの辞書。
+    """
+    rng = random.Random(f'{seed}-company-{i}')
+    name = f'{rng.choice(COMPANY_NAMES)}{rng.choice(COMPANY_SUFFIXES)}{i}株式会社'
+    # 3月決算が多く、12月決算がそれに続く
+    period_end = rng.choices(('2024-03-31', '2023-12-31', '2024-06-30', '2023-09-30'), (70, 20, 5, 5))[0]
+    submitted = (datetime.date.fromisoformat(period_end) + datetime.timedelta(days=rng.randrange(80, 95))).isoformat()
+    return {
+        'edinetCode': edinet_code(i),
+        'secCode': f'{1300 + (i * 7) % 8700:04d}0',
+        'name': name,
+        'period_end': period_end,
+        'submitted': submitted,
+        'docID': f'S1{i:06X}',
+    }
+
+
+def summary_values(rng: random.Random, years: int = 5) -> list[dict]:
+    """
+    当期から過去にさかのぼる各年度の主要な指標を、資産 = 負債 + 純資産などが成り立つように決める関数
+    """
+    sales = rng.randrange(10 ** 9, 10 ** 13)
+    values = []
+    for _ in range(years):
+        assets = int(sales * rng.uniform(0.6, 2.5))
+        current_assets = int(assets * rng.uniform(0.3, 0.7))
+        liabilities = int(assets * rng.uniform(0.2, 0.8))
+        current_liabilities = int(liabilities * rng.uniform(0.3, 0.8))
+        operating = int(sales * rng.uniform(-0.05, 0.2))
+        ordinary = int(operating * rng.uniform(0.8, 1.2))
+        values.append({
+            'sales': sales, 'operating': operating, 'ordinary': ordinary,
+            'net_income': int(ordinary * rng.uniform(0.5, 0.75)),
+            'assets': assets, 'current_assets': current_assets, 'noncurrent_assets': assets - current_assets,
+            'liabilities': liabilities, 'current_liabilities': current_liabilities,
+            'noncurrent_liabilities': liabilities - current_liabilities, 'net_assets': assets - liabilities,
+            'interest_current': int(current_liabilities * rng.uniform(0.05, 0.4)),
+            'interest_noncurrent': int((liabilities - current_liabilities) * rng.uniform(0.1, 0.6)),
+        })
+        # 過去の年度ほど売上が小さい
+        sales = int(sales / rng.uniform(0.95, 1.15))
+    return values
+
+
+def _fact(element: str, label: str, context: str, year: str, scope: str, period: str, value) -> tuple:
+    if isinstance(value, int):
+        return (element, label, context, year, scope, period, 'JPY', '円', str(value))
+    return (element, label, context, year, scope, period, '－', '－', value)
+
+
+def _context(year_context: str, period: str, suffix: str = '') -> str:
+    return f'{year_context}{"Duration" if period == "期間" else "Instant"}{suffix}'
+
+
+def _relative_year(year_label: str, period: str) -> str:
+    # 時点のコンテキストの相対年度は「当期末」「前期末」のように表す
+    return f'{year_label}末' if period == '時点' else year_label
+
+
+def generate_rows(company: dict, rows: int, ifrs: bool, seed: int = 0, submission_number: int = 1,
+                  parent_doc_id: str | None = None, custom_sales: bool = False) -> list[tuple]:
+    """
+    XBRL_TO_CSVのCSVファイルの行を生成する関数
+
+    DEI(jpdei_cor)と表紙、5年間の主要な経営指標等(連結・個別)、財務諸表本表(当期・前期)、
+    明細・注記、セグメント情報、株主資本等変動計算書、テキストブロックの行を、実際の有価証券報告書と同じ
+    要素ID、コンテキストID、相対年度、連結・個別、期間・時点、ユニットID、単位の組み合わせで含める。
+
+    Parameters
+    ----------
+    company : dict
+        sample_companyの戻り値。
+    rows : int
+        行数(列名の行を除く)。DEI、主要な指標などの必須の行より少ない場合は必須の行のみ。
+    ifrs : bool
+        IFRSの書類(連結財務諸表がjpigp_cor、個別財務諸表がjppfs_cor)にするかどうか。
+    seed : int
+        乱数のシード。
+    submission_number : int
+        提出回数。2以上の場合は訂正有価証券報告書にする。
+    parent_doc_id : str, optional
+        訂正対象の書類のdocID。
+    custom_sales : bool
+        IFRSの売上収益を会社独自の要素ID(jpcrp030000-asr_{EDINETコード}-000:NetSalesIFRSSummaryOfBusinessResults)で表すかどうか。
+
+    Returns
+    -------
+    list of tuple
+        CSV_COLUMNSの順の値のタプルのリスト。
+    """
+    # 訂正報告書も訂正前の書類と同じ値になるように、会社と期間から乱数を決める
+    rng = random.Random(f'{seed}-{company["edinetCode"]}-{company["period_end"]}')
+    company_prefix = f'jpcrp030000-asr_{company["edinetCode"]}-000'
+    consolidated = summary_values(rng)
+    non_consolidated = summary_values(rng)
+    amendment = 'true' if submission_number > 1 else 'false'
+    end = datetime.date.fromisoformat(company['period_end'])
+    start = (end.replace(year=end.year - 1) + datetime.timedelta(days=1)).isoformat()
+    dei = (
+        ('jpdei_cor:EDINETCodeDEI', 'EDINETコード、DEI', company['edinetCode']),
+        ('jpdei_cor:FundCodeDEI', 'ファンドコード、DEI', '－'),
+        ('jpdei_cor:SecurityCodeDEI', '証券コード、DEI', company['secCode']),
+        ('jpdei_cor:FilerNameInJapaneseDEI', '提出者名（日本語表記）、DEI', company['name']),
+        ('jpdei_cor:FilerNameInEnglishDEI', '提出者名（英語表記）、DEI', f'Sample Corporation {company["edinetCode"]}'),
+        ('jpdei_cor:AccountingStandardsDEI', '会計基準、DEI', 'IFRS' if ifrs else 'Japan GAAP'),
+        ('jpdei_cor:WhetherConsolidatedFinancialStatementsArePreparedDEI', '連結決算の有無、DEI', 'true'),
+        ('jpdei_cor:IndustryCodeWhenConsolidatedFinancialStatementsArePreparedInAccordanceWithIndustrySpecificRegulationsDEI',
+         '別記事業（連結）、DEI', 'CTE'),
+        ('jpdei_cor:CurrentFiscalYearStartDateDEI', '当事業年度開始日、DEI', start),
+        ('jpdei_cor:CurrentPeriodEndDateDEI', '当会計期間終了日、DEI', company['period_end']),
+        ('jpdei_cor:TypeOfCurrentPeriodDEI', '当会計期間の種類、DEI', 'FY'),
+        ('jpdei_cor:CurrentFiscalYearEndDateDEI', '当事業年度終了日、DEI', company['period_end']),
+        ('jpdei_cor:NumberOfSubmissionDEI', '提出回数、DEI', str(submission_number)),
+        ('jpdei_cor:AmendmentFlagDEI', '訂正の有無、DEI', amendment),
+        ('jpdei_cor:IdentificationOfDocumentSubjectToAmendmentDEI', '訂正対象書類の書類管理番号、DEI',
+         parent_doc_id if parent_doc_id else '－'),
+        ('jpdei_cor:ReportAmendmentFlagDEI', '記載事項訂正のフラグ、DEI', amendment),
+        ('jpdei_cor:XBRLAmendmentFlagDEI', 'XBRL訂正のフラグ、DEI', 'false'),
+    )
+    result = [(element, label, 'FilingDateInstant', '提出日時点', 'その他', '時点', '－', '－', value)
+              for element, label, value in dei]
+    result.append(_fact('jpcrp_cor:CompanyNameCoverPage', '会社名、表紙', 'FilingDateInstant', '提出日時点', 'その他',
+                        '時点', company['name']))
+    result.append(_fact('jpcrp_cor:FilingDateCoverPage', '提出日、表紙', 'FilingDateInstant', '提出日時点', 'その他',
+                        '時点', company['submitted']))
+    result.append(_fact('jpcrp_cor:DocumentTitleCoverPage', '書類名、表紙', 'FilingDateInstant', '提出日時点', 'その他',
+                        '時点', '訂正有価証券報告書' if submission_number > 1 else '有価証券報告書'))
+
+    # 主要な経営指標等. 連結は5年分、個別はJ-GAAPの要素で5年分.
+    for (year_context, year_label), values in zip(SUMMARY_YEARS, consolidated):
+        for element, label, period, key in (IFRS_SUMMARY if ifrs else JGAAP_SUMMARY):
+            if custom_sales and key == 'sales':
+                element = f'{company_prefix}:NetSalesIFRSSummaryOfBusinessResults'
+            result.append(_fact(element, label, _context(year_context, period), _relative_year(year_label, period),
+                                '連結', period, values[key]))
+    for (year_context, year_label), values in zip(SUMMARY_YEARS, non_consolidated):
+        for element, label, period, key in JGAAP_SUMMARY:
+            result.append(_fact(element, label, _context(year_context, period, NON_CONSOLIDATED),
+                                _relative_year(year_label, period), '個別', period, values[key]))
+    # 財務諸表本表. 当期と前期の2年分. IFRSの会社も個別財務諸表は日本基準.
+    for (year_context, year_label), values in zip(SUMMARY_YEARS[:2], consolidated):
+        for element, label, period, key in (IFRS_STATEMENTS if ifrs else JGAAP_STATEMENTS):
+            result.append(_fact(element, label, _context(year_context, period), _relative_year(year_label, period),
+                                '連結', period, values[key]))
+    for (year_context, year_label), values in zip(SUMMARY_YEARS[:2], non_consolidated):
+        for element, label, period, key in JGAAP_STATEMENTS:
+            result.append(_fact(element, label, _context(year_context, period, NON_CONSOLIDATED),
+                                _relative_year(year_label, period), '個別', period, values[key]))
+
+    # 残りの行は明細・注記、セグメント情報、株主資本等変動計算書、テキストブロックで埋める.
+    # 大きな書類ほどメンバー(セグメント、構成要素、明細の番号)が多い.
+    segments = [f'{company_prefix}:{name}ReportableSegmentMember' for name in SEGMENTS[:rng.randrange(2, len(SEGMENTS))]]
+    required = len(result)
+    while len(result) < rows:
+        kind = rng.random()
+        year_context, year_label = SUMMARY_YEARS[rng.randrange(2)]
+        if kind < 0.55:
+            element, label = DETAIL_ELEMENTS[rng.randrange(len(DETAIL_ELEMENTS))]
+            period = '期間' if 'Expenses' in element or 'Activities' in element or 'Cost' in element else '時点'
+            suffix = NON_CONSOLIDATED if rng.random() < 0.4 else ''
+            if rng.random() < 0.7:
+                # 明細表(有形固定資産等明細表、借入金等明細表など)の行
+                suffix = f'{suffix}_{company_prefix}:DetailItem{len(result) // 8:05d}Member'
+            result.append(_fact(element, label, _context(year_context, period, suffix),
+                                _relative_year(year_label, period), '個別' if NON_CONSOLIDATED in suffix else '連結',
+                                period, rng.randrange(-10 ** 9, 10 ** 11)))
+        elif kind < 0.8:
+            element, label = DETAIL_ELEMENTS[rng.randrange(len(DETAIL_ELEMENTS))]
+            segment = segments[rng.randrange(len(segments))]
+            result.append(_fact(element, f'{label}、セグメント情報', _context(year_context, '期間', f'_{segment}'),
+                                year_label, '連結', '期間', rng.randrange(10 ** 6, 10 ** 12)))
+        elif kind < 0.97:
+            element, label = EQUITY_ELEMENTS[rng.randrange(len(EQUITY_ELEMENTS))]
+            component = EQUITY_COMPONENTS[rng.randrange(len(EQUITY_COMPONENTS))]
+            result.append(_fact(element, f'{label}、株主資本等変動計算書', _context(year_context, '時点', f'_{component}'),
+                                _relative_year(year_label, '時点'), '連結', '時点', rng.randrange(10 ** 8, 10 ** 12)))
+        else:
+            # テキストブロックは改行を含む長い文字列
+            text = '\n'.join(rng.choice(TEXT_SENTENCES) * rng.randrange(1, 4) for _ in range(rng.randrange(2, 12)))
+            result.append(_fact(*TEXT_BLOCKS[rng.randrange(len(TEXT_BLOCKS))], text))
+    if rows < required:
+        print(f'{rows}行を指定しましたが、必須の行だけで{required}行になりました。', file=sys.stderr)
+    return result
+
+
+def encode_csv(rows: list[tuple]) -> bytes:
+    """
+    行をEDINETのCSVファイルと同じ形式(BOM付きUTF-16LE、タブ区切り、全ての値をダブルクォートで囲む)にする関数
+    """
+    lines = ['\t'.join(f'"{value}"' for value in CSV_COLUMNS)]
+    lines.extend('\t'.join('"' + str(value).replace('"', '""') + '"' for value in row) for row in rows)
+    return ('\ufeff' + '\r\n'.join(lines) + '\r\n').encode('utf-16le')
+
+
+def filing_zip(company: dict, rows: int, ifrs: bool, seed: int = 0, submission_number: int = 1,
+               parent_doc_id: str | None = None, custom_sales: bool = False) -> bytes:
+    """
+    EDINET APIの書類取得(type=5)と同じ構成のZIPファイルを返す関数
+
+    XBRL_TO_CSV/に有価証券報告書本文のCSVファイル
+    (jpcrp030000-asr-001_{EDINETコード}-000_{当会計期間終了日}_{提出回数}_{提出日}.csv)と、
+    監査報告書のCSVファイル(jpaud-aar-cn-001_..., jpaud-aai-cc-001_...)を含める。
+    引数はgenerate_rowsと同じ。
+
+    Returns
+    -------
+    bytes
+        ZIPファイルの内容。
+    """
+    base = (f'{company["edinetCode"]}-000_{company["period_end"]}_{submission_number:02d}_{company["submitted"]}')
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zip_ref:
+        zip_ref.writestr(f'XBRL_TO_CSV/jpcrp030000-asr-001_{base}.csv',
+                         encode_csv(generate_rows(company, rows, ifrs, seed, submission_number, parent_doc_id,
+                                                  custom_sales)))
+        for prefix, label in (('jpaud-aar-cn-001', '連結'), ('jpaud-aai-cc-001', '個別')):
+            audit = [('jpcrp_cor:IndependentAuditorsReportTextBlock', f'独立監査人の監査報告書、{label}',
+                      'FilingDateInstant', '提出日時点', 'その他', '時点', '－', '－',
+                      f'{company["name"]}の{label}財務諸表は、適正に表示しているものと認める。')]
+            zip_ref.writestr(f'XBRL_TO_CSV/{prefix}_{base}.csv', encode_csv(audit))
+    return buffer.getvalue()
+
+
+def generate_filings(zip_dir: str, count: int, sizes: tuple = DEFAULT_SIZES, ifrs_share: float = 0.3,
+                     amendment_share: float = 0.0, seed: int = 0) -> list[dict]:
+    """
+    合成の有価証券報告書のZIPファイルを{docID}_{証券コード}.zipとして保存する関数
+
+    Parameters
+    ----------
+    zip_dir : str
+        ZIPファイルの保存先のディレクトリのパス。
+    count : int
+        生成する書類の数(訂正有価証券報告書を除く)。
+    sizes : tuple of int
+        行数の候補。書類ごとに順番に割り当てる。
+    ifrs_share : float
+        IFRSの書類の割合。
+    amendment_share : float
+        訂正有価証券報告書を追加する書類の割合。
+    seed : int
+        乱数のシード。
+
+    Returns
+    -------
+    list of dict
+        生成した書類ごとのpath, docID, secCode, rows, ifrs, bytesの辞書のリスト。
+    """
+    rng = random.Random(seed)
+    os.makedirs(zip_dir, exist_ok=True)
+    filings = []
+    for i in range(count):
+        company = sample_company(i, seed)
+        rows = sizes[i % len(sizes)]
+        ifrs = rng.random() < ifrs_share
+        custom_sales = ifrs and rng.random() < 0.2
+        submissions = [(company, 1, None)]
+        if rng.random() < amendment_share:
+            # 訂正有価証券報告書は元の書類の数か月後に提出される
+            submitted = datetime.date.fromisoformat(company['submitted']) + datetime.timedelta(days=rng.randrange(30, 180))
+            submissions.append(({**company, 'docID': f'S2{i:06X}', 'submitted': submitted.isoformat()}, 2,
+                                company['docID']))
+        for filer, submission_number, parent_doc_id in submissions:
+            content = filing_zip(filer, rows, ifrs, seed, submission_number, parent_doc_id, custom_sales)
+            path = os.path.join(zip_dir, f'{filer["docID"]}_{company["secCode"]}.zip')
+            with open(path, 'wb') as f:
+                f.write(content)
+            filings.append({'path': path, 'docID': filer['docID'], 'secCode': company['secCode'], 'rows': rows,
+                            'ifrs': ifrs, 'bytes': len(content)})
+    return filings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='EDINETと同じ形式の合成の有価証券報告書のZIPファイルを生成する')
+    parser.add_argument('--output', default='ZIPs', help='ZIPファイルの保存先')
+    parser.add_argument('--count', type=int, default=10, help='書類の数')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES), help='CSVファイルの行数の候補')
+    parser.add_argument('--ifrs-share', type=float, default=0.3, help='IFRSの書類の割合')
+    parser.add_argument('--amendment-share', type=float, default=0.0, help='訂正有価証券報告書を追加する書類の割合')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    filings = generate_filings(args.output, args.count, tuple(args.sizes), args.ifrs_share, args.amendment_share,
+                               args.seed)
+    print(f'{len(filings)}件のZIPファイル({sum(filing["rows"] for filing in filings)}行、'
+          f'{sum(filing["bytes"] for filing in filings) / 1e6:.1f}MB)を{args.output}に保存しました。')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
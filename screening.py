@@ -0,0 +1,370 @@
+import re
+import ast
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from snapshot import SNAPSHOT_PATH, MetricsSnapshot
+from ratios import RATIOS, GROWTH_ITEMS, unified_columns, compute_ratios, compute_growth, load_snapshot
+
+# 結果に常に含める列
+KEY_COLUMNS = ('secCode', 'CompanyName', 'EndDate', 'isIFRS')
+# 数値の後ろに付けられる単位と倍率(例: 1兆円, 5000億, 50%)
+UNIT_SUFFIXES = {'兆': 10 ** 12, '億': 10 ** 8, '万': 10 ** 4}
+_UNIT_PATTERN = re.compile(r'(\d+(?:\.\d+)?)\s*(兆|億|万)円?')
+_PERCENT_PATTERN = re.compile(r'(\d+(?:\.\d+)?)\s*%')
+
+_COMPARE_OPERATORS = {
+    ast.Lt: np.less, ast.LtE: np.less_equal, ast.Gt: np.greater, ast.GtE: np.greater_equal,
+    ast.Eq: np.equal, ast.NotEq: np.not_equal,
+}
+_BINARY_OPERATORS = {ast.Add: np.add, ast.Sub: np.subtract, ast.Mult: np.multiply, ast.Div: np.divide}
+
+
+class ScreeningError(ValueError):
+    """
+    条件式が不正な場合や、存在しない列を指定した場合に送出される例外
+    """
+
+
+def parse_expression(expression: str) -> list[ast.expr]:
+    """
+    条件式を構文解析し、トップレベルのandで区切った条件のリストを返す関数
+
+    数値の後ろの「兆」「億」「万」(「円」は省略可)と「%」は倍率を掛けた数値に置き換える(例: 1兆円 -> 1e12, 50% -> 0.5)。
+    使える構文は比較(<, <=, >, >=, ==, !=, in, not in)、and, or, not、四則演算、列名、数値と文字列の定数のみ。
+    ハイフンを含む列名(Interest-bearingCurrentLiabilitiesなど)はハイフンを_に置き換えて書く。
+
+    Parameters
+    ----------
+    expression : str
+        条件式(例: "isIFRS and EquityRatio > 50% and Sales > 1兆円")。
+
+    Returns
+    -------
+    list of ast.expr
+        andで結ばれた条件のリスト。
+    """
+    expression = _UNIT_PATTERN.sub(lambda m: repr(float(m.group(1)) * UNIT_SUFFIXES[m.group(2)]), expression)
+    expression = _PERCENT_PATTERN.sub(lambda m: repr(float(m.group(1)) / 100), expression)
+    try:
+        tree = ast.parse(expression.strip(), mode='eval')
+    except SyntaxError as e:
+        raise ScreeningError(f'条件式を解析できません: {e.msg}') from None
+    for node in ast.walk(tree):
+        if not isinstance(node, (ast.Expression, ast.BoolOp, ast.And, ast.Or, ast.UnaryOp, ast.Not, ast.USub,
+                                 ast.BinOp, ast.Compare, ast.Name, ast.Load, ast.Constant, ast.List, ast.Tuple,
+                                 ast.In, ast.NotIn, *_COMPARE_OPERATORS, *_BINARY_OPERATORS)):
+            raise ScreeningError(f'条件式に使えない構文です: {type(node).__name__}')
+    body = tree.body
+    if isinstance(body, ast.BoolOp) and isinstance(body.op, ast.And):
+        return list(body.values)
+    return [body]
+
+
+def referenced_names(node: ast.AST) -> list[str]:
+    """
+    条件に含まれる列名を出現順に重複なく返す関数
+    """
+    return list(dict.fromkeys(child.id for child in ast.walk(node) if isinstance(child, ast.Name)))
+
+
+def _apply(function, node: ast.AST, *operands):
+    # 型の合わない演算(文字列の列と数値の比較など)はNumPyの例外ではなくScreeningErrorとして送出する
+    # (UFuncTypeErrorはTypeErrorのサブクラス)
+    try:
+        return function(*operands)
+    except (TypeError, ValueError):
+        names = ', '.join(referenced_names(node)) or ast.unparse(node)
+        raise ScreeningError(f'型の合わない演算です({names}): {ast.unparse(node)}') from None
+
+
+def evaluate(node: ast.AST, columns: dict):
+    """
+    条件をNumPyの配列演算で評価する関数
+
+    比較の一方が欠損値(NaN)の行は条件を満たさない。
+
+    Parameters
+    ----------
+    node : ast.AST
+        parse_expressionが返した条件。
+    columns : dict
+        列名をキー、配列を値とする辞書。条件に含まれる全ての列を持つ必要がある。
+
+    Returns
+    -------
+    np.ndarray or scalar
+        条件の値。
+    """
+    if isinstance(node, ast.Expression):
+        return evaluate(node.body, columns)
+    if isinstance(node, ast.Name):
+        return columns[node.id]
+    if isinstance(node, ast.Constant):
+        if not isinstance(node.value, (int, float, str, bool)):
+            raise ScreeningError(f'条件式に使えない定数です: {node.value!r}')
+        return node.value
+    if isinstance(node, (ast.List, ast.Tuple)):
+        return [evaluate(element, columns) for element in node.elts]
+    if isinstance(node, ast.BoolOp):
+        values = [np.asarray(evaluate(value, columns), dtype=bool) for value in node.values]
+        reduce = np.logical_and.reduce if isinstance(node.op, ast.And) else np.logical_or.reduce
+        return reduce(np.broadcast_arrays(*values))
+    if isinstance(node, ast.UnaryOp):
+        operand = evaluate(node.operand, columns)
+        if isinstance(node.op, ast.Not):
+            return np.logical_not(np.asarray(operand, dtype=bool))
+        return _apply(np.negative, node, operand)
+    if isinstance(node, ast.BinOp):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            left, right = evaluate(node.left, columns), evaluate(node.right, columns)
+            return _apply(_BINARY_OPERATORS[type(node.op)], node, left, right)
+    if isinstance(node, ast.Compare):
+        # a < b < c は (a < b) and (b < c) として評価する
+        result = True
+        left = evaluate(node.left, columns)
+        for op, comparator in zip(node.ops, node.comparators):
+            right = evaluate(comparator, columns)
+            if isinstance(op, (ast.In, ast.NotIn)):
+                if not isinstance(right, list):
+                    raise ScreeningError('inの右辺はリストで指定してください')
+                matched = _apply(np.isin, node, left, right)
+                matched = matched if isinstance(op, ast.In) else ~matched
+            else:
+                with np.errstate(invalid='ignore'):
+                    matched = _apply(_COMPARE_OPERATORS[type(op)], node, left, right)
+            result = np.logical_and(result, matched)
+            left = right
+        return result
+    raise ScreeningError(f'条件式に使えない構文です: {type(node).__name__}')
+
+
+class Screener:
+    """
+    スナップショットの全社・全期間から条件に合う会社を絞り込むクラス。
+
+    列は次の2種類に分かれる。
+
+    - 基本列: secCode, CompanyName, EndDate, isIFRS, json_file, 会計基準をまとめた指標(Salesなど)と
+      スナップショットの数値のデータ項目(IFRSSalesなど)。スナップショットから直接取り出せる。
+    - 派生列: 比率(EquityRatioなど)と前期比の伸び率(SalesGrowthなど)。
+
+    条件式をandで区切り、基本列だけを参照する条件を先にスナップショットの列に対して評価して行を絞り込む。
+    比率は絞り込んだ後の行についてのみ計算し、残りの条件を評価する。
+    伸び率は前期の行が必要なため、参照された場合に全行について1度だけ計算して保持する。
+
+    Attributes
+    ----------
+    snapshot : MetricsSnapshot
+        全社の指標のスナップショット。
+    ratios : dict
+        比率の定義(ratios.RATIOSと同じ形式)。
+    growth_items : tuple of str
+        前期比の伸び率を計算する指標名。
+    """
+
+    def __init__(self, snapshot: MetricsSnapshot, ratios: dict = RATIOS, growth_items: tuple[str, ...] = GROWTH_ITEMS):
+        self.snapshot = snapshot
+        self.ratios = ratios
+        self.growth_items = growth_items
+        columns, is_ifrs = unified_columns(snapshot)
+        self._base = {
+            'secCode': snapshot.secCodes,
+            'CompanyName': snapshot.text('CompanyName'),
+            'EndDate': snapshot.periods,
+            'isIFRS': is_ifrs,
+            'json_file': snapshot.json_files,
+            **columns,
+        }
+        self._growth = None
+        self._latest_rows = None
+
+    def columns(self) -> list[str]:
+        """
+        条件式と結果に使える列名のリストを返す関数
+        """
+        return [*self._base, *self.snapshot.numeric_keys.tolist(), *self.ratios,
+                *(f'{item}Growth' for item in self.growth_items)]
+
+    def resolve(self, name: str) -> str:
+        """
+        条件式中の名前を列名に変換する関数. ハイフンの代わりに_を使った名前も受け付ける.
+        """
+        known = set(self.columns())
+        for candidate in (name, name.replace('_', '-')):
+            if candidate in known:
+                return candidate
+        raise ScreeningError(f'存在しない列です: {name}')
+
+    def _is_base(self, name: str) -> bool:
+        return name in self._base or name in self.snapshot.column
+
+    def _base_column(self, name: str) -> np.ndarray:
+        if name not in self._base:
+            values = self.snapshot.values[:, self.snapshot.column[name]].astype(np.float64)
+            values[values == -1] = np.nan
+            self._base[name] = values
+        return self._base[name]
+
+    def _growth_columns(self) -> dict:
+        if self._growth is None:
+            columns = {item: self._base[item] for item in self.growth_items}
+            self._growth = compute_growth(columns, self.snapshot.secCodes, self.snapshot.periods, self.growth_items)
+        return self._growth
+
+    def latest_rows(self) -> np.ndarray:
+        """
+        会社ごとに最新の期間の行番号を返す関数
+        """
+        if self._latest_rows is None:
+            secCodes = self.snapshot.secCodes
+            order = np.lexsort((self.snapshot.periods, secCodes))
+            # 並べ替えた後に次の行が別の会社であれば、その会社の最新の期間
+            is_last = np.ones(len(order), dtype=bool)
+            is_last[:-1] = secCodes[order][:-1] != secCodes[order][1:]
+            self._latest_rows = np.sort(order[is_last])
+        return self._latest_rows
+
+    def _gather(self, names: list[str], rows: np.ndarray) -> dict:
+        """
+        指定した行の列を取り出す関数。比率は取り出した行についてのみ計算する。
+        """
+        gathered = {}
+        ratios = {}
+        for name in names:
+            if self._is_base(name):
+                gathered[name] = self._base_column(name)[rows]
+            elif name in self.ratios:
+                ratios[name] = self.ratios[name]
+            else:
+                gathered[name] = self._growth_columns()[name][rows]
+        if ratios:
+            items = {item for numerator, denominator in ratios.values() for item in (*numerator, *denominator)}
+            gathered.update(compute_ratios({item: self._base[item][rows] for item in items}, ratios))
+        return gathered
+
+    def _filter(self, conditions: list[ast.expr], rows: np.ndarray) -> np.ndarray:
+        # 条件を1つ評価するごとに行を絞り込み、次の条件は残った行の必要な列だけで評価する
+        for condition in conditions:
+            if len(rows) == 0:
+                break
+            keep = np.broadcast_to(np.asarray(evaluate(condition, self._gather(referenced_names(condition), rows)),
+                                              dtype=bool), rows.shape)
+            rows = rows[keep]
+        return rows
+
+    def screen(self, expression: str | None = None, sort_by: str | None = None, ascending: bool = False,
+               top: int | None = None, latest: bool = False, columns: list[str] | None = None) -> pd.DataFrame:
+        """
+        条件に合う会社・期間をDataFrameで返す関数
+
+        Parameters
+        ----------
+        expression : str, optional
+            条件式(parse_expressionを参照)。省略した場合は全ての行。
+        sort_by : str, optional
+            並べ替えに使う列名。欠損値は常に最後になる。
+        ascending : bool
+            昇順に並べるかどうか。Falseの場合は降順。
+        top : int, optional
+            返す行数の上限。sort_byと組み合わせると上位N件になる。
+        latest : bool
+            会社ごとに最新の期間の行のみを対象にするかどうか。
+        columns : list of str, optional
+            結果に含める列名。省略した場合はKEY_COLUMNS, 条件式と並べ替えで参照した列, json_file。
+
+        Returns
+        -------
+        pd.DataFrame
+            条件に合う行。
+        """
+        conditions = parse_expression(expression) if expression and expression.strip() else []
+        # 条件式中の名前を列名に書き換える
+        for condition in conditions:
+            for node in ast.walk(condition):
+                if isinstance(node, ast.Name):
+                    node.id = self.resolve(node.id)
+        sort_by = self.resolve(sort_by) if sort_by else None
+        if columns is None:
+            referenced = [name for condition in conditions for name in referenced_names(condition)]
+            columns = list(dict.fromkeys([*KEY_COLUMNS, *referenced, *([sort_by] if sort_by else []), 'json_file']))
+        else:
+            columns = [self.resolve(name) for name in columns]
+
+        rows = self.latest_rows() if latest else np.arange(len(self.snapshot))
+        pushed_down = [condition for condition in conditions
+                       if all(self._is_base(name) for name in referenced_names(condition))]
+        remaining = [condition for condition in conditions if condition not in pushed_down]
+        rows = self._filter(pushed_down + remaining, rows)
+
+        if sort_by:
+            rows = rows[_order(self._gather([sort_by], rows)[sort_by], ascending, top)]
+        elif top is not None:
+            rows = rows[:top]
+        return pd.DataFrame(self._gather(columns, rows), columns=columns)
+
+
+def _order(key: np.ndarray, ascending: bool, top: int | None) -> np.ndarray:
+    """
+    並べ替えた順の位置を返す関数. topを指定した場合は上位top件を部分ソートで選んでから並べる.
+    """
+    if key.dtype.kind not in 'biuf':
+        order = np.argsort(key, kind='stable')
+        order = order if ascending else order[::-1]
+        return order[:top]
+    key = key.astype(np.float64)
+    # 欠損値を最後にするため、降順の場合は符号を反転して昇順に並べる
+    key = np.where(np.isnan(key), np.inf, key if ascending else -key)
+    if top is not None and top < len(key):
+        selected = np.argpartition(key, top - 1)[:top] if top > 0 else np.array([], dtype=np.intp)
+        return selected[np.argsort(key[selected], kind='stable')]
+    return np.argsort(key, kind='stable')
+
+
+def screen(expression: str | None = None, sort_by: str | None = None, ascending: bool = False,
+           top: int | None = None, latest: bool = False, columns: list[str] | None = None,
+           snapshot_path: str = SNAPSHOT_PATH) -> pd.DataFrame:
+    """
+    スナップショットを読み込んで1回だけ絞り込みを行う関数. 引数はScreener.screenと同じ.
+    """
+    return Screener(load_snapshot(snapshot_path)).screen(expression, sort_by=sort_by, ascending=ascending,
+                                                         top=top, latest=latest, columns=columns)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='全社の指標と財務比率から条件に合う会社を絞り込む')
+    parser.add_argument('expression', nargs='?', default=None,
+                        help='条件式 (例: "isIFRS and EquityRatio > 50%% and Sales > 1兆円")')
+    parser.add_argument('--sort', default=None, help='並べ替えに使う列名')
+    parser.add_argument('--ascending', action='store_true', help='昇順に並べる(省略時は降順)')
+    parser.add_argument('--top', type=int, default=None, help='上位N件のみを出力する')
+    parser.add_argument('--latest', action='store_true', help='会社ごとに最新の期間のみを対象にする')
+    parser.add_argument('--columns', nargs='*', default=None, help='出力する列名')
+    parser.add_argument('--list-columns', action='store_true', help='使える列名を表示する')
+    parser.add_argument('--output', help='結果を保存するCSVファイルのパス')
+    parser.add_argument('--snapshot', default=SNAPSHOT_PATH, help='スナップショットのパス')
+    args = parser.parse_args()
+
+    screener = Screener(load_snapshot(args.snapshot))
+    if args.list_columns:
+        print('\n'.join(screener.columns()))
+        return
+    start = time.perf_counter()
+    try:
+        df = screener.screen(args.expression, sort_by=args.sort, ascending=args.ascending, top=args.top,
+                             latest=args.latest, columns=args.columns)
+    except ScreeningError as e:
+        parser.error(str(e))
+    elapsed = time.perf_counter() - start
+    if args.output:
+        df.to_csv(args.output, index=False)
+        print(f'{len(df)}件を{args.output}に保存しました。')
+    else:
+        with pd.option_context('display.max_rows', 100, 'display.width', 200):
+            print(df)
+    print(f'{len(screener.snapshot)}件の期間から{len(df)}件を絞り込みました({elapsed * 1000:.1f}ms)。')
+
+
+if __name__ == '__main__':
+    main()
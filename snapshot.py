@@ -0,0 +1,310 @@
+import os
+import json
+import struct
+import hashlib
+import zipfile
+import threading
+import numpy as np
+from filing_index import FilingIndex, FILING_INDEX_PATH
+
+SNAPSHOT_PATH = 'metrics_snapshot.npz'
+JSON_DIR = 'json_file'
+# 文字列として保存するデータ項目. それ以外のデータ項目は整数(-1: 値が見つからない)として保存する.
+TEXT_KEYS = ('CompanyName', 'EndDate', 'secCode')
+
+
+def build_snapshot(json_dir: str = JSON_DIR, snapshot_path: str = SNAPSHOT_PATH,
+                   index_path: str = FILING_INDEX_PATH) -> int:
+    """
+    json_dir内の全てのJSONファイルを1つのスナップショットファイルにまとめる関数
+
+    スナップショットは一時ファイルに書き込んでから置き換えるため、
+    読み込み側が書き込み途中のファイルを読むことはない。
+
+    Parameters
+    ----------
+    json_dir : str
+        JSONファイルが格納されているディレクトリのパス。
+    snapshot_path : str
+        スナップショットの保存先のパス。
+    index_path : str
+        filing_index.pyの索引のパス。索引がある場合、各行に最新の書類のdocIDを付け、
+        同じ会社・期間のより新しい書類がある(最新でない)JSONファイルはスナップショットに含めない。
+
+    Returns
+    -------
+    int
+        スナップショットに含めた会社・期間の数。
+
+    Notes
+    -----
+    数値であるべきデータ項目に文字列が入っているJSONファイルはスナップショットに含めない。
+    ウェブアプリはそのようなファイルを従来通りJSONファイルから読み込む。
+    """
+    keys = []
+    names = {}
+    ifrs_flags = {}
+    rows = []
+    doc_ids = {}
+    superseded = set()
+    if os.path.exists(index_path):
+        index = FilingIndex(index_path)
+        doc_ids = {os.path.normpath(path): docID for path, docID in index.doc_ids().items()}
+        superseded = {os.path.normpath(path) for path in index.superseded_json_files()} - set(doc_ids)
+    for file_name in sorted(os.listdir(json_dir)):
+        if not file_name.endswith('.json'):
+            continue
+        if os.path.normpath(os.path.join(json_dir, file_name)) in superseded:
+            print(f'同じ会社・期間のより新しい書類があるためスナップショットに含めません: {file_name}')
+            continue
+        with open(os.path.join(json_dir, file_name), 'rb') as f:
+            raw = f.read()
+        json_data = json.loads(raw)
+        if any(key not in TEXT_KEYS and not isinstance(item['value'], int) for key, item in json_data.items()):
+            print(f'数値でない値を含むためスナップショットに含めません: {file_name}')
+            continue
+        for key, item in json_data.items():
+            if key not in names:
+                keys.append(key)
+                names[key] = item['name']
+                ifrs_flags[key] = item['ifrs_flag']
+        rows.append((file_name, hashlib.sha1(raw).hexdigest(), json_data))
+
+    numeric_keys = [key for key in keys if key not in TEXT_KEYS]
+    text_keys = [key for key in keys if key in TEXT_KEYS]
+    values = np.full((len(rows), len(numeric_keys)), -1, dtype=np.int64)
+    texts = np.empty((len(rows), len(text_keys)), dtype=object)
+    unit_codes = np.zeros((len(rows), len(keys)), dtype=np.int16)
+    units = {}
+    for i, (_, _, json_data) in enumerate(rows):
+        for j, key in enumerate(numeric_keys):
+            if key in json_data:
+                values[i, j] = json_data[key]['value']
+        for j, key in enumerate(text_keys):
+            texts[i, j] = str(json_data[key]['value']) if key in json_data else ''
+        for j, key in enumerate(keys):
+            unit = json_data[key]['unit'] if key in json_data else '単位'
+            unit_codes[i, j] = units.setdefault(unit, len(units))
+
+    arrays = {
+        'json_files': np.array([row[0] for row in rows], dtype=str),
+        'digests': np.array([row[1] for row in rows], dtype=str),
+        'doc_ids': np.array([doc_ids.get(os.path.normpath(os.path.join(json_dir, row[0])), '') for row in rows],
+                            dtype=str),
+        'keys': np.array(keys, dtype=str),
+        'names': np.array([names[key] for key in keys], dtype=str),
+        'ifrs_flags': np.array([ifrs_flags[key] for key in keys], dtype=np.int8),
+        'numeric_keys': np.array(numeric_keys, dtype=str),
+        'values': values,
+        'text_keys': np.array(text_keys, dtype=str),
+        'texts': texts.astype(str) if len(rows) else np.empty((0, len(text_keys)), dtype=str),
+        'units': np.array(list(units), dtype=str),
+        'unit_codes': unit_codes,
+    }
+    tmp_path = f'{snapshot_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, snapshot_path)
+    print(f'スナップショットを保存しました: {snapshot_path} ({len(rows)}件)')
+    return len(rows)
+
+
+def map_snapshot(snapshot_path: str = SNAPSHOT_PATH) -> dict | None:
+    """
+    スナップショットの配列を読み込まずにメモリマップで開く関数
+
+    build_snapshotはnp.savez(無圧縮)で保存するため、ZIP内の各.npyのデータの位置が分かればnp.memmapで開ける。
+    全ての行を一度にメモリに置かずに、行の範囲ごとに読み出す場合に使う。
+
+    Parameters
+    ----------
+    snapshot_path : str
+        スナップショットファイルのパス。
+
+    Returns
+    -------
+    dict or None
+        配列名をキー、np.memmapを値とする辞書。圧縮されているなどメモリマップで開けない場合はNone。
+    """
+    arrays = {}
+    with zipfile.ZipFile(snapshot_path) as zip_ref, open(snapshot_path, 'rb') as f:
+        for info in zip_ref.infolist():
+            if info.compress_type != zipfile.ZIP_STORED or not info.filename.endswith('.npy'):
+                return None
+            # ローカルファイルヘッダー(30バイト + ファイル名 + 拡張フィールド)の後ろに.npyが置かれている
+            f.seek(info.header_offset + 26)
+            name_length, extra_length = struct.unpack('<HH', f.read(4))
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            if dtype.hasobject:
+                return None
+            name = info.filename[:-4]
+            if not np.prod(shape):
+                arrays[name] = np.empty(shape, dtype=dtype)
+                continue
+            arrays[name] = np.memmap(snapshot_path, dtype=dtype, mode='r', offset=f.tell(), shape=shape,
+                                     order='F' if fortran_order else 'C')
+    return arrays
+
+
+class MetricsSnapshot:
+    """
+    全社の指標をNumPy配列として保持するスナップショット。
+
+    Attributes
+    ----------
+    json_files : np.ndarray
+        各行の元になったJSONファイル名。
+    digests : np.ndarray
+        各行の元になったJSONファイルの内容のSHA-1ハッシュ。
+    doc_ids : np.ndarray
+        各行の最新の書類のdocID。索引に記録されていない行は空文字列。
+    numeric_keys : np.ndarray
+        valuesの列に対応するデータ項目名。
+    values : np.ndarray
+        数値のデータ項目の値(行: 会社・期間, 列: データ項目)。-1は値が見つからないことを表す。
+    secCodes : np.ndarray
+        各行の証券コード。
+    periods : np.ndarray
+        各行の当会計期間終了日。
+    """
+
+    def __init__(self, arrays: dict):
+        self.json_files = arrays['json_files']
+        self.digests = arrays['digests']
+        # docIDを含まない以前のスナップショットも読み込めるようにする
+        self.doc_ids = arrays['doc_ids'] if 'doc_ids' in arrays else np.full(len(self.json_files), '', dtype=str)
+        self.keys = arrays['keys']
+        self.names = arrays['names']
+        self.ifrs_flags = arrays['ifrs_flags']
+        self.numeric_keys = arrays['numeric_keys']
+        self.values = arrays['values']
+        self.text_keys = arrays['text_keys']
+        self.texts = arrays['texts']
+        self.units = arrays['units']
+        self.unit_codes = arrays['unit_codes']
+        self.column = {key: j for j, key in enumerate(self.numeric_keys.tolist())}
+        self.text_column = {key: j for j, key in enumerate(self.text_keys.tolist())}
+        self.secCodes = self.text('secCode')
+        self.periods = self.text('EndDate')
+        self.row_by_file = {name: i for i, name in enumerate(self.json_files.tolist())}
+        self.row_by_key = {key: i for i, key in enumerate(zip(self.secCodes.tolist(), self.periods.tolist()))}
+
+    @classmethod
+    def load(cls, snapshot_path: str = SNAPSHOT_PATH) -> 'MetricsSnapshot':
+        """
+        スナップショットファイルを読み込む関数
+        """
+        with np.load(snapshot_path, allow_pickle=False) as npz:
+            return cls({name: npz[name] for name in npz.files})
+
+    def __len__(self) -> int:
+        return len(self.json_files)
+
+    def text(self, key: str) -> np.ndarray:
+        """
+        文字列のデータ項目の列を返す関数
+        """
+        if key not in self.text_column:
+            return np.full(len(self.json_files), '', dtype=str)
+        return self.texts[:, self.text_column[key]]
+
+    def row_for(self, secCode: str, period: str) -> int | None:
+        """
+        証券コードと当会計期間終了日に対応する行番号を返す関数
+        """
+        return self.row_by_key.get((secCode, period))
+
+    def row_for_file(self, json_file: str) -> int | None:
+        """
+        JSONファイル名に対応する行番号を返す関数
+        """
+        return self.row_by_file.get(os.path.basename(json_file))
+
+    def record(self, row: int) -> dict:
+        """
+        行をJSONファイルと同じ形式の辞書に戻す関数
+
+        Parameters
+        ----------
+        row : int
+            行番号。
+
+        Returns
+        -------
+        dict
+            キーはデータ項目名、値はname, value, unit, ifrs_flagを持つ辞書。
+        """
+        record = {}
+        for j, key in enumerate(self.keys.tolist()):
+            if key in self.text_column:
+                value = str(self.texts[row, self.text_column[key]])
+            else:
+                value = int(self.values[row, self.column[key]])
+            record[key] = {
+                'name': str(self.names[j]),
+                'value': value,
+                'unit': str(self.units[self.unit_codes[row, j]]),
+                'ifrs_flag': int(self.ifrs_flags[j]),
+            }
+        return record
+
+
+class SnapshotStore:
+    """
+    最新のスナップショットを保持し、ファイルが更新されたら差し替えるクラス。
+
+    差し替えは参照の代入で行うため、読み込み側はロックを取らずにget()を呼び出せる。
+
+    Attributes
+    ----------
+    snapshot_path : str
+        スナップショットファイルのパス。
+    """
+
+    def __init__(self, snapshot_path: str = SNAPSHOT_PATH):
+        self.snapshot_path = snapshot_path
+        self._snapshot = None
+        self._mtime = None
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def get(self) -> MetricsSnapshot | None:
+        """
+        現在のスナップショットを返す関数。読み込まれていなければNone。
+        """
+        return self._snapshot
+
+    def refresh(self) -> bool:
+        """
+        スナップショットファイルが更新されていれば読み込み直す関数
+
+        Returns
+        -------
+        bool
+            スナップショットを差し替えた場合はTrue。
+        """
+        with self._lock:
+            try:
+                mtime = os.stat(self.snapshot_path).st_mtime_ns
+            except FileNotFoundError:
+                return False
+            if mtime == self._mtime:
+                return False
+            try:
+                snapshot = MetricsSnapshot.load(self.snapshot_path)
+            except Exception as e:
+                print(f'スナップショットの読み込みに失敗しました: {self.snapshot_path} - {e}')
+                return False
+            self._snapshot = snapshot
+            self._mtime = mtime
+            print(f'スナップショットを読み込みました: {self.snapshot_path} ({len(snapshot)}件)')
+            return True
+
+
+if __name__ == '__main__':
+    build_snapshot()
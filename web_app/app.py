@@ -1,22 +1,87 @@
-from flask import Flask, render_template, request, flash, redirect, url_for, session, send_file, g
+from flask import Flask, render_template, request, flash, redirect, url_for, session, send_file, g, Response, jsonify
 import os
-import json
+import sys
+import time
 import uuid
-from plot_web import Barchart
+from plot_web import Barchart, read_json_files, data_items_from_json
 from plot_saver import PlotSaver
+from chart_cache import ChartCache
+from metrics import REQUEST_LATENCY, JSON_LOAD_SECONDS, export_metrics
 from dotenv import load_dotenv
 from datetime import timedelta, datetime
 from apscheduler.schedulers.background import BackgroundScheduler
 
+# リポジトリ直下のモジュール(snapshot.pyなど)を読み込めるようにする
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from snapshot import SnapshotStore
+from screening import Screener, ScreeningError
+
 app = Flask(__name__)
 
 load_dotenv()
 app.secret_key = os.getenv('SECRET_KEY')
 app.permanent_session_lifetime = timedelta(minutes=5)  # セッションの有効期限
 
+JSON_DIR = 'json_file'
+PLOTS_DIR = os.path.join('web_app', 'static', 'plots')
+
+# warmup.pyで事前に描画されたグラフもここに保存される
+chart_cache = ChartCache()
+
+# 起動時に全社の指標のスナップショットを読み込み、更新されたら差し替える
+snapshot_store = SnapshotStore()
+# スナップショットが差し替えられたらScreenerも作り直す
+screener = None
+
+def load_records(json_file_paths):
+    """
+    JSONファイルのデータを読み込む関数
+
+    スナップショットに含まれるファイルはメモリから取り出し、
+    含まれないファイルのみをまとめて読み込む。
+
+    Parameters
+    ----------
+    json_file_paths : list of str
+        JSONファイルのパスのリスト。
+
+    Returns
+    -------
+    tuple of (dict, dict)
+        JSONファイルのパスをキーとするBarchartのdataの辞書と、JSONの内容のハッシュの辞書。
+        スナップショットから読み込まなかったファイルのハッシュはNone。
+    """
+    snapshot = snapshot_store.get()
+    records = {}
+    digests = {}
+    missing = []
+    for path in json_file_paths:
+        row = snapshot.row_for_file(path) if snapshot is not None else None
+        if row is None:
+            missing.append(path)
+            digests[path] = None
+        else:
+            records[path] = data_items_from_json(snapshot.record(row))
+            digests[path] = str(snapshot.digests[row])
+    if missing:
+        records.update(read_json_files(missing))
+    return records, digests
+
+def get_screener():
+    """
+    現在のスナップショットに対するScreenerを返す関数。スナップショットがなければNone。
+    """
+    global screener
+    snapshot = snapshot_store.get()
+    if snapshot is None:
+        return None
+    if screener is None or screener.snapshot is not snapshot:
+        screener = Screener(snapshot)
+    return screener
+
 def cleanup_expired_sessions():
     now = datetime.now()
-    session_dir = os.path.join('web_app', 'static', 'plots')
+    session_dir = PLOTS_DIR
     for session_id in os.listdir(session_dir):
         session_path = os.path.join(session_dir, session_id)
         if os.path.isdir(session_path):
@@ -32,23 +97,74 @@ def cleanup_expired_sessions():
 
 scheduler = BackgroundScheduler()
 scheduler.add_job(func=cleanup_expired_sessions, trigger="interval", minutes=5)
+scheduler.add_job(func=snapshot_store.refresh, trigger="interval", seconds=30)
 scheduler.start()
 
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_latency(response):
+    start = getattr(g, 'request_start', None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        REQUEST_LATENCY.labels(route=route, method=request.method,
+                               status=response.status_code).observe(time.perf_counter() - start)
+    return response
+
+@app.route('/metrics')
+def metrics():
+    body, content_type = export_metrics()
+    return Response(body, content_type=content_type)
+
 @app.route('/')
 def index():
-    json_files = os.listdir('json_file')
+    json_files = os.listdir(JSON_DIR)
     return render_template('index.html', json_files=json_files)
 
 @app.route('/search_json', methods=['GET'])
 def search_json():
     query = request.args.get('query', '')
-    json_files = [f for f in os.listdir('json_file') if query.lower() in f.lower()]
+    json_files = [f for f in os.listdir(JSON_DIR) if query.lower() in f.lower()]
     return render_template('index.html', json_files=json_files)
 
+@app.route('/screen', methods=['GET'])
+def screen():
+    expression = request.args.get('q', '')
+    sort_by = request.args.get('sort') or None
+    ascending = request.args.get('order') == 'asc'
+    top = request.args.get('top', 50, type=int)
+    # チェックボックスを外すと隠しフィールドの0だけが送られる
+    latest = '1' in request.args.getlist('latest') if 'latest' in request.args else True
+    want_json = request.args.get('format') == 'json'
+
+    current = get_screener()
+    if current is None:
+        message = 'Metrics snapshot is not available. Run snapshot.py first.'
+        if want_json:
+            return jsonify(error=message), 503
+        flash(message)
+        return render_template('screen.html', expression=expression, sort_by=sort_by, ascending=ascending,
+                               top=top, latest=latest, columns=[], rows=[])
+    try:
+        df = current.screen(expression, sort_by=sort_by, ascending=ascending, top=top, latest=latest)
+    except ScreeningError as e:
+        if want_json:
+            return jsonify(error=str(e)), 400
+        flash(str(e))
+        df = None
+    # 欠損値はJSONのnullにする
+    rows = df.astype(object).where(df.notna(), None).to_dict('records') if df is not None else []
+    if want_json:
+        return jsonify(columns=list(df.columns), rows=rows)
+    return render_template('screen.html', expression=expression, sort_by=sort_by, ascending=ascending, top=top,
+                           latest=latest, columns=list(df.columns) if df is not None else [], rows=rows)
+
 @app.route('/process_json', methods=['POST'])
 def process_json():
     json_file = request.form['json_file']
-    json_file_path = os.path.join('json_file', json_file)
+    json_file_path = os.path.join(JSON_DIR, json_file)
     
     # セッションを永続化しない
     session.permanent = False
@@ -59,28 +175,67 @@ def process_json():
     g.session_id = session_id  # グローバル変数に保存
 
     # セッションごとに一意のディレクトリを作成
-    session_dir = os.path.join('web_app', 'static', 'plots', session_id)
+    session_dir = os.path.join(PLOTS_DIR, session_id)
     os.makedirs(session_dir, exist_ok=True)
 
     # Barchartクラスを使用してプロットを作成
-    barchart = Barchart(json_file_path, show_chart=True)
+    with JSON_LOAD_SECONDS.time():
+        records, digests = load_records([json_file_path])
+    barchart = Barchart(json_file_path, show_chart=True, data=records[json_file_path])
 
     # PlotSaverクラスを使用してプロットを保存
-    plot_saver = PlotSaver(session_dir=session_dir, show_chart=False)
-    plot_paths = plot_saver.save_plots([barchart])
+    plot_saver = PlotSaver(session_dir=session_dir, show_chart=False, chart_cache=chart_cache)
+    plot_paths = plot_saver.save_plots([barchart], [digests[json_file_path]])
     session['plot_paths'] = plot_paths
 
     flash(f'Plot generated for {json_file}')
     return redirect(url_for('result', session_id=session_id))
 
+@app.route('/compare', methods=['POST'])
+def compare():
+    json_files = [os.path.basename(f) for f in request.form.getlist('json_files')]
+    if not json_files:
+        flash('Select at least one JSON file to compare')
+        return redirect(url_for('index'))
+    # shared: 全社のy軸の範囲を揃える, independent: 各社ごとの範囲で並べる(small multiples)
+    scale = request.form.get('scale', 'shared')
+    json_file_paths = [os.path.join(JSON_DIR, f) for f in json_files]
+
+    session.permanent = False
+    session_id = str(uuid.uuid4())
+    session['session_id'] = session_id
+    g.session_id = session_id
+
+    session_dir = os.path.join(PLOTS_DIR, session_id)
+    os.makedirs(session_dir, exist_ok=True)
+
+    # 全てのJSONファイルをまとめて読み込む
+    with JSON_LOAD_SECONDS.time():
+        records, digests = load_records(json_file_paths)
+    barcharts = [Barchart(path, show_chart=True, data=records[path]) for path in json_file_paths]
+    if scale == 'shared':
+        ranges = [barchart.value_range() for barchart in barcharts]
+        ylim = (min(r[0] for r in ranges), max(r[1] for r in ranges) * 1.05)
+        for barchart in barcharts:
+            barchart.ylim = ylim
+
+    plot_saver = PlotSaver(session_dir=session_dir, show_chart=False, chart_cache=chart_cache)
+    plot_paths = plot_saver.save_plots(barcharts, [digests[path] for path in json_file_paths])
+    session['plot_paths'] = plot_paths
+
+    flash(f'Plots generated for {len(json_files)} companies')
+    return redirect(url_for('result', session_id=session_id))
+
 @app.route('/result')
 def result():
     session_id = request.args.get('session_id')
-    return render_template('result.html', session_id=session_id)
+    plot_files = [os.path.basename(p) for p in session.get('plot_paths', [])] or ['plot_0.png']
+    return render_template('result.html', session_id=session_id, plot_files=plot_files)
 
 @app.route('/static/plots/<session_id>/<filename>')
 def plot(session_id, filename):
-    return send_file(os.path.join('static', 'plots', session_id, filename), mimetype='image/png')
+    # process_jsonが保存したディレクトリと同じ場所から返す
+    return send_file(os.path.abspath(os.path.join(PLOTS_DIR, session_id, filename)), mimetype='image/png')
 
 @app.route('/cleanup')
 def cleanup():
@@ -89,7 +244,7 @@ def cleanup():
         return "Session ID is missing", 400
 
     plot_paths = session.get('plot_paths', [])
-    plot_saver = PlotSaver(session_dir=os.path.join('static', 'plots', session_id))
+    plot_saver = PlotSaver(session_dir=os.path.join(PLOTS_DIR, session_id))
     plot_saver.delete_plots(plot_paths)
     session.pop('plot_paths', None)
     return redirect(url_for('index'))
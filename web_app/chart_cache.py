@@ -0,0 +1,192 @@
+import os
+import shutil
+import threading
+import hashlib
+import matplotlib.pyplot as plt
+from plot_web import Barchart
+
+CHART_CACHE_DIR = os.path.join('web_app', 'static', 'chart_cache')
+# 1つのJSONファイルについて残すy軸の範囲を揃えた画像の最大数。比較する組み合わせごとに範囲が変わるため上限を設ける。
+MAX_VARIANTS = 8
+
+
+class ChartCache:
+    """
+    JSONファイルから生成したグラフ画像を保存しておくキャッシュ。
+
+    画像は `{cache_dir}/{JSONファイル名}/{JSONの内容のハッシュ}.png` に保存される。
+    JSONファイルが書き換えられるとハッシュが変わるため、古い画像が使われることはない。
+    y軸の範囲を揃えた比較用の画像は `{JSONの内容のハッシュ}_{variant}.png` として別に保存され、
+    JSONファイルごとに最近使われたmax_variants枚まで残す。
+
+    Attributes
+    ----------
+    cache_dir : str
+        キャッシュを保存するディレクトリのパス。
+    max_variants : int
+        JSONファイルごとに残すy軸の範囲を揃えた画像の最大数。
+    """
+
+    def __init__(self, cache_dir: str = CHART_CACHE_DIR, max_variants: int = MAX_VARIANTS):
+        self.cache_dir = cache_dir
+        self.max_variants = max_variants
+
+    @staticmethod
+    def file_digest(json_file_path: str) -> str:
+        """
+        JSONファイルの内容のハッシュを返す関数
+
+        Parameters
+        ----------
+        json_file_path : str
+            JSONファイルのパス。
+
+        Returns
+        -------
+        str
+            SHA-1ハッシュの16進文字列。
+        """
+        with open(json_file_path, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()
+
+    def path_for(self, json_file_path: str, digest: str | None = None, variant: str = '') -> str:
+        """
+        JSONファイルに対応するキャッシュ画像のパスを返す関数
+
+        Parameters
+        ----------
+        json_file_path : str
+            JSONファイルのパス。
+        digest : str, optional
+            JSONの内容のハッシュ。省略した場合はファイルを読み込んで計算する。
+        variant : str
+            y軸の範囲など、同じJSONから描画した画像を区別するための文字列。
+
+        Returns
+        -------
+        str
+            キャッシュ画像のパス。
+        """
+        if digest is None:
+            digest = self.file_digest(json_file_path)
+        name = os.path.splitext(os.path.basename(json_file_path))[0]
+        file_name = f'{digest}_{variant}.png' if variant else f'{digest}.png'
+        return os.path.join(self.cache_dir, name, file_name)
+
+    def get(self, json_file_path: str, digest: str | None = None, variant: str = '') -> str | None:
+        """
+        キャッシュ画像が存在すればそのパスを、存在しなければNoneを返す関数
+        """
+        cached_path = self.path_for(json_file_path, digest, variant)
+        if not os.path.exists(cached_path):
+            return None
+        if variant:
+            # 最近使われた画像を残すため、更新時刻を使われた時刻にする
+            try:
+                os.utime(cached_path)
+            except FileNotFoundError:
+                return None
+        return cached_path
+
+    def put(self, json_file_path: str, image_path: str, digest: str | None = None,
+            variant: str = '') -> str:
+        """
+        描画済みの画像をキャッシュに登録する関数
+
+        同じJSONファイルに対する古い画像は削除する。
+
+        Parameters
+        ----------
+        json_file_path : str
+            画像の元になったJSONファイルのパス。
+        image_path : str
+            登録する画像のパス。
+        digest : str, optional
+            JSONの内容のハッシュ。
+        variant : str
+            同じJSONから描画した画像を区別するための文字列。
+
+        Returns
+        -------
+        str
+            キャッシュ画像のパス。
+        """
+        cached_path = self.path_for(json_file_path, digest, variant)
+        chart_dir = os.path.dirname(cached_path)
+        os.makedirs(chart_dir, exist_ok=True)
+        # 書き込み途中のファイルが読まれないように一時ファイルを経由して置き換える
+        tmp_path = f'{cached_path[:-4]}.{os.getpid()}.{threading.get_ident()}.tmp.png'
+        shutil.copyfile(image_path, tmp_path)
+        os.replace(tmp_path, cached_path)
+        self._prune(cached_path)
+        return cached_path
+
+    def render(self, json_file_path: str, digest: str | None = None) -> str:
+        """
+        JSONファイルからグラフを描画してキャッシュに保存する関数
+
+        Parameters
+        ----------
+        json_file_path : str
+            JSONファイルのパス。
+        digest : str, optional
+            JSONの内容のハッシュ。
+
+        Returns
+        -------
+        str
+            キャッシュ画像のパス。
+        """
+        cached_path = self.path_for(json_file_path, digest)
+        chart_dir = os.path.dirname(cached_path)
+        os.makedirs(chart_dir, exist_ok=True)
+        tmp_path = f'{cached_path[:-4]}.{os.getpid()}.{threading.get_ident()}.tmp.png'
+        barchart = Barchart(json_file_path, show_chart=True, save_fig=True, save_path=tmp_path)
+        fig = barchart.plot()
+        plt.close(fig)
+        os.replace(tmp_path, cached_path)
+        self._prune(cached_path)
+        return cached_path
+
+    def _prune(self, cached_path: str) -> None:
+        # 現在の内容と異なるハッシュで描画された画像と、上限を超えた古いy軸の範囲の画像を削除する
+        chart_dir = os.path.dirname(cached_path)
+        digest = os.path.basename(cached_path).split('.')[0].split('_')[0]
+        stale = []
+        variants = []
+        for file_name in os.listdir(chart_dir):
+            if not file_name.endswith('.png') or file_name.endswith('.tmp.png'):
+                continue
+            file_path = os.path.join(chart_dir, file_name)
+            if not file_name.startswith(digest):
+                stale.append(file_path)
+            elif file_name.startswith(f'{digest}_'):
+                try:
+                    variants.append((os.path.getmtime(file_path), file_path))
+                except FileNotFoundError:
+                    pass
+        variants.sort(reverse=True)
+        stale.extend(file_path for _, file_path in variants[self.max_variants:])
+        for file_path in stale:
+            try:
+                os.remove(file_path)
+            except FileNotFoundError:
+                pass
+
+def render_chart(json_file_path: str, cache_dir: str = CHART_CACHE_DIR) -> str:
+    """
+    プロセスプールから呼び出すための描画関数
+
+    Parameters
+    ----------
+    json_file_path : str
+        JSONファイルのパス。
+    cache_dir : str
+        キャッシュを保存するディレクトリのパス。
+
+    Returns
+    -------
+    str
+        キャッシュ画像のパス。
+    """
+    return ChartCache(cache_dir).render(json_file_path)
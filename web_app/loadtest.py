@@ -0,0 +1,377 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import resource
+import urllib.request
+import urllib.parse
+import urllib.error
+from http.cookiejar import CookieJar
+
+# 合成データの項目(キー, 名前, IFRSフラグ)。main.pyのCSVProcessor.dataと同じ構成。
+FIELDS = (
+    ('IFRSSales', '売上収益(IFRS)', 1), ('Sales', '売上収益', 0),
+    ('IFRSOperatingProfits', '営業利益(IFRS)', 1), ('OperatingProfits', '営業利益', 0),
+    ('IFRSNetIncome', '当期純利益(IFRS)', 1), ('NetIncome', '当期純利益', 0),
+    ('IFRSAssets', '資産(IFRS)', 1), ('Assets', '資産', 0),
+    ('IFRSLiabilities', '負債(IFRS)', 1), ('Liabilities', '負債', 0),
+    ('IFRSCurrentAssets', '流動資産(IFRS)', 1), ('CurrentAssets', '流動資産', 0),
+    ('IFRSNonCurrentAssets', '固定資産(IFRS)', 1), ('NonCurrentAssets', '固定資産', 0),
+    ('IFRSNetAssets', '資本(IFRS)', 1), ('NetAssets', '純資産', 0),
+    ('IFRSCurrentLiabilities', '流動負債(IFRS)', 1), ('CurrentLiabilities', '流動負債', 0),
+    ('IFRSNonCurrentLiabilities', '固定負債(IFRS)', 1), ('NonCurrentLiabilities', '固定負債', 0),
+    ('IFRSInterest-bearingCurrentLiabilities', '有利子流動負債(IFRS)', 1),
+    ('Interest-bearingCurrentLiabilities', '有利子流動負債', 0),
+    ('IFRSInterest-bearingNonCurrentLiabilities', '有利子固定負債(IFRS)', 1),
+    ('Interest-bearingNonCurrentLiabilities', '有利子固定負債', 0),
+)
+
+# リクエストの種類ごとの比率
+DEFAULT_MIX = {'index': 0.2, 'search': 0.3, 'render': 0.2, 'static': 0.3}
+
+
+def generate_corpus(json_dir: str, n_companies: int, seed: int = 0) -> list[str]:
+    """
+    負荷試験用の合成JSONファイルを生成する関数
+
+    Parameters
+    ----------
+    json_dir : str
+        JSONファイルを保存するディレクトリのパス。
+    n_companies : int
+        生成する会社数。
+    seed : int
+        乱数のシード。
+
+    Returns
+    -------
+    list of str
+        生成したJSONファイル名のリスト。
+    """
+    rng = random.Random(seed)
+    os.makedirs(json_dir, exist_ok=True)
+    file_names = []
+    for i in range(n_companies):
+        ifrs = rng.random() < 0.3
+        assets = rng.randint(10, 5000) * 10**8
+        current_assets = int(assets * rng.uniform(0.2, 0.6))
+        net_assets = int(assets * rng.uniform(0.2, 0.7))
+        liabilities = assets - net_assets
+        current_liabilities = int(liabilities * rng.uniform(0.3, 0.7))
+        sales = int(assets * rng.uniform(0.3, 1.5))
+        operating_profits = int(sales * rng.uniform(-0.05, 0.2))
+        values = {
+            'Sales': sales, 'OperatingProfits': operating_profits,
+            'NetIncome': int(operating_profits * 0.7),
+            'Assets': assets, 'CurrentAssets': current_assets, 'NonCurrentAssets': assets - current_assets,
+            'NetAssets': net_assets, 'Liabilities': liabilities,
+            'CurrentLiabilities': current_liabilities, 'NonCurrentLiabilities': liabilities - current_liabilities,
+            'Interest-bearingCurrentLiabilities': int(current_liabilities * 0.3),
+            'Interest-bearingNonCurrentLiabilities': int((liabilities - current_liabilities) * 0.5),
+        }
+        company_name = f'負荷試験{i:05d}株式会社'
+        end_date = f'{rng.randint(2019, 2024)}-03-31'
+        data = {
+            'CompanyName': {'name': '会社名', 'value': company_name, 'unit': '', 'ifrs_flag': 0},
+            'EndDate': {'name': '当会計期間終了日', 'value': end_date, 'unit': '', 'ifrs_flag': 0},
+            'secCode': {'name': 'secCode', 'value': f'{1000 + i}0', 'unit': '単位', 'ifrs_flag': 0},
+        }
+        for key, name, ifrs_flag in FIELDS:
+            base_key = key[4:] if ifrs_flag else key
+            value = values[base_key] if (ifrs_flag == 1) == ifrs else -1
+            data[key] = {'name': name, 'value': value, 'unit': 'JPY' if value != -1 else '単位', 'ifrs_flag': ifrs_flag}
+        file_name = f'{company_name}{end_date}.json'
+        with open(os.path.join(json_dir, file_name), 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=4)
+        file_names.append(file_name)
+    return file_names
+
+
+def current_rss(pid: int | None = None) -> int:
+    """
+    プロセスの常駐メモリ(RSS)をバイト単位で返す関数
+
+    /procが使えない環境では自プロセスの最大RSSを返す。
+    """
+    try:
+        with open(f'/proc/{pid or "self"}/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOSはバイト単位、Linuxはキロバイト単位
+        return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+class InProcessClient:
+    """
+    FlaskのテストクライアントでWSGIアプリを直接呼び出すクライアント。
+    """
+
+    def __init__(self, flask_app):
+        self.client = flask_app.test_client()
+
+    def get(self, path: str, params: dict | None = None) -> tuple[int, bytes, str]:
+        response = self.client.get(path, query_string=params)
+        return response.status_code, response.data, response.headers.get('Location', '')
+
+    def post(self, path: str, data: dict) -> tuple[int, bytes, str]:
+        response = self.client.post(path, data=data)
+        return response.status_code, response.data, response.headers.get('Location', '')
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HTTPClient:
+    """
+    起動済みのローカルサーバーにHTTPでリクエストを送るクライアント。
+    """
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(CookieJar()), _NoRedirect())
+
+    def _open(self, request) -> tuple[int, bytes, str]:
+        try:
+            with self.opener.open(request, timeout=60) as response:
+                return response.status, response.read(), response.headers.get('Location', '')
+        except urllib.error.HTTPError as e:
+            return e.code, e.read(), e.headers.get('Location', '')
+
+    def get(self, path: str, params: dict | None = None) -> tuple[int, bytes, str]:
+        url = self.base_url + path
+        if params:
+            url += '?' + urllib.parse.urlencode(params)
+        return self._open(urllib.request.Request(url))
+
+    def post(self, path: str, data: dict) -> tuple[int, bytes, str]:
+        body = urllib.parse.urlencode(data).encode()
+        return self._open(urllib.request.Request(self.base_url + path, data=body, method='POST'))
+
+
+class LoadTest:
+    """
+    ウェブアプリに対して種類の異なるリクエストを混ぜて送り、結果を集計するクラス。
+
+    Attributes
+    ----------
+    make_client : callable
+        スレッドごとにクライアントを作成する関数。
+    json_files : list of str
+        リクエストに使うJSONファイル名のリスト。
+    mix : dict
+        リクエストの種類ごとの比率。
+    latencies : dict
+        リクエストの種類ごとのレイテンシ(秒)のリスト。
+    errors : dict
+        リクエストの種類ごとのエラー数。
+    """
+
+    def __init__(self, make_client, json_files: list[str], mix: dict = DEFAULT_MIX,
+                 rss_pid: int | None = None):
+        self.make_client = make_client
+        self.json_files = json_files
+        self.mix = mix
+        self.rss_pid = rss_pid
+        self.latencies = {kind: [] for kind in mix}
+        self.errors = {kind: 0 for kind in mix}
+        self.rss_samples = []
+        self.plot_urls = []
+        self.lock = threading.Lock()
+
+    def _request(self, client, kind: str, rng: random.Random) -> bool:
+        if kind == 'index':
+            status, _, _ = client.get('/')
+            return status == 200
+        if kind == 'search':
+            query = rng.choice(self.json_files)[4:9]
+            status, _, _ = client.get('/search_json', {'query': query})
+            return status == 200
+        if kind == 'render':
+            status, _, location = client.post('/process_json', {'json_file': rng.choice(self.json_files)})
+            match = re.search(r'session_id=([\w-]+)', location)
+            if status != 302 or match is None:
+                return False
+            with self.lock:
+                self.plot_urls.append(f'/static/plots/{match.group(1)}/plot_0.png')
+            return True
+        # static: 描画済みのグラフ画像を取得する
+        with self.lock:
+            plot_url = rng.choice(self.plot_urls) if self.plot_urls else None
+        if plot_url is None:
+            return self._request(client, 'render', rng)
+        status, body, _ = client.get(plot_url)
+        return status == 200 and body[:4] == b'\x89PNG'
+
+    def _worker(self, worker_id: int, deadline: float, max_requests: int | None, counter: list[int]):
+        rng = random.Random(worker_id)
+        client = self.make_client()
+        kinds = list(self.mix)
+        weights = [self.mix[kind] for kind in kinds]
+        while time.monotonic() < deadline:
+            with self.lock:
+                if max_requests is not None and counter[0] >= max_requests:
+                    return
+                counter[0] += 1
+            kind = rng.choices(kinds, weights)[0]
+            start = time.perf_counter()
+            try:
+                ok = self._request(client, kind, rng)
+            except Exception as e:
+                print(f'{kind}: {e}')
+                ok = False
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.latencies[kind].append(elapsed)
+                if not ok:
+                    self.errors[kind] += 1
+
+    def run(self, concurrency: int, duration: float, max_requests: int | None = None,
+            report_interval: float = 5.0) -> dict:
+        """
+        負荷試験を実行して結果を返す関数
+
+        Parameters
+        ----------
+        concurrency : int
+            同時にリクエストを送るスレッド数。
+        duration : float
+            試験を続ける最大秒数。
+        max_requests : int, optional
+            送るリクエストの総数の上限。
+        report_interval : float
+            途中経過を表示する間隔(秒)。
+
+        Returns
+        -------
+        dict
+            集計結果。
+        """
+        counter = [0]
+        start = time.monotonic()
+        deadline = start + duration
+        threads = [threading.Thread(target=self._worker, args=(i, deadline, max_requests, counter), daemon=True)
+                   for i in range(concurrency)]
+        self.rss_samples.append((0.0, current_rss(self.rss_pid)))
+        for thread in threads:
+            thread.start()
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(timeout=report_interval / len(threads))
+            elapsed = time.monotonic() - start
+            if elapsed - self.rss_samples[-1][0] >= report_interval:
+                rss = current_rss(self.rss_pid)
+                self.rss_samples.append((elapsed, rss))
+                print(f'[{elapsed:6.1f}s] requests={counter[0]} '
+                      f'throughput={counter[0] / elapsed:.1f} req/s rss={rss / 2**20:.1f} MiB')
+        total_time = time.monotonic() - start
+        self.rss_samples.append((total_time, current_rss(self.rss_pid)))
+        return self.summary(total_time)
+
+    def summary(self, total_time: float) -> dict:
+        """
+        リクエストの種類ごとにレイテンシの分位点とエラー率を集計する関数
+        """
+        def percentile(values: list[float], q: float) -> float:
+            if not values:
+                return 0.0
+            values = sorted(values)
+            return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+        result = {'routes': {}}
+        all_latencies = []
+        for kind, latencies in self.latencies.items():
+            all_latencies.extend(latencies)
+            result['routes'][kind] = {
+                'requests': len(latencies),
+                'errors': self.errors[kind],
+                'error_rate': self.errors[kind] / len(latencies) if latencies else 0.0,
+                'p50': percentile(latencies, 50),
+                'p95': percentile(latencies, 95),
+                'p99': percentile(latencies, 99),
+            }
+        result['total'] = {
+            'requests': len(all_latencies),
+            'errors': sum(self.errors.values()),
+            'throughput': len(all_latencies) / total_time if total_time else 0.0,
+            'p50': percentile(all_latencies, 50),
+            'p95': percentile(all_latencies, 95),
+            'p99': percentile(all_latencies, 99),
+        }
+        result['rss'] = {
+            'start': self.rss_samples[0][1],
+            'end': self.rss_samples[-1][1],
+            'growth': self.rss_samples[-1][1] - self.rss_samples[0][1],
+            'samples': self.rss_samples,
+        }
+        return result
+
+
+def print_summary(result: dict) -> None:
+    print(f'{"route":<8} {"requests":>8} {"errors":>7} {"p50(ms)":>9} {"p95(ms)":>9} {"p99(ms)":>9}')
+    for kind, stats in list(result['routes'].items()) + [('total', result['total'])]:
+        print(f'{kind:<8} {stats["requests"]:>8} {stats["errors"]:>7} '
+              f'{stats["p50"] * 1000:>9.1f} {stats["p95"] * 1000:>9.1f} {stats["p99"] * 1000:>9.1f}')
+    print(f'throughput: {result["total"]["throughput"]:.1f} req/s')
+    rss = result['rss']
+    print(f'rss: {rss["start"] / 2**20:.1f} MiB -> {rss["end"] / 2**20:.1f} MiB '
+          f'(growth {rss["growth"] / 2**20:+.1f} MiB)')
+    if 'open_figures' in result:
+        print(f'open matplotlib figures: {result["open_figures"]}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ウェブアプリの負荷試験を行います。')
+    parser.add_argument('--url', help='起動済みサーバーのURL。省略した場合はアプリをプロセス内で直接呼び出す。')
+    parser.add_argument('--pid', type=int, help='--url指定時にRSSを計測するサーバーのプロセスID')
+    parser.add_argument('--companies', type=int, default=200, help='合成する会社数(プロセス内モードのみ)')
+    parser.add_argument('--concurrency', type=int, default=4, help='同時リクエスト数')
+    parser.add_argument('--duration', type=float, default=30.0, help='試験時間(秒)')
+    parser.add_argument('--requests', type=int, default=None, help='リクエストの総数の上限')
+    parser.add_argument('--interval', type=float, default=5.0, help='途中経過を表示する間隔(秒)')
+    parser.add_argument('--output', help='結果をJSONで保存するパス')
+    args = parser.parse_args()
+    output_path = os.path.abspath(args.output) if args.output else None
+
+    if args.url:
+        client = HTTPClient(args.url)
+        status, body, _ = client.get('/')
+        json_files = re.findall(r'<option value="([^"]+\.json)"', body.decode('utf-8'))
+        if status != 200 or not json_files:
+            print('サーバーからJSONファイルの一覧を取得できませんでした。')
+            return
+        load_test = LoadTest(lambda: HTTPClient(args.url), json_files, rss_pid=args.pid)
+        result = load_test.run(args.concurrency, args.duration, args.requests, args.interval)
+    else:
+        # 合成データを置いた一時ディレクトリを作業ディレクトリとしてアプリを読み込む
+        with tempfile.TemporaryDirectory() as workspace:
+            os.chdir(workspace)
+            os.makedirs(os.path.join('web_app', 'static', 'plots'))
+            json_files = generate_corpus('json_file', args.companies)
+            # 本番と同じくスナップショットを公開してからアプリを読み込む
+            sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+            from snapshot import build_snapshot
+            build_snapshot()
+            os.environ.setdefault('SECRET_KEY', 'loadtest')
+            import app as web_app
+            import matplotlib.pyplot as plt
+            load_test = LoadTest(lambda: InProcessClient(web_app.app), json_files)
+            result = load_test.run(args.concurrency, args.duration, args.requests, args.interval)
+            result['open_figures'] = len(plt.get_fignums())
+            web_app.scheduler.shutdown(wait=False)
+    print_summary(result)
+    if output_path:
+        with open(output_path, 'w') as f:
+            json.dump(result, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+import threading
+from prometheus_client import Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+
+# /metricsエンドポイントで公開するPrometheus形式の計測値
+
+REQUEST_LATENCY = Histogram(
+    'webapp_request_latency_seconds', 'Request latency per route.',
+    ['route', 'method', 'status'],
+)
+JSON_LOAD_SECONDS = Histogram(
+    'webapp_json_load_seconds', 'Time spent loading a company JSON file.',
+)
+RENDER_SECONDS = Histogram(
+    'webapp_render_seconds', 'Time spent rendering a chart with matplotlib.',
+    ['accounting', 'backend'],
+)
+CHART_CACHE_REQUESTS = Counter(
+    'webapp_chart_cache_requests_total', 'Chart cache lookups.',
+    ['result'],
+)
+CHART_CACHE_HIT_RATIO = Gauge(
+    'webapp_chart_cache_hit_ratio', 'Fraction of chart cache lookups that were hits.',
+)
+RENDER_QUEUE_DEPTH = Gauge(
+    'webapp_render_queue_depth', 'Charts waiting for or currently being rendered.',
+)
+PLOT_BYTES_WRITTEN = Counter(
+    'webapp_plot_bytes_written_total', 'Bytes written to the plots directory.',
+)
+
+_cache_lookups = {'hit': 0, 'miss': 0}
+_cache_lookups_lock = threading.Lock()
+
+
+def record_cache_lookup(hit: bool) -> None:
+    """
+    チャートキャッシュの参照結果を記録する関数
+
+    Parameters
+    ----------
+    hit : bool
+        キャッシュに画像が存在した場合はTrue。
+    """
+    result = 'hit' if hit else 'miss'
+    CHART_CACHE_REQUESTS.labels(result=result).inc()
+    with _cache_lookups_lock:
+        _cache_lookups[result] += 1
+
+
+def _cache_hit_ratio() -> float:
+    with _cache_lookups_lock:
+        total = _cache_lookups['hit'] + _cache_lookups['miss']
+        return _cache_lookups['hit'] / total if total else 0.0
+
+
+CHART_CACHE_HIT_RATIO.set_function(_cache_hit_ratio)
+
+
+def accounting_label(isIFRS: bool) -> str:
+    """
+    会計基準をメトリクスのラベル値に変換する関数
+    """
+    return 'ifrs' if isIFRS else 'jgaap'
+
+
+def export_metrics() -> tuple[bytes, str]:
+    """
+    Prometheusのテキスト形式で全ての計測値を返す関数
+
+    Returns
+    -------
+    tuple of (bytes, str)
+        レスポンスボディとContent-Type。
+    """
+    return generate_latest(), CONTENT_TYPE_LATEST
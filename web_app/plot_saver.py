@@ -1,20 +1,90 @@
 import os
+import time
+import shutil
+import matplotlib
 import matplotlib.pyplot as plt
+from concurrent.futures import ProcessPoolExecutor
+from metrics import (RENDER_SECONDS, RENDER_QUEUE_DEPTH, PLOT_BYTES_WRITTEN,
+                     record_cache_lookup, accounting_label)
+
+# 複数のグラフを同時に描画するときに使うプロセスプール(初回利用時に作成)
+_render_executor = None
+
+
+def _get_render_executor():
+    global _render_executor
+    if _render_executor is None:
+        max_workers = int(os.getenv('RENDER_WORKERS', os.cpu_count() or 1))
+        _render_executor = ProcessPoolExecutor(max_workers=max_workers)
+    return _render_executor
+
+
+def _render(plot):
+    """
+    グラフを1つ描画して保存し、描画にかかった秒数を返す関数
+    """
+    start = time.perf_counter()
+    fig = plot.plot()
+    plt.close(fig)
+    return time.perf_counter() - start
+
 
 class PlotSaver:
-    def __init__(self, session_dir, show_chart=True):
+    def __init__(self, session_dir, show_chart=True, chart_cache=None):
         self.session_dir = session_dir
         self.show_chart = show_chart
+        self.chart_cache = chart_cache
+
+    def save_plots(self, plots, digests=None):
+        """
+        グラフを保存してパスのリストを返す関数
 
-    def save_plots(self, plots):
+        digestsにJSONの内容のハッシュ(スナップショットに保存されているもの)を渡すと、
+        キャッシュの参照にJSONファイルを読み込まない。
+        """
         plot_paths = []
+        # キャッシュに無いグラフ(plot, digest, variant)のリスト
+        pending = []
         for i, plot in enumerate(plots):
             plot_path = os.path.join(self.session_dir, f'plot_{i}.png')
+            plot_paths.append(plot_path)
+            digest = None
+            variant = plot.cache_variant()
+            if self.chart_cache is not None:
+                digest = digests[i] if digests and digests[i] else self.chart_cache.file_digest(plot.json_file_path)
+                cached_path = self.chart_cache.get(plot.json_file_path, digest, variant)
+                record_cache_lookup(cached_path is not None)
+                if cached_path is not None:
+                    shutil.copyfile(cached_path, plot_path)
+                    PLOT_BYTES_WRITTEN.inc(os.path.getsize(plot_path))
+                    print(f"Plot copied from cache {cached_path} to {plot_path}")
+                    continue
             plot.save_fig=True
             plot.save_path=plot_path
-            fig = plot.plot()
-            plot_paths.append(plot_path)
-            print(f"Plot saved to {plot_path}")
+            pending.append((plot, digest, variant))
+
+        RENDER_QUEUE_DEPTH.inc(len(pending))
+        if len(pending) > 1:
+            # 複数のグラフはプロセスプールで並列に描画する
+            executor = _get_render_executor()
+            futures = [executor.submit(_render, plot) for plot, _, _ in pending]
+        else:
+            futures = None
+        remaining = len(pending)
+        try:
+            for j, (plot, digest, variant) in enumerate(pending):
+                elapsed = futures[j].result() if futures else _render(plot)
+                remaining -= 1
+                RENDER_QUEUE_DEPTH.dec()
+                RENDER_SECONDS.labels(accounting=accounting_label(plot.isIFRS),
+                                      backend=matplotlib.get_backend()).observe(elapsed)
+                PLOT_BYTES_WRITTEN.inc(os.path.getsize(plot.save_path))
+                if self.chart_cache is not None:
+                    self.chart_cache.put(plot.json_file_path, plot.save_path, digest, variant)
+                print(f"Plot saved to {plot.save_path}")
+        finally:
+            # 描画に失敗した場合も待ち数を元に戻す
+            RENDER_QUEUE_DEPTH.dec(remaining)
 
         return plot_paths
 
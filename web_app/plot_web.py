@@ -1,5 +1,6 @@
 import json
 import matplotlib.pyplot as plt
+from concurrent.futures import ThreadPoolExecutor
 import matplotlib
 import matplotlib_fontja
 import matplotlib.ticker as ticker
@@ -50,6 +51,47 @@ def isIFRS(data: Dict[str, DataItem]) -> bool:
 
         return False
 
+def data_items_from_json(json_data: dict) -> Dict[str, DataItem]:
+    """
+    JSONファイルの内容をBarchartのdataに変換する関数
+
+    Parameters
+    ----------
+    json_data : dict
+        JSONファイルを読み込んだ辞書、またはスナップショットから取り出した同じ形式の辞書。
+
+    Returns
+    -------
+    Dict[str, DataItem]
+        図のプロットに必要なデータが入った辞書
+    """
+    return {key: DataItem(name=value['name'], value=value['value'],
+                          unit=value['unit'], ifrs_flag=value['ifrs_flag'])
+            for key, value in json_data.items()}
+
+def read_json_files(json_file_paths: list[str], max_workers: int = 8) -> Dict[str, Dict[str, DataItem]]:
+    """
+    複数のJSONファイルをまとめて読み込む関数
+
+    Parameters
+    ----------
+    json_file_paths : list of str
+        読み込むJSONファイルのパスのリスト。
+    max_workers : int
+        同時に読み込むファイル数の上限。
+
+    Returns
+    -------
+    Dict[str, Dict[str, DataItem]]
+        JSONファイルのパスをキーとし、Barchartのdataを値とする辞書。
+    """
+    def read(json_file_path: str) -> Dict[str, DataItem]:
+        with open(json_file_path, 'r', encoding='utf-8') as json_file:
+            return data_items_from_json(json.load(json_file))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return dict(zip(json_file_paths, executor.map(read, json_file_paths)))
+
 class Barchart():
     """
     JSONファイルからデータを読み込み、棒グラフを生成するクラス。
@@ -66,6 +108,8 @@ class Barchart():
         JSONファイルから読み込んだデータ。
     isIFRS : bool
         データがIFRSかどうかを示すフラグ。
+    ylim : tuple of (float, float) or None
+        y軸の範囲。Noneの場合はmatplotlibが自動で決める。
 
     Methods
     -------
@@ -76,14 +120,15 @@ class Barchart():
     """
 
     def __init__(self, json_file_path: str, show_chart: bool,
-                 save_fig=True, save_path='') -> None:
+                 save_fig=True, save_path='', data=None, ylim=None) -> None:
         self.json_file_path = json_file_path
-        self.data = self.reading_json(json_file_path)
+        self.data = self.reading_json(json_file_path) if data is None else data
         self.is_missing_data = self.check_missing_data()
         self.show_chart = show_chart
         self.isIFRS = True if isIFRS(self.data) else False
         self.save_fig = save_fig
         self.save_path = save_path
+        self.ylim = ylim
 
 
     def reading_json(self, json_file_path: str) -> Dict[str, DataItem]:
@@ -102,13 +147,45 @@ class Barchart():
         """
         with open(json_file_path, 'r', encoding='utf-8') as json_file:
             json_data = json.load(json_file)
-        data = {}
-        for key, value in json_data.items():
-            data[key] = DataItem(name=value['name'], value=value['value'], 
-                                 unit=value['unit'], ifrs_flag=value['ifrs_flag'])
-        return data
+        return data_items_from_json(json_data)
     
     
+    def value_range(self) -> tuple[float, float]:
+        """
+        グラフに描画される棒の下端と上端を返す関数
+
+        Returns
+        -------
+        tuple of (float, float)
+            y軸の最小値と最大値。
+        """
+        prefix = 'IFRS' if self.isIFRS else ''
+
+        def value(key: str) -> float:
+            item = self.data.get(prefix + key)
+            if item is None or item.value == -1 or not isinstance(item.value, (int, float)):
+                return 0
+            return item.value
+
+        heights = (
+            value('Assets'),
+            value('NonCurrentAssets') + value('CurrentAssets'),
+            value('NetAssets') + value('Liabilities'),
+            value('NetAssets') + value('NonCurrentLiabilities') + value('CurrentLiabilities'),
+            value('Sales'),
+            value('OperatingProfits'),
+            value('NetIncome'),
+        )
+        return min(0, *heights), max(0, *heights)
+
+    def cache_variant(self) -> str:
+        """
+        y軸の範囲を指定した場合に、チャートキャッシュで区別するための文字列を返す関数
+        """
+        if self.ylim is None:
+            return ''
+        return f'y{self.ylim[0]:.0f}_{self.ylim[1]:.0f}'
+
     def check_missing_data(self) -> Dict[str, bool]:
             is_missing_data = {}
             for key, value in self.data.items():
@@ -260,6 +337,10 @@ class Barchart():
 
             # y軸のグリッドラインを追加
             ax.yaxis.grid(True, linestyle='--', color='gray', alpha=0.7)
+
+            # 複数社を比較する場合はy軸の範囲を揃える.
+            if self.ylim is not None:
+                ax.set_ylim(*self.ylim)
             
             if True:
                 plt.savefig(self.save_path)
@@ -396,6 +477,10 @@ class Barchart():
             # y軸のグリッドラインを追加
             ax.yaxis.grid(True, linestyle='--', color='gray', alpha=0.7)
 
+            # 複数社を比較する場合はy軸の範囲を揃える.
+            if self.ylim is not None:
+                ax.set_ylim(*self.ylim)
+
             if self.save_fig:
                 plt.savefig(self.save_path)
 
@@ -0,0 +1,64 @@
+import os
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from chart_cache import ChartCache, CHART_CACHE_DIR, render_chart
+
+JSON_DIR = 'json_file'
+
+
+def warmup_charts(json_file_paths: list[str], cache_dir: str = CHART_CACHE_DIR,
+                  max_workers: int | None = None) -> list[str]:
+    """
+    キャッシュに存在しないグラフをまとめて並列に描画する関数
+
+    新しく取り込まれたJSONファイルや内容が変わったJSONファイルのみが描画される。
+
+    Parameters
+    ----------
+    json_file_paths : list of str
+        描画するJSONファイルのパスのリスト。
+    cache_dir : str
+        キャッシュを保存するディレクトリのパス。
+    max_workers : int, optional
+        描画に使うプロセス数。省略した場合はCPU数。
+
+    Returns
+    -------
+    list of str
+        新しく描画したキャッシュ画像のパスのリスト。
+    """
+    cache = ChartCache(cache_dir)
+    targets = [path for path in json_file_paths if cache.get(path) is None]
+    if not targets:
+        print('Warmup: all charts are already cached.')
+        return []
+
+    print(f'Warmup: rendering {len(targets)} chart(s)...')
+    rendered = []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(render_chart, path, cache_dir): path for path in targets}
+        for future in as_completed(futures):
+            try:
+                rendered.append(future.result())
+            except Exception as e:
+                print(f'Warmup: failed to render {futures[future]} - {e}')
+    print(f'Warmup: {len(rendered)}/{len(targets)} chart(s) rendered.')
+    return rendered
+
+
+def main():
+    parser = argparse.ArgumentParser(description='グラフを事前に描画してキャッシュに保存します。')
+    parser.add_argument('json_files', nargs='*',
+                        help='描画するJSONファイル。省略した場合はjson_file/内の全てのファイル。')
+    parser.add_argument('--workers', type=int, default=None, help='描画に使うプロセス数')
+    parser.add_argument('--cache-dir', default=CHART_CACHE_DIR, help='キャッシュを保存するディレクトリ')
+    args = parser.parse_args()
+
+    json_file_paths = args.json_files
+    if not json_file_paths:
+        json_file_paths = [os.path.join(JSON_DIR, f) for f in os.listdir(JSON_DIR) if f.endswith('.json')]
+    warmup_charts(json_file_paths, args.cache_dir, args.workers)
+
+
+if __name__ == '__main__':
+    main()